@@ -0,0 +1,259 @@
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+from timeit import default_timer
+from benchmarks.fake_youtube import FakeYouTubeServer, make_client
+from src.scheduler import RequestScheduler, get_scheduler, set_scheduler
+from src.utils import (
+    chunk_video_ids,
+    get_playlist,
+    get_playlist_runtime,
+    iter_video_ids,
+)
+
+DEFAULT_SIZES = (50, 1_000, 10_000, 100_000)
+
+
+def make_fake_youtube(item_count, page_size, latency, error_rate, seed):
+    """
+    A function to make a fake YouTube api with one playlist, "playlist-id",
+    of item_count videos with 11 character ids like real ones
+
+    input:
+    The number of videos in the playlist - int
+    The most items the fake puts on a page - int
+    How long the fake waits before each reply in seconds - float
+    The fraction of requests the fake fails with a retryable 503 - float
+    The random seed for choosing which requests fail - int
+
+    output:
+    The fake api, not yet started, and the runtime of the playlist in
+    seconds - tuple of FakeYouTubeServer and int
+    """
+    video_ids = [f"{n:011d}" for n in range(item_count)]
+    seconds = [n % 3600 + 1 for n in range(item_count)]
+
+    durations = {
+        video_id: f"PT{duration // 60}M{duration % 60}S"
+        for video_id, duration in zip(video_ids, seconds)
+    }
+
+    fake = FakeYouTubeServer(
+        {"playlist-id": video_ids}, durations, page_size, latency, error_rate, seed
+    )
+
+    return fake, sum(seconds)
+
+
+def fetch_unmasked(youtube, playlist_id):
+    """
+    A function to request a playlist and its durations the way they were
+    requested before field masks, with the whole snippet of each item and
+    every field of each video's contentDetails, so the bytes can be compared.
+    The requests go through the scheduler, so injected errors are retried
+    as they are for the masked requests
+
+    input:
+    A build object for the YouTube api
+    A YouTube playlist id - string
+
+    output:
+    None
+    """
+    page_token = None
+    video_ids = []
+
+    while True:
+        params = {"part": "snippet", "playlistId": playlist_id, "maxResults": 50}
+
+        if page_token:
+            params["pageToken"] = page_token
+
+        page = get_scheduler(youtube).execute(
+            youtube.playlistItems().list(**params), "playlistItems.list"
+        )
+        video_ids.extend(iter_video_ids(page["items"]))
+        page_token = page.get("nextPageToken")
+
+        if not page_token:
+            break
+
+    for chunk in chunk_video_ids(video_ids):
+        get_scheduler(youtube).execute(
+            youtube.videos().list(part="contentDetails", id=chunk), "videos.list"
+        )
+
+
+def benchmark_size(item_count, args):
+    """
+    A function to time get_playlist then get_playlist_runtime end to end for
+    a playlist of item_count videos
+
+    input:
+    The number of videos in the playlist - int
+    The parsed arguments - argparse.Namespace
+
+    output:
+    The timings and request counts of the runs - dict
+    """
+    fake, expected_runtime = make_fake_youtube(
+        item_count, args.page_size, args.latency, args.error_rate, args.seed
+    )
+
+    run_seconds = []
+
+    with fake:
+        youtube = make_client(fake)
+
+        for _ in range(args.repeat):
+            fake.requests.clear()
+            fake.bytes_sent = 0
+
+            start = default_timer()
+
+            playlist = get_playlist("playlist-id", youtube)
+            runtime = get_playlist_runtime(playlist, youtube)
+
+            run_seconds.append(default_timer() - start)
+
+            if runtime != expected_runtime:
+                raise Exception(
+                    f"Wrong runtime for {item_count} items: {runtime} != "
+                    f"{expected_runtime}"
+                )
+
+        bytes_received = fake.bytes_sent
+        requests = len(fake.requests)
+
+        fake.bytes_sent = 0
+
+        fetch_unmasked(youtube, "playlist-id")
+
+        unmasked_bytes_received = fake.bytes_sent
+
+    median_seconds = statistics.median(run_seconds)
+
+    return {
+        "items": item_count,
+        "runs": args.repeat,
+        "seconds": {
+            "min": min(run_seconds),
+            "median": median_seconds,
+            "max": max(run_seconds),
+        },
+        "items_per_second": item_count / median_seconds,
+        "requests": requests,
+        "requests_per_second": requests / median_seconds,
+        "bytes_received": bytes_received,
+        "unmasked_bytes_received": unmasked_bytes_received,
+    }
+
+
+def get_commit():
+    """
+    A function to get the commit being benchmarked
+
+    input:
+    None
+
+    output:
+    The short hash of HEAD, or None outside a git checkout - string
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(report, baseline):
+    """
+    A function to print how the median times of a report compare with an
+    earlier one, e.g. from another commit
+
+    input:
+    The new report - dict
+    The earlier report - dict
+
+    output:
+    writes a line per playlist size to stderr
+    """
+    baseline_results = {result["items"]: result for result in baseline["results"]}
+
+    for result in report["results"]:
+        before = baseline_results.get(result["items"])
+
+        if before is None:
+            continue
+
+        ratio = result["seconds"]["median"] / before["seconds"]["median"]
+        bytes_ratio = result["bytes_received"] / before["bytes_received"]
+
+        print(
+            f"{result['items']:>8} items  {before['seconds']['median']:8.3f}s -> "
+            f"{result['seconds']['median']:8.3f}s  ({ratio:.2f}x)  "
+            f"{before['bytes_received']:>10} -> {result['bytes_received']:>10} "
+            f"bytes  ({bytes_ratio:.2f}x)",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark get_playlist and get_playlist_runtime against a "
+        "local fake YouTube api"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0, help="seconds per reply")
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="fraction of replies that 503"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here, not stdout")
+    parser.add_argument("--compare", help="an earlier JSON report to compare with")
+    args = parser.parse_args()
+
+    set_scheduler(
+        RequestScheduler(
+            daily_quota=10**9, rate_limit=10**6, base_delay=0.01, max_delay=0.1
+        )
+    )
+
+    report = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "page_size": args.page_size,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "results": [benchmark_size(size, args) for size in args.sizes],
+    }
+
+    content = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(content + "\n")
+
+    else:
+        print(content)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            print_comparison(report, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
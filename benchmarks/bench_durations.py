@@ -0,0 +1,102 @@
+import re
+import random
+import argparse
+from timeit import default_timer
+from src.utils import convert_times, parse_durations
+
+
+def convert_times_baseline(times):
+    """
+    The convert_times implementation this benchmark compares against, which
+    builds the pattern inside the loop and re.match's every element
+    """
+    converted_list = []
+
+    for time in times:
+        pattern = r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?"
+        hours, minutes, seconds = re.match(pattern, time).groups()
+
+        hours = int(hours) if hours else 0
+        minutes = int(minutes) if minutes else 0
+        seconds = int(seconds) if seconds else 0
+
+        converted_list.append(hours * 3600 + minutes * 60 + seconds)
+
+    return converted_list
+
+
+def make_durations(count, seed=0):
+    """
+    A function to make a list of realistic YouTube formatted durations, mostly
+    under an hour with the occasional multi-hour video
+
+    input:
+    The number of durations to make - int
+    The random seed - int
+
+    output:
+    YouTube formatted durations - list of strings
+    """
+    rng = random.Random(seed)
+    durations = []
+
+    for _ in range(count):
+        hours = rng.choice((0, 0, 0, 0, 1, 2))
+        minutes = rng.randint(0, 59)
+        seconds = rng.randint(0, 59)
+
+        durations.append(
+            "PT"
+            + (f"{hours}H" if hours else "")
+            + (f"{minutes}M" if minutes else "")
+            + (f"{seconds}S" if seconds else "")
+        )
+
+    return durations
+
+
+def time_function(function, times, repeat):
+    """
+    A function to get the best wall-clock time of several runs of a parser
+
+    input:
+    The parser to time - function
+    The durations to parse - list of strings
+    How many runs to take the best of - int
+
+    output:
+    The fastest run in seconds - float
+    """
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = default_timer()
+        function(times)
+        best = min(best, default_timer() - start)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the duration parsers")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    times = make_durations(args.count)
+
+    assert convert_times(times) == convert_times_baseline(times)
+
+    for name, function in (
+        ("baseline convert_times", convert_times_baseline),
+        ("parse_durations", parse_durations),
+        ("convert_times", convert_times),
+    ):
+        seconds = time_function(function, times, args.repeat)
+        throughput = args.count / seconds / 1e6
+
+        print(f"{name:<24} {seconds:8.3f}s  {throughput:6.2f}M durations/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import sys
+import argparse
+import statistics
+import subprocess
+from timeit import default_timer
+
+STARTUP_COMMANDS = {
+    "import src.main": [sys.executable, "-c", "import src.main"],
+    "src.main --help": [sys.executable, "-m", "src.main", "--help"],
+    "import + build client": [
+        sys.executable,
+        "-c",
+        "from src.utils import get_youtube_client; get_youtube_client('key')",
+    ],
+}
+
+
+def time_command(command, repeat):
+    """
+    A function to get the wall-clock times of running a command in a fresh
+    process several times
+
+    input:
+    The command to run - list of strings
+    How many times to run it - int
+
+    output:
+    The time of each run in milliseconds - list of floats
+    """
+    times = []
+
+    for _ in range(repeat):
+        start = default_timer()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append((default_timer() - start) * 1000)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start time")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_command([sys.executable, "-c", "pass"], 5))
+
+    print(f"{'bare interpreter':<24} {baseline:8.1f}ms")
+
+    for name, command in STARTUP_COMMANDS.items():
+        times = time_command(command, args.repeat)
+
+        print(
+            f"{name:<24} {statistics.median(times):8.1f}ms median  "
+            f"{min(times):8.1f}ms best"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+import gzip
+import json
+import time
+import random
+import threading
+from http import HTTPStatus
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def split_fields(fields):
+    """
+    Splits a fields mask on the commas that aren't inside brackets
+    """
+    terms = []
+    depth = 0
+    term = ""
+
+    for character in fields:
+        if character == "," and not depth:
+            terms.append(term)
+            term = ""
+            continue
+
+        depth += {"(": 1, ")": -1}.get(character, 0)
+        term += character
+
+    return terms + [term] if term else terms
+
+
+def parse_fields(fields):
+    """
+    Parses a fields mask, such as "etag,pageInfo/totalResults,items(id)",
+    into a tree of the fields to keep, where None keeps everything below
+    """
+    tree = {}
+
+    for term in split_fields(fields):
+        path, _, sub_fields = term.partition("(")
+        keys = path.split("/")
+        node = tree
+
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+
+        node[keys[-1]] = parse_fields(sub_fields[:-1]) if sub_fields else None
+
+    return tree
+
+
+def apply_fields(body, tree):
+    """
+    Keeps only the fields of a response body that are in a parsed mask
+    """
+    if tree is None:
+        return body
+
+    if isinstance(body, list):
+        return [apply_fields(item, tree) for item in body]
+
+    return {key: apply_fields(body[key], tree[key]) for key in tree if key in body}
+
+
+def make_thumbnails(video_id):
+    """
+    Builds the thumbnails YouTube gives a video in a snippet
+    """
+    return {
+        name: {
+            "url": f"https://i.ytimg.com/vi/{video_id}/{name}default.jpg",
+            "width": width,
+            "height": height,
+        }
+        for name, width, height in (
+            ("", 120, 90),
+            ("medium", 320, 180),
+            ("high", 480, 360),
+            ("standard", 640, 480),
+            ("maxres", 1280, 720),
+        )
+    }
+
+
+def make_snippet(video_id):
+    """
+    Builds a snippet the size of a real one for a video
+    """
+    return {
+        "publishedAt": "2024-01-01T00:00:00Z",
+        "channelId": "UCaaaaaaaaaaaaaaaaaaaaaa",
+        "title": f"Video {video_id}",
+        "description": f"The description of video {video_id}. " * 8,
+        "thumbnails": make_thumbnails(video_id),
+        "channelTitle": "A YouTube Channel",
+    }
+
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler):
+    """
+    Serves the playlistItems and videos endpoints of the YouTube api from the
+    playlists and durations of the FakeYouTubeServer it belongs to, on their
+    own or in batch requests. Items have the parts asked for, filled out to
+    the size of real ones, and fields masks are applied
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.server.fake.latency:
+            time.sleep(self.server.fake.latency)
+
+        status, body = self.respond(self.path, self.headers)
+
+        self.send_json(status, body, self.headers.get("Accept-Encoding", ""))
+
+    def do_POST(self):
+        """
+        Serves a batch request, answering each request in it as do_GET would
+        """
+        fake = self.server.fake
+        content = self.rfile.read(int(self.headers["Content-Length"]))
+        message = BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + content
+        )
+        parts = message.get_payload()
+
+        with fake.lock:
+            fake.requests.append(("batch", {"requests": len(parts)}))
+
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        boundary = "fake_batch_boundary"
+        reply = ""
+
+        for part in parts:
+            request_line, _, headers = part.get_payload().partition("\n")
+            status, body = self.respond(
+                request_line.split(" ")[1], BytesParser().parsebytes(headers.encode())
+            )
+            content_id = part["Content-ID"][1:-1]
+
+            reply += (
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(body) if body is not None else ''}\r\n"
+            )
+
+        content = f"{reply}--{boundary}--\r\n".encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+        with fake.lock:
+            fake.bytes_sent += len(content)
+
+    def respond(self, path, headers):
+        fake = self.server.fake
+        url = urlparse(path)
+        params = {key: ",".join(values) for key, values in parse_qs(url.query).items()}
+        resource = url.path.rsplit("/", 1)[-1]
+
+        with fake.lock:
+            fake.requests.append((resource, params))
+            fake.connections.add(self.client_address)
+            inject_error = fake.error_rate and fake.random.random() < fake.error_rate
+
+        if inject_error:
+            status, body = 503, {
+                "error": {
+                    "code": 503,
+                    "message": "Backend Error",
+                    "errors": [{"reason": "backendError"}],
+                }
+            }
+
+        elif resource == "playlistItems":
+            status, body = fake.playlist_items(params)
+
+        elif resource == "videos":
+            status, body = fake.videos(params)
+
+        else:
+            status, body = 404, {"error": {"code": 404, "message": "Not Found"}}
+
+        if status == 200 and body["etag"] == headers.get("If-None-Match"):
+            status, body = 304, None
+
+        if status == 200 and "fields" in params:
+            body = apply_fields(body, parse_fields(params["fields"]))
+
+        return status, body
+
+    def send_json(self, status, body, accept_encoding=""):
+        content = json.dumps(body).encode() if body is not None else b""
+        compress = self.server.fake.gzip and "gzip" in accept_encoding
+
+        if compress:
+            content = gzip.compress(content)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+        with self.server.fake.lock:
+            self.server.fake.bytes_sent += len(content)
+
+
+class FakeYouTubeServer:
+    """
+    A local stand-in for the YouTube api, used as a context manager. It runs
+    on a random port in a background thread, and url is the base url to give
+    the clients in place of the real api. Every request is recorded in
+    requests, each client connection in connections, and the size of every
+    reply body in bytes_sent. A batch request is recorded as ("batch",
+    {"requests": n}) followed by each request in it.
+
+    Each reply can be delayed by latency seconds, and error_rate of them
+    (chosen with the given seed) are failed with a retryable 503. With gzip,
+    replies to requests that accept it are gzipped, and bytes_sent counts the
+    gzipped bytes
+    """
+
+    def __init__(
+        self,
+        playlists,
+        durations,
+        page_size=50,
+        latency=0,
+        error_rate=0,
+        seed=0,
+        gzip=False,
+    ):
+        self.playlists = playlists
+        self.gzip = gzip
+        self.durations = durations
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = []
+        self.connections = set()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), FakeYouTubeHandler)
+        self._server.fake = self
+        self._server.daemon_threads = True
+
+        host, port = self._server.server_address
+        self.url = f"http://{host}:{port}/youtube/v3"
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def playlist_items(self, params):
+        video_ids = self.playlists.get(params.get("playlistId"))
+
+        if video_ids is None:
+            return 404, {"error": {"code": 404, "message": "playlistNotFound"}}
+
+        page_size = min(int(params.get("maxResults", 5)), self.page_size)
+        start = int(params.get("pageToken", 0))
+        end = start + page_size
+
+        parts = params.get("part", "snippet").split(",")
+
+        page = {
+            "kind": "youtube#playlistItemListResponse",
+            "etag": f"{params['playlistId']}-{start}-{hash(tuple(video_ids))}-{parts}",
+            "pageInfo": {"totalResults": len(video_ids), "resultsPerPage": page_size},
+            "items": [
+                self.playlist_item(params["playlistId"], position, video_id, parts)
+                for position, video_id in enumerate(video_ids[start:end], start)
+            ],
+        }
+
+        if end < len(video_ids):
+            page["nextPageToken"] = str(end)
+
+        return 200, page
+
+    def playlist_item(self, playlist_id, position, video_id, parts):
+        item = {
+            "kind": "youtube#playlistItem",
+            "etag": f"{playlist_id}-{position}",
+            "id": f"{playlist_id}-{video_id}",
+        }
+
+        if "snippet" in parts:
+            item["snippet"] = {
+                **make_snippet(video_id),
+                "playlistId": playlist_id,
+                "position": position,
+                "resourceId": {"kind": "youtube#video", "videoId": video_id},
+                "videoOwnerChannelTitle": "A YouTube Channel",
+                "videoOwnerChannelId": "UCaaaaaaaaaaaaaaaaaaaaaa",
+            }
+
+        if "contentDetails" in parts:
+            item["contentDetails"] = {
+                "videoId": video_id,
+                "videoPublishedAt": "2024-01-01T00:00:00Z",
+            }
+
+        return item
+
+    def video(self, video_id, duration, parts):
+        item = {"kind": "youtube#video", "etag": video_id, "id": video_id}
+
+        if "snippet" in parts:
+            item["snippet"] = make_snippet(video_id)
+
+        if "contentDetails" in parts:
+            item["contentDetails"] = {
+                "duration": duration,
+                "dimension": "2d",
+                "definition": "hd",
+                "caption": "false",
+                "licensedContent": True,
+                "contentRating": {},
+                "projection": "rectangular",
+            }
+
+        return item
+
+    def videos(self, params):
+        video_ids = params.get("id", "").split(",")
+        parts = params.get("part", "contentDetails").split(",")
+
+        if len(video_ids) > 50:
+            return 400, {"error": {"code": 400, "message": "tooManyIds"}}
+
+        return 200, {
+            "kind": "youtube#videoListResponse",
+            "etag": ",".join(video_ids),
+            "items": [
+                self.video(video_id, duration, parts)
+                for video_id, duration in zip(
+                    video_ids, map(self.durations.get, video_ids)
+                )
+                if duration is not None
+            ],
+        }
+
+
+def make_fake_server(video_count=120, playlist_id="playlist-id", **options):
+    """
+    Builds a fake YouTube api with a single playlist of video_count videos,
+    where video "v<n>" lasts n seconds. The options are passed on to
+    FakeYouTubeServer
+    """
+    video_ids = [f"v{n}" for n in range(video_count)]
+
+    return FakeYouTubeServer(
+        {playlist_id: video_ids},
+        {video_id: f"PT{video_id[1:]}S" for video_id in video_ids},
+        **options,
+    )
+
+
+def make_client(fake):
+    """
+    Builds a googleapiclient client that talks to a fake YouTube api
+    """
+    from googleapiclient.discovery import build
+
+    return build(
+        "youtube",
+        "v3",
+        developerKey="test_key",
+        static_discovery=True,
+        cache_discovery=False,
+        client_options={"api_endpoint": fake.url.replace("youtube/v3", "")},
+    )
+
+
+def make_fake_youtube(video_count=120, **options):
+    """
+    Builds a fake YouTube api as make_fake_server does, and a client that
+    talks to it
+    """
+    fake = make_fake_server(video_count, **options)
+
+    return fake, make_client(fake)
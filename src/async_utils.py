@@ -0,0 +1,304 @@
+import json
+import asyncio
+import aiohttp
+from src.metrics import get_metrics
+from src.scheduler import QUOTA_COSTS, get_error_reason, get_scheduler
+from src.utils import (
+    VIDEO_FIELDS,
+    check_playlist_budget,
+    chunk_video_ids,
+    convert_times,
+    get_playlist_id,
+    get_max_concurrency,
+    get_playlist_page_params,
+    iter_video_ids,
+)
+
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
+
+
+class AsyncYouTubeClient:
+    """
+    An async client for the two YouTube api endpoints the analyser uses. All
+    requests share one pooled session, so connections are kept alive and
+    reused, and at most max_connections requests are in flight at once.
+    It's used as an async context manager so the pool is closed afterwards
+    """
+
+    def __init__(self, api_key, base_url=YOUTUBE_API_URL, max_connections=None):
+        if max_connections is None:
+            max_connections = get_max_concurrency()
+
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def get(self, resource, headers=None, **params):
+        """
+        A method to make a GET request to a YouTube api resource through the
+        shared scheduler
+
+        input:
+        The name of the resource, e.g. "videos" - string
+        Extra request headers - dict
+        The query parameters of the request - keyword arguments
+
+        output:
+        if the api replies with an error - An aiohttp.ClientResponseError is
+        raised, with the reason YouTube gives as its message
+
+        if the connection fails - A ConnectionError is raised
+
+        otherwise - The status code and the decoded response, which is None
+        for a 304 Not Modified - tuple
+        """
+        params = {key: str(value) for key, value in params.items()}
+        params["key"] = self.api_key
+
+        async def send():
+            try:
+                async with self._session.get(
+                    f"{self.base_url}/{resource}", params=params, headers=headers
+                ) as response:
+                    if response.status == 304:
+                        return response.status, None
+
+                    if response.status >= 400:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info,
+                            response.history,
+                            status=response.status,
+                            message=get_error_reason(await response.read()),
+                        )
+
+                    content = await response.read()
+
+                    get_metrics().add(
+                        "api_response_bytes_total",
+                        len(content),
+                        method=f"{resource}.list",
+                    )
+
+                    return response.status, json.loads(content)
+
+            except aiohttp.ClientConnectionError as error:
+                raise ConnectionError(str(error)) from error
+
+        return await get_scheduler().execute_async(send, f"{resource}.list")
+
+
+async def get_playlist_page_async(
+    playlist_id, client, page_token=None, page_cache=None
+):
+    """
+    The async version of get_playlist_page, which requests a single page of
+    items from a given playlist, revalidating it with a stored etag if a page
+    cache is given
+
+    input:
+    A YouTube playlist id - string
+    An AsyncYouTubeClient
+    The token of the page to get, None for the first page - string
+    A store of previously fetched pages - PageCache
+
+    output:
+    A single page of the playlist response - dict
+    """
+    params = get_playlist_page_params(playlist_id, page_token)
+
+    stored_page = None
+    headers = None
+
+    if page_cache is not None:
+        stored_page = page_cache.get_page(playlist_id, page_token, params["fields"])
+
+    if stored_page is not None:
+        headers = {"If-None-Match": stored_page["etag"]}
+
+    status, page = await client.get("playlistItems", headers=headers, **params)
+
+    if status == 304 and stored_page is not None:
+        page_cache.touch_page(playlist_id, page_token, params["fields"])
+        return stored_page
+
+    if page_cache is not None:
+        page_cache.put_page(playlist_id, page_token, page, params["fields"])
+
+    return page
+
+
+async def get_playlist_pages_async(playlist_id, client, page_cache=None):
+    """
+    The async version of get_playlist_pages. It follows nextPageToken through
+    every page of a playlist, requesting the next page as soon as the current
+    one arrives
+
+    input:
+    A YouTube playlist id - string
+    An AsyncYouTubeClient
+    A store of previously fetched pages - PageCache
+
+    output:
+    If theres an error retrieving a page, or not enough quota is left to get
+    the rest of the pages - an error will be raised
+    Yields each page of the playlist response in order - dict
+    """
+    task = asyncio.create_task(
+        get_playlist_page_async(playlist_id, client, None, page_cache)
+    )
+    is_first_page = True
+
+    while task is not None:
+        try:
+            page = await task
+
+        except (aiohttp.ClientError, ConnectionError):
+            raise Exception("Error getting playlist")
+
+        if is_first_page:
+            check_playlist_budget(page)
+            is_first_page = False
+
+        next_page_token = page.get("nextPageToken")
+
+        if next_page_token:
+            task = asyncio.create_task(
+                get_playlist_page_async(
+                    playlist_id, client, next_page_token, page_cache
+                )
+            )
+
+        else:
+            task = None
+
+        yield page
+
+
+async def get_chunk_durations_async(video_ids, client):
+    """
+    The async version of get_chunk_durations, which gets the durations of a
+    single chunk of videos
+
+    input:
+    Up to 50 video ids - list of strings
+    An AsyncYouTubeClient
+
+    output:
+    If theres an error retrieving the videos - an error will be raised
+    The YouTube formatted duration of each video found - dict of strings
+    """
+    try:
+        _, response = await client.get(
+            "videos", part="contentDetails", fields=VIDEO_FIELDS, id=",".join(video_ids)
+        )
+
+    except (aiohttp.ClientError, ConnectionError):
+        raise Exception("Error getting videos")
+
+    return {
+        item["id"]: item["contentDetails"]["duration"] for item in response["items"]
+    }
+
+
+async def get_video_durations_async(video_ids, client, cache=None):
+    """
+    The async version of get_video_durations. The ids the cache doesn't have
+    are requested in chunks of 50, all at once, with the client's connection
+    pool limiting how many are in flight
+
+    input:
+    Video ids - iterable of strings
+    An AsyncYouTubeClient
+    A cache of durations to check first - DurationCache
+
+    output:
+    The YouTube formatted duration of each video found - dict of strings
+    """
+    video_ids = list(video_ids)
+
+    durations = cache.get_many(video_ids) if cache is not None else {}
+
+    missing_ids = [
+        video_id for video_id in dict.fromkeys(video_ids) if video_id not in durations
+    ]
+
+    chunks = list(chunk_video_ids(missing_ids))
+
+    get_scheduler().check_budget(len(chunks) * QUOTA_COSTS["videos.list"])
+
+    fetched = {}
+
+    for chunk_durations in await asyncio.gather(
+        *(get_chunk_durations_async(chunk, client) for chunk in chunks)
+    ):
+        fetched.update(chunk_durations)
+
+    if cache is not None and fetched:
+        cache.put_many(fetched)
+
+    durations.update(fetched)
+
+    return durations
+
+
+async def get_playlist_and_runtime_async(
+    playlist_url, client, videos_watched=0, cache=None, page_cache=None
+):
+    """
+    A function to get a playlist and the runtime of the videos left after
+    videos_watched in one go. The durations of each page are looked up as
+    soon as the page arrives, so page fetches and video lookups overlap
+
+    input:
+    A YouTube playlist url - string
+    An AsyncYouTubeClient
+    The amount of videos watched - int
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+
+    output:
+    If theres an error retrieving the playlist - an error will be raised
+    The playlist, as returned by get_playlist, and the runtime of the videos
+    left in seconds - tuple
+    """
+    playlist_id = get_playlist_id(playlist_url)
+
+    playlist = None
+    lookups = []
+
+    async for page in get_playlist_pages_async(playlist_id, client, page_cache):
+        if playlist is None:
+            playlist = {**page, "items": []}
+            playlist.pop("nextPageToken", None)
+
+        items = page.get("items", [])
+        playlist["items"].extend(items)
+
+        lookups.append(
+            asyncio.create_task(
+                get_video_durations_async(iter_video_ids(items), client, cache)
+            )
+        )
+
+    durations = {}
+
+    for page_durations in await asyncio.gather(*lookups):
+        durations.update(page_durations)
+
+    remaining_times = [
+        durations[video_id]
+        for video_id in iter_video_ids(playlist["items"][videos_watched:])
+        if video_id in durations
+    ]
+
+    return playlist, sum(convert_times(remaining_times))
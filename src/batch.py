@@ -0,0 +1,413 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.stats import DurationStats
+from src.scheduler import is_key_error
+from src.snapshot import get_snapshot_path, write_snapshot
+from src.utils import (
+    PlaylistStats,
+    get_channel_id,
+    iter_channel_playlist_ids,
+    get_max_concurrency,
+    get_playlist_id,
+    get_video_duration_map,
+    load_playlist,
+    parse_durations,
+)
+
+
+def read_playlist_urls(lines):
+    """
+    A generator to read playlist urls from a file or stdin, one per line.
+    Blank lines and lines starting with # are skipped
+
+    input:
+    Lines of text - iterable of strings, e.g. an open file
+
+    output:
+    Yields each playlist url - string
+    """
+    for line in lines:
+        line = line.strip()
+
+        if line and not line.startswith("#"):
+            yield line
+
+
+def analyse_playlists(
+    playlist_urls,
+    youtube,
+    cache=None,
+    page_cache=None,
+    max_concurrency=None,
+    videos_watched=0,
+    snapshot_dir=None,
+):
+    """
+    A function to get the stats of many playlists at once. The playlists are
+    fetched in parallel, then the union of their video ids is resolved, so
+    every distinct video is only looked up once however many playlists it's
+    in. If snapshot_dir is given, every video is looked up, watched or not,
+    and each playlist is saved there as a snapshot
+
+    input:
+    YouTube playlist urls or ids - iterable of strings
+    A build object for the YouTube api
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    The most requests to send at once, defaults to get_max_concurrency - int
+    The amount of videos watched in each playlist - int
+    The directory to save snapshots of the playlists in - string
+
+    output:
+    The stats of each distinct playlist, in the order given. Playlists that
+    couldn't be analysed have the error that stopped them - list of
+    PlaylistStats
+    """
+    results, _, _ = _analyse_playlists(
+        playlist_urls,
+        youtube,
+        cache,
+        page_cache,
+        max_concurrency,
+        videos_watched,
+        snapshot_dir,
+    )
+
+    return list(results.values())
+
+
+def _analyse_playlists(
+    playlist_urls,
+    youtube,
+    cache,
+    page_cache,
+    max_concurrency,
+    videos_watched,
+    snapshot_dir,
+):
+    """
+    The work of analyse_playlists, which also gives back the playlists loaded
+    and the durations looked up, for callers that want totals across them
+
+    output:
+    The stats of each distinct playlist keyed by id, the playlists that were
+    loaded, and the duration in seconds of each video found keyed by id. If
+    the durations can't be looked up, every loaded playlist has the error
+    and none are given back - tuple of dict, list of Playlists and dict
+    """
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
+
+    results = {}
+
+    for playlist_url in playlist_urls:
+        try:
+            playlist_id = get_playlist_id(playlist_url)
+
+        except Exception as error:
+            results[playlist_url] = PlaylistStats(playlist_url, error=str(error))
+            continue
+
+        results.setdefault(playlist_id, PlaylistStats(playlist_id))
+
+    playlist_ids = [
+        playlist_id for playlist_id, stats in results.items() if stats.error is None
+    ]
+
+    def fetch(playlist_id):
+        try:
+            return load_playlist(playlist_id, youtube, page_cache)
+
+        except Exception as error:
+            results[playlist_id].error = str(error)
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        playlists = [
+            playlist
+            for playlist in executor.map(fetch, playlist_ids)
+            if playlist is not None
+        ]
+
+    first_video = 0 if snapshot_dir is not None else videos_watched
+
+    unique_video_ids = dict.fromkeys(
+        video_id
+        for playlist in playlists
+        for video_id in playlist[first_video:].iter_video_ids()
+    )
+
+    try:
+        durations = get_video_duration_map(
+            unique_video_ids, youtube, max_concurrency, cache
+        )
+
+    except Exception as error:
+        for playlist in playlists:
+            results[playlist.playlist_id].error = str(error)
+
+        return results, [], {}
+
+    seconds = dict(zip(durations, parse_durations(durations.values())))
+
+    for playlist in playlists:
+        playlist[first_video:].set_durations(seconds)
+
+        if snapshot_dir is not None:
+            write_snapshot(
+                get_snapshot_path(snapshot_dir, playlist.playlist_id), playlist
+            )
+
+        remaining = playlist[videos_watched:]
+
+        stats = results[playlist.playlist_id]
+        stats.video_count = len(playlist)
+        stats.videos_watched = videos_watched
+        stats.videos_left = len(remaining)
+        stats.runtime = remaining.runtime
+        stats.durations = DurationStats.from_playlist(remaining)
+
+    return results, playlists, seconds
+
+
+def analyse_channel(
+    channel,
+    youtube,
+    cache=None,
+    page_cache=None,
+    max_concurrency=None,
+    videos_watched=0,
+):
+    """
+    A function to get the stats of every playlist a channel owns. The
+    channel's playlists are listed, then fetched in parallel, and the
+    distinct videos across all of them are only looked up once. The channel
+    total is of the distinct videos left after the ones watched in each
+    playlist, so a video in several playlists is only counted once. The
+    stats of playlists that share no videos with the ones before them are
+    merged into the total rather than added again video by video
+
+    input:
+    A YouTube channel url, id or handle - string
+    A build object for the YouTube api
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    The most requests to send at once, defaults to get_max_concurrency - int
+    The amount of videos watched in each playlist - int
+
+    output:
+    If the channel or its playlists can't be listed - an error will be raised
+    The stats of each of the channel's playlists, and of the channel as a
+    whole with its id as the playlist id - tuple of list of PlaylistStats and
+    PlaylistStats
+    """
+    channel_id = get_channel_id(channel, youtube)
+
+    playlist_ids = list(iter_channel_playlist_ids(channel_id, youtube))
+
+    results, playlists, seconds = _analyse_playlists(
+        playlist_ids,
+        youtube,
+        cache,
+        page_cache,
+        max_concurrency,
+        videos_watched,
+        None,
+    )
+
+    video_ids = set()
+    durations = DurationStats()
+
+    for playlist in playlists:
+        playlist_video_ids = list(playlist[videos_watched:].iter_video_ids())
+        new_video_ids = set(playlist_video_ids) - video_ids
+
+        if len(new_video_ids) == len(playlist_video_ids):
+            durations.merge(results[playlist.playlist_id].durations)
+
+        else:
+            durations.update(
+                seconds[video_id]
+                for video_id in dict.fromkeys(playlist_video_ids)
+                if video_id in new_video_ids and seconds.get(video_id)
+            )
+
+        video_ids.update(new_video_ids)
+
+    channel_stats = PlaylistStats(
+        channel_id,
+        video_count=len(video_ids),
+        videos_left=len(video_ids),
+        runtime=durations.total,
+        durations=durations,
+    )
+
+    return list(results.values()), channel_stats
+
+
+def analyse_shard_in_process(api_key, playlist_ids, videos_watched, snapshot_dir):
+    """
+    A function to analyse one key's share of the playlists in a worker
+    process, with the process's own client, scheduler and connections to the
+    caches
+
+    input:
+    The api key to use - string
+    YouTube playlist ids - list of strings
+    The amount of videos watched in each playlist - int
+    The directory to save snapshots of the playlists in - string
+
+    output:
+    The stats of each playlist, in the order given, and whether the key can
+    still be used - tuple of list of PlaylistStats and bool
+    """
+    from src.keys import KeyPool
+    from src.cache import DurationCache, PageCache
+
+    key_pool = KeyPool([api_key])
+    cache = DurationCache()
+    page_cache = PageCache()
+
+    try:
+        results = analyse_playlists(
+            playlist_ids,
+            key_pool.get_client(api_key),
+            cache,
+            page_cache,
+            videos_watched=videos_watched,
+            snapshot_dir=snapshot_dir,
+        )
+
+        return results, key_pool.get_scheduler(api_key).available
+
+    finally:
+        cache.close()
+        page_cache.close()
+        key_pool.close()
+
+
+def analyse_playlists_sharded(
+    playlist_urls,
+    key_pool,
+    cache=None,
+    page_cache=None,
+    videos_watched=0,
+    processes=None,
+    snapshot_dir=None,
+):
+    """
+    A function to get the stats of many playlists, sharing them out between
+    the keys of a pool so each key only uses its own quota. Each key's share
+    is analysed at the same time as the others, in threads or, if processes
+    is given, in up to that many worker processes, one per key at most.
+    Playlists that fail because a key's quota ran out or the key was rejected,
+    whether fetching their pages or looking up their durations, are tried
+    again with the keys they haven't been tried with, until they succeed or
+    no keys are left
+
+    input:
+    YouTube playlist urls or ids - iterable of strings
+    The api keys to use - KeyPool
+    A cache of durations to check first, used by threads - DurationCache
+    A store of previously fetched pages, used by threads - PageCache
+    The amount of videos watched in each playlist - int
+    The most worker processes to use, or None for threads - int
+    The directory to save snapshots of the playlists in - string
+
+    output:
+    The stats of each distinct playlist, in the order given. Playlists that
+    couldn't be analysed have the error that stopped them - list of
+    PlaylistStats
+    """
+    results = {}
+
+    for playlist_url in playlist_urls:
+        try:
+            playlist_id = get_playlist_id(playlist_url)
+
+        except Exception as error:
+            results[playlist_url] = PlaylistStats(playlist_url, error=str(error))
+            continue
+
+        results.setdefault(playlist_id, PlaylistStats(playlist_id))
+
+    tried_keys = {playlist_id: set() for playlist_id in results}
+
+    pending = [
+        playlist_id for playlist_id, stats in results.items() if stats.error is None
+    ]
+
+    def analyse_shard(api_key, playlist_ids):
+        shard_results = analyse_playlists(
+            playlist_ids,
+            key_pool.get_client(api_key),
+            cache,
+            page_cache,
+            videos_watched=videos_watched,
+            snapshot_dir=snapshot_dir,
+        )
+
+        return shard_results, key_pool.get_scheduler(api_key).available
+
+    if processes:
+        executor = ProcessPoolExecutor(
+            max_workers=min(processes, len(key_pool.api_keys)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    else:
+        executor = ThreadPoolExecutor(max_workers=len(key_pool.api_keys))
+
+    with executor:
+        while pending:
+            api_keys = key_pool.available_keys()
+            shards = {}
+
+            for index, playlist_id in enumerate(pending):
+                untried_keys = [
+                    api_key
+                    for api_key in api_keys
+                    if api_key not in tried_keys[playlist_id]
+                ]
+
+                if untried_keys:
+                    api_key = untried_keys[index % len(untried_keys)]
+                    shards.setdefault(api_key, []).append(playlist_id)
+                    tried_keys[playlist_id].add(api_key)
+
+            if not shards:
+                break
+
+            if processes:
+                futures = {
+                    api_key: executor.submit(
+                        analyse_shard_in_process,
+                        api_key,
+                        playlist_ids,
+                        videos_watched,
+                        snapshot_dir,
+                    )
+                    for api_key, playlist_ids in shards.items()
+                }
+
+            else:
+                futures = {
+                    api_key: executor.submit(analyse_shard, api_key, playlist_ids)
+                    for api_key, playlist_ids in shards.items()
+                }
+
+            pending = []
+
+            for api_key, future in futures.items():
+                shard_results, available = future.result()
+
+                if not available:
+                    key_pool.mark_unavailable(api_key)
+
+                for stats in shard_results:
+                    results[stats.playlist_id] = stats
+
+                    if stats.error is not None and is_key_error(stats.error):
+                        pending.append(stats.playlist_id)
+
+    return list(results.values())
@@ -0,0 +1,458 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from src.utils import PLAYLIST_ITEM_FIELDS, chunk_video_ids
+from src.settings import get_setting
+from src.metrics import get_metrics
+
+DEFAULT_CACHE_TTL = 30 * 24 * 60 * 60
+
+DEFAULT_CACHE_MAX_ENTRIES = 100_000
+
+SQLITE_MAX_VARIABLES = 900
+
+
+def get_cache_dir():
+    """
+    A function to get the directory the local caches are kept in, from
+    CACHE_DIR in the .env file if it's set
+
+    input:
+    None
+
+    output:
+    The path of the cache directory, which is created if it doesn't exist
+    - string
+    """
+    cache_dir = os.environ.get("CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "youtube-playlist-analyser"
+    )
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    return cache_dir
+
+
+class SQLiteCache:
+    """
+    The shared connection handling for the caches kept in the local SQLite
+    database. Subclasses create their tables in _create_tables
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_cache_dir(), "cache.sqlite3")
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+        self._connection.commit()
+
+    def _create_tables(self):
+        raise NotImplementedError
+
+    def close(self):
+        """
+        A method to close the connection to the cache database
+
+        input:
+        None
+
+        output:
+        None
+        """
+        with self._lock:
+            self._connection.close()
+
+
+class ExpiringCache(SQLiteCache):
+    """
+    The expiry and eviction shared by the caches of api responses. Entries
+    older than ttl seconds are treated as missing, and once there are more
+    than max_entries the least recently used ones are evicted. A max_entries
+    of 0 means the cache has no limit
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        if ttl is None:
+            ttl = get_setting("CACHE_TTL", DEFAULT_CACHE_TTL, minimum=0)
+
+        if max_entries is None:
+            max_entries = get_setting(
+                "CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES, minimum=0
+            )
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        super().__init__(path)
+
+    def _evict(self, table):
+        if self.max_entries:
+            self._connection.execute(
+                f"""
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} ORDER BY used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+class DurationCache(ExpiringCache):
+    """
+    A local SQLite cache of video durations keyed by video id, which expires
+    and evicts entries as ExpiringCache does
+    """
+
+    def _create_tables(self):
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS durations (
+                video_id TEXT PRIMARY KEY,
+                duration TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS durations_used_at ON durations (used_at)"
+        )
+
+    def get_many(self, video_ids, ttl=None):
+        """
+        A method to look up the cached durations of the given videos, marking
+        each one found as recently used
+
+        input:
+        Video ids - iterable of strings
+        How old a duration can be in seconds, defaults to the cache's ttl
+        - float
+
+        output:
+        The YouTube formatted duration of each video that's cached and
+        hasn't expired - dict of strings
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        video_ids = list(dict.fromkeys(video_ids))
+        now = time.time()
+        durations = {}
+
+        with self._lock:
+            for chunk in chunk_video_ids(video_ids, SQLITE_MAX_VARIABLES):
+                placeholders = ",".join("?" * len(chunk))
+
+                rows = self._connection.execute(
+                    f"SELECT video_id, duration FROM durations "
+                    f"WHERE video_id IN ({placeholders}) AND fetched_at >= ?",
+                    [*chunk, now - ttl],
+                ).fetchall()
+
+                durations.update(rows)
+
+            self._connection.executemany(
+                "UPDATE durations SET used_at = ? WHERE video_id = ?",
+                [(now, video_id) for video_id in durations],
+            )
+            self._connection.commit()
+
+        get_metrics().record_cache(
+            "durations", len(durations), len(video_ids) - len(durations)
+        )
+
+        return durations
+
+    def put_many(self, durations):
+        """
+        A method to store the durations of videos, evicting the least recently
+        used entries if the cache grows past max_entries, unless it's 0
+
+        input:
+        The YouTube formatted duration of each video - dict of strings
+
+        output:
+        None
+        """
+        now = time.time()
+
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?)",
+                [
+                    (video_id, duration, now, now)
+                    for video_id, duration in durations.items()
+                ],
+            )
+            self._evict("durations")
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM durations"
+            ).fetchone()[0]
+
+
+class PageCache(ExpiringCache):
+    """
+    A local SQLite store of the last response seen for each playlist page,
+    along with its etag, so pages can be requested conditionally and served
+    locally when YouTube replies that they haven't changed. Pages are keyed
+    by the field mask they were requested with as well, so responses with
+    different fields don't replace each other, and they're expired and
+    evicted as ExpiringCache does
+    """
+
+    def _create_tables(self):
+        columns = [
+            row[1]
+            for row in self._connection.execute("PRAGMA table_info(playlist_pages)")
+        ]
+
+        if columns and "fields" not in columns:
+            self._connection.execute("DROP TABLE playlist_pages")
+
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS playlist_pages (
+                playlist_id TEXT NOT NULL,
+                page_token TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                page TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (playlist_id, page_token, fields)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS playlist_pages_used_at "
+            "ON playlist_pages (used_at)"
+        )
+
+    def get_page(self, playlist_id, page_token=None, fields=PLAYLIST_ITEM_FIELDS):
+        """
+        A method to get the stored response for a playlist page
+
+        input:
+        A YouTube playlist id - string
+        The token of the page, None for the first page - string
+        The field mask the page was requested with, "" for every field
+        - string
+
+        output:
+        if the page isn't stored or has expired - None
+
+        otherwise - The stored page response, which includes its etag - dict
+        """
+        stored = self.get_stored_page(playlist_id, page_token, fields)
+
+        get_metrics().record_cache(
+            "pages", int(stored is not None), int(stored is None)
+        )
+
+        return stored[0] if stored else None
+
+    def get_stored_page(
+        self, playlist_id, page_token=None, fields=PLAYLIST_ITEM_FIELDS, ttl=None
+    ):
+        """
+        A method to get the stored response for a playlist page along with
+        when YouTube last confirmed it, marking it as recently used
+
+        input:
+        A YouTube playlist id - string
+        The token of the page, None for the first page - string
+        The field mask the page was requested with, "" for every field
+        - string
+        How old the page can be in seconds, defaults to the cache's ttl
+        - float
+
+        output:
+        if the page isn't stored or is older than ttl - None
+
+        otherwise - The stored page response and the time it was fetched or
+        last revalidated - tuple of dict and float
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        key = (playlist_id, page_token or "", fields)
+        now = time.time()
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page, fetched_at FROM playlist_pages "
+                "WHERE playlist_id = ? AND page_token = ? AND fields = ? "
+                "AND fetched_at >= ?",
+                (*key, now - ttl),
+            ).fetchone()
+
+            if row:
+                self._connection.execute(
+                    "UPDATE playlist_pages SET used_at = ? "
+                    "WHERE playlist_id = ? AND page_token = ? AND fields = ?",
+                    (now, *key),
+                )
+                self._connection.commit()
+
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def touch_page(self, playlist_id, page_token=None, fields=PLAYLIST_ITEM_FIELDS):
+        """
+        A method to record that YouTube says a stored page hasn't changed, so
+        it counts as just fetched
+
+        input:
+        A YouTube playlist id - string
+        The token of the page, None for the first page - string
+        The field mask the page was requested with, "" for every field
+        - string
+
+        output:
+        None
+        """
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute(
+                "UPDATE playlist_pages SET fetched_at = ?, used_at = ? "
+                "WHERE playlist_id = ? AND page_token = ? AND fields = ?",
+                (now, now, playlist_id, page_token or "", fields),
+            )
+            self._connection.commit()
+
+    def put_page(self, playlist_id, page_token, page, fields=PLAYLIST_ITEM_FIELDS):
+        """
+        A method to store the response for a playlist page, evicting the
+        least recently used pages if the store grows past max_entries. Pages
+        without an etag can't be revalidated so they aren't stored
+
+        input:
+        A YouTube playlist id - string
+        The token of the page, None for the first page - string
+        The page response - dict
+        The field mask the page was requested with, "" for every field
+        - string
+
+        output:
+        None
+        """
+        if not page.get("etag"):
+            return
+
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO playlist_pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    playlist_id,
+                    page_token or "",
+                    fields,
+                    page["etag"],
+                    json.dumps(page),
+                    now,
+                    now,
+                ),
+            )
+            self._evict("playlist_pages")
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM playlist_pages"
+            ).fetchone()[0]
+
+
+class QuotaUsage(SQLiteCache):
+    """
+    A local SQLite record of how many YouTube api quota units have been used
+    on each quota day, so separate runs on the same day share one budget.
+    Units are written out in batches of flush_every, and on close. Stores
+    given different scopes, e.g. one per api key, keep separate counts in the
+    same database
+    """
+
+    def __init__(self, path=None, flush_every=25, scope=None):
+        self.flush_every = flush_every
+        self.scope = scope
+        self._pending = {}
+
+        super().__init__(path)
+
+    def _create_tables(self):
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quota_usage (
+                day TEXT PRIMARY KEY,
+                units INTEGER NOT NULL
+            )
+            """
+        )
+
+    def get_used(self, day):
+        """
+        A method to get the quota units used on a given day
+
+        input:
+        The quota day - string
+
+        output:
+        The units used - int
+        """
+        day = self._get_day_key(day)
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT units FROM quota_usage WHERE day = ?", (day,)
+            ).fetchone()
+
+            return (row[0] if row else 0) + self._pending.get(day, 0)
+
+    def add_used(self, day, units):
+        """
+        A method to record quota units used on a given day
+
+        input:
+        The quota day - string
+        The units used - int
+
+        output:
+        None
+        """
+        day = self._get_day_key(day)
+
+        with self._lock:
+            self._pending[day] = self._pending.get(day, 0) + units
+
+            if sum(self._pending.values()) >= self.flush_every:
+                self._flush()
+
+    def _get_day_key(self, day):
+        return day if self.scope is None else f"{day}/{self.scope}"
+
+    def _flush(self):
+        self._connection.executemany(
+            """
+            INSERT INTO quota_usage VALUES (?, ?)
+            ON CONFLICT (day) DO UPDATE SET units = units + excluded.units
+            """,
+            self._pending.items(),
+        )
+        self._connection.commit()
+        self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+
+        super().close()
@@ -0,0 +1,251 @@
+import csv
+import sys
+import json
+import datetime
+from src.metrics import get_metrics
+from src.stats import DURATION_BUCKETS
+from src.utils import get_average_video_runtime
+
+OUTPUT_FORMATS = ("text", "jsonl", "csv")
+
+HISTOGRAM_FIELDS = (
+    *(f"videos_up_to_{bound}_seconds" for bound in DURATION_BUCKETS),
+    f"videos_over_{DURATION_BUCKETS[-1]}_seconds",
+)
+
+RECORD_FIELDS = (
+    "playlist_id",
+    "video_count",
+    "videos_watched",
+    "videos_left",
+    "runtime_seconds",
+    "average_runtime_seconds",
+    "runtime",
+    "average_runtime",
+    "min_runtime_seconds",
+    "median_runtime_seconds",
+    "p90_runtime_seconds",
+    "p99_runtime_seconds",
+    "max_runtime_seconds",
+    *HISTOGRAM_FIELDS,
+    "age_seconds",
+    "error",
+)
+
+
+def format_runtime(seconds):
+    """
+    A function to format a number of seconds as hours, minutes and seconds
+
+    input:
+    A time in seconds - int
+
+    output:
+    The time as h:mm:ss - string
+    """
+    return str(datetime.timedelta(seconds=seconds))
+
+
+def format_distribution(durations):
+    """
+    A function to format the spread of the durations of a playlist's videos
+    for people to read
+
+    input:
+    The stats of the durations - DurationStats
+
+    output:
+    The median, 90th and 99th percentiles, shortest and longest, then how
+    many videos are in each length bucket that isn't empty, one per line, or
+    nothing if there are no durations - list of strings
+    """
+    if durations is None or not durations.count:
+        return []
+
+    def format_seconds(seconds):
+        return format_runtime(round(seconds))
+
+    lines = [
+        f"Median video runtime:  {format_seconds(durations.median)}",
+        f"90% of videos are under:  {format_seconds(durations.quantile(0.9))}",
+        f"99% of videos are under:  {format_seconds(durations.quantile(0.99))}",
+        f"Shortest video:  {format_seconds(durations.min)}",
+        f"Longest video:  {format_seconds(durations.max)}",
+    ]
+
+    for bound, count in durations.histogram():
+        if not count:
+            continue
+
+        if bound is None:
+            lines.append(
+                f"Videos over {format_seconds(DURATION_BUCKETS[-1])}:  {count}"
+            )
+
+        else:
+            lines.append(f"Videos up to {format_seconds(bound)}:  {count}")
+
+    return lines
+
+
+def format_text(stats):
+    """
+    A function to format the stats of a playlist for people to read
+
+    input:
+    The stats of a playlist - PlaylistStats
+
+    output:
+    The stats, one per line - string
+    """
+    lines = []
+
+    if stats.playlist_id is not None:
+        lines.append(f"Playlist:  {stats.playlist_id}")
+
+    if stats.error is not None:
+        lines.append(f"Error:  {stats.error}")
+
+    elif not stats.videos_watched:
+        video_count = (
+            stats.durations.count if stats.durations is not None else stats.video_count
+        )
+
+        average_video_runtime = (
+            get_average_video_runtime(stats.runtime, video_count)
+            if video_count
+            else format_runtime(0)
+        )
+
+        lines.append("No videos watched")
+        lines.append(f"Total playlist runtime:  {format_runtime(stats.runtime)}")
+        lines.append(f"Average video runtime:  {average_video_runtime}")
+        lines.extend(format_distribution(stats.durations))
+        lines.append(f"Playlist length:  {stats.video_count}")
+
+    else:
+        videos_left = (
+            stats.durations.count if stats.durations is not None else stats.videos_left
+        )
+
+        average_video_runtime = (
+            get_average_video_runtime(stats.runtime, videos_left)
+            if videos_left
+            else format_runtime(0)
+        )
+
+        lines.append(f"Playlist time left:  {format_runtime(stats.runtime)}")
+        lines.append(f"Average runtime of videos left:  {average_video_runtime}")
+        lines.extend(format_distribution(stats.durations))
+        lines.append(f"Videos left:  {stats.videos_left}")
+
+    if stats.error is None and stats.age is not None:
+        lines.append(f"Stored data age:  {format_runtime(round(stats.age))}")
+
+    return "\n".join(lines)
+
+
+def get_distribution_fields(durations):
+    """
+    A function to get the record fields for the spread of the durations of a
+    playlist's videos
+
+    input:
+    The stats of the durations, or None if they weren't looked up
+    - DurationStats
+
+    output:
+    The shortest, median, 90th and 99th percentile and longest durations in
+    seconds, and how many videos are in each bucket of HISTOGRAM_FIELDS, each
+    None if unknown - dict
+    """
+    if durations is None or not durations.count:
+        return {
+            "min_runtime_seconds": None,
+            "median_runtime_seconds": None,
+            "p90_runtime_seconds": None,
+            "p99_runtime_seconds": None,
+            "max_runtime_seconds": None,
+            **dict.fromkeys(HISTOGRAM_FIELDS),
+        }
+
+    return {
+        "min_runtime_seconds": durations.min,
+        "median_runtime_seconds": round(durations.median, 3),
+        "p90_runtime_seconds": round(durations.quantile(0.9), 3),
+        "p99_runtime_seconds": round(durations.quantile(0.99), 3),
+        "max_runtime_seconds": durations.max,
+        **{
+            field: count
+            for field, (_, count) in zip(HISTOGRAM_FIELDS, durations.histogram())
+        },
+    }
+
+
+def to_record(stats):
+    """
+    A function to turn the stats of a playlist into a flat record for
+    machine readable output
+
+    input:
+    The stats of a playlist - PlaylistStats
+
+    output:
+    The fields of RECORD_FIELDS - dict
+    """
+    if stats.error is not None:
+        return {"playlist_id": stats.playlist_id, "error": stats.error}
+
+    return {
+        "playlist_id": stats.playlist_id,
+        "video_count": stats.video_count,
+        "videos_watched": stats.videos_watched,
+        "videos_left": stats.videos_left,
+        "runtime_seconds": stats.runtime,
+        "average_runtime_seconds": round(stats.average_runtime, 3),
+        "runtime": format_runtime(stats.runtime),
+        "average_runtime": format_runtime(round(stats.average_runtime)),
+        **get_distribution_fields(stats.durations),
+        "age_seconds": round(stats.age, 3) if stats.age is not None else None,
+        "error": None,
+    }
+
+
+def write_results(results, output_format="text", stream=None):
+    """
+    A function to write the stats of playlists as they're produced, flushing
+    after each one so other processes can read them straight away
+
+    input:
+    The stats of each playlist - iterable of PlaylistStats
+    One of OUTPUT_FORMATS: text, jsonl (one JSON object per line) or csv
+    - string
+    Where to write them, defaults to stdout - file
+
+    output:
+    writes each playlist's stats to the stream
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise Exception(f"Unknown output format: {output_format}")
+
+    if stream is None:
+        stream = sys.stdout
+
+    if output_format == "csv":
+        writer = csv.DictWriter(stream, RECORD_FIELDS, lineterminator="\n")
+        writer.writeheader()
+
+    metrics = get_metrics()
+
+    for stats in results:
+        with metrics.time_step("format_results"):
+            if output_format == "text":
+                stream.write(format_text(stats) + "\n\n")
+
+            elif output_format == "jsonl":
+                stream.write(json.dumps(to_record(stats)) + "\n")
+
+            else:
+                writer.writerow(to_record(stats))
+
+            stream.flush()
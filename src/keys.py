@@ -0,0 +1,115 @@
+import hashlib
+import threading
+from src.cache import QuotaUsage
+from src.scheduler import RequestScheduler, set_scheduler
+from src.utils import get_youtube_client
+
+
+def get_key_label(api_key):
+    """
+    A function to get a short label for an api key that's safe to store and
+    log, as the key itself is a secret
+
+    input:
+    The api key - string
+
+    output:
+    The first 12 hex digits of the key's SHA-256 hash - string
+    """
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+
+class KeyPool:
+    """
+    A pool of api keys, each with its own scheduler and so its own daily
+    quota, rate limit and record of quota used, so the work of one run can
+    be spread across many keys. Keys whose quota runs out or that YouTube
+    rejects stop being available, and the work left can move to the others
+    """
+
+    def __init__(self, api_keys, quota_usage_path=None):
+        if not api_keys:
+            raise Exception("No api keys given")
+
+        self.api_keys = list(dict.fromkeys(api_keys))
+
+        self._lock = threading.Lock()
+        self._unavailable = set()
+        self._quota_usages = {}
+        self._schedulers = {}
+
+        for api_key in self.api_keys:
+            quota_usage = QuotaUsage(quota_usage_path, scope=get_key_label(api_key))
+
+            self._quota_usages[api_key] = quota_usage
+            self._schedulers[api_key] = RequestScheduler(quota_usage=quota_usage)
+
+    def get_scheduler(self, api_key):
+        return self._schedulers[api_key]
+
+    def get_client(self, api_key):
+        """
+        A method to get a YouTube client whose requests go through the
+        scheduler of one of the keys
+
+        input:
+        One of the api keys - string
+
+        output:
+        A build object for the YouTube api
+        """
+        youtube = get_youtube_client(api_key)
+
+        set_scheduler(self._schedulers[api_key], youtube)
+
+        return youtube
+
+    def mark_unavailable(self, api_key):
+        """
+        A method to stop using a key, e.g. when a worker process found its
+        quota had run out
+
+        input:
+        One of the api keys - string
+
+        output:
+        None
+        """
+        with self._lock:
+            self._unavailable.add(api_key)
+
+    def available_keys(self):
+        """
+        A method to get the keys that can still be used, with the most quota
+        left first
+
+        input:
+        None
+
+        output:
+        The available api keys - list of strings
+        """
+        with self._lock:
+            unavailable = set(self._unavailable)
+
+        return sorted(
+            (
+                api_key
+                for api_key in self.api_keys
+                if api_key not in unavailable and self._schedulers[api_key].available
+            ),
+            key=lambda api_key: -self._schedulers[api_key].remaining_units,
+        )
+
+    def close(self):
+        """
+        A method to write out the quota used by every key
+
+        input:
+        None
+
+        output:
+        None
+        """
+        for quota_usage in self._quota_usages.values():
+            quota_usage.close()
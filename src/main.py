@@ -1,31 +1,701 @@
-from googleapiclient.discovery import build
-from src.utils import get_api_key, get_playlist, no_videos_watched, has_watched_videos
+import os
+import sys
+import argparse
+from src.utils import (
+    get_api_key,
+    get_api_keys,
+    get_playlist_id,
+    get_playlist_stats,
+    get_youtube_client,
+    load_playlist,
+    no_videos_watched,
+    has_watched_videos,
+    PlaylistStats,
+)
+from src.cache import DurationCache, PageCache, QuotaUsage
+from src.scheduler import RequestScheduler, set_scheduler
+from src.batch import (
+    read_playlist_urls,
+    analyse_channel,
+    analyse_playlists,
+    analyse_playlists_sharded,
+)
+from src.formatters import OUTPUT_FORMATS, write_results
+from src.snapshot import (
+    analyse_snapshots,
+    get_snapshot_path,
+    iter_snapshot_paths,
+    write_snapshot,
+)
+from src.metrics import get_metrics, write_metrics
+from src.offline import (
+    NOT_STORED_MESSAGE,
+    Revalidator,
+    get_stale_answer,
+    get_stale_stats,
+    get_stored_stats,
+)
 
 
-def main():
+def parse_args(argv=None):
     """
-    The main function that will be called when the program is ran. It calls the
-    util functions in the correct order to give the user information about a
-    given playlist
+    A function to parse the command line arguments of the analyser
+
+    input:
+    The arguments to parse, defaults to sys.argv - list of strings
+
+    output:
+    The parsed arguments - argparse.Namespace
     """
-    API_KEY = get_api_key()
+    parser = argparse.ArgumentParser(
+        description="Get information about a YouTube playlist"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="fetch pages and video durations concurrently with asyncio",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="analyse every playlist url in FILE, one per line, or - for stdin",
+    )
+    parser.add_argument(
+        "--playlist",
+        metavar="URL_OR_ID",
+        action="append",
+        help="analyse this playlist without prompting, can be given many times",
+    )
+    parser.add_argument(
+        "--channel",
+        metavar="URL_ID_OR_HANDLE",
+        action="append",
+        help="analyse every playlist of this channel and the channel as a "
+        "whole, can be given many times",
+    )
+    parser.add_argument(
+        "--watched",
+        type=int,
+        default=0,
+        help="the amount of videos watched in each playlist, 0 by default",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        metavar="N",
+        help="with --batch, analyse each api key's share of the playlists in "
+        "worker processes rather than threads, using at most N processes and "
+        "one per key",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        metavar="DIR",
+        help="save a snapshot of each playlist analysed with --playlist or "
+        "--batch in DIR",
+    )
+    parser.add_argument(
+        "--from-snapshots",
+        metavar="DIR",
+        help="analyse the playlist snapshots saved in DIR, without the api",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="answer from the playlists and durations stored by earlier runs, "
+        "without the api or an api key",
+    )
+    parser.add_argument(
+        "--stale",
+        action="store_true",
+        help="answer from stored playlists straight away, refreshing ones older "
+        "than STALE_AFTER seconds in the background, and only wait for the api "
+        "for playlists that aren't stored",
+    )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="text",
+        help="how to write results for --playlist, --batch and --channel, text by "
+        "default",
+    )
+    parser.add_argument(
+        "--metrics",
+        choices=("prometheus", "json"),
+        help="print request, quota, cache and timing metrics to stderr at exit",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="profile the run, writing PATH.pstats for cProfile, PATH.collapsed "
+        "for flame graphs and the time spent in each phase to stderr",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="serve playlist stats over HTTP at /playlists/{id}/stats?watched=N",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="the address to serve on with --serve, 127.0.0.1 by default",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="the port to serve on with --serve, 8080 by default",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.watched < 0:
+        parser.error("--watched must be a whole number")
+
+    if args.offline and args.stale:
+        parser.error("--offline and --stale can't be used together")
+
+    if args.use_async and args.snapshot_dir:
+        parser.error("--snapshot-dir can't be used with --async")
+
+    for mode in ("offline", "stale"):
+        if getattr(args, mode) and (args.serve or args.channel):
+            parser.error(f"--{mode} can't be used with --serve or --channel")
+
+    return args
+
+
+async def analyse_playlist_async(
+    api_key, playlist_url, videos_watched, cache, page_cache
+):
+    """
+    A function to get a playlist and the runtime of the videos left using the
+    async client
+
+    input:
+    The api key - string
+    A YouTube playlist url - string
+    The amount of videos watched - int
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+
+    output:
+    The playlist and the runtime of the videos left in seconds - tuple
+    """
+    from src.async_utils import AsyncYouTubeClient, get_playlist_and_runtime_async
+
+    async with AsyncYouTubeClient(api_key) as client:
+        return await get_playlist_and_runtime_async(
+            playlist_url, client, videos_watched, cache, page_cache
+        )
+
+
+def iter_playlist_stats(playlists, api_key, args, cache, page_cache, revalidator=None):
+    """
+    A generator to analyse playlists one at a time, so each result can be
+    written as soon as it's ready. With --offline they're answered from
+    stored data only, and with --stale from stored data when there is some
+
+    input:
+    YouTube playlist urls or ids - iterable of strings
+    The api key, None with --offline - string
+    The parsed arguments - argparse.Namespace
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    What refreshes stale playlists in the background with --stale
+    - Revalidator
+
+    output:
+    Yields the stats of each playlist, or the error that stopped it being
+    analysed - PlaylistStats
+    """
+    for playlist in playlists:
+        try:
+            playlist_id = get_playlist_id(playlist)
+
+        except Exception as error:
+            yield PlaylistStats(playlist, error=str(error))
+            continue
+
+        with get_metrics().measure_playlist(playlist_id):
+            if args.offline:
+                stats = get_stored_stats(
+                    playlist_id, cache, page_cache, args.watched
+                ) or PlaylistStats(playlist_id, error=NOT_STORED_MESSAGE)
+
+            elif revalidator is not None:
+                stats = get_stale_stats(
+                    playlist_id,
+                    cache,
+                    page_cache,
+                    args.watched,
+                    lambda: analyse_playlist(
+                        playlist_id, api_key, args, cache, page_cache
+                    ),
+                    revalidator,
+                )
+
+            else:
+                stats = analyse_playlist(playlist_id, api_key, args, cache, page_cache)
+
+        yield stats
+
+
+def analyse_playlist(playlist_id, api_key, args, cache, page_cache):
+    """
+    A function to get the stats of a single playlist with the sync or async
+    client, as chosen by the arguments
+
+    input:
+    A YouTube playlist id - string
+    The api key - string
+    The parsed arguments - argparse.Namespace
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+
+    output:
+    The stats of the playlist, or the error that stopped it being analysed
+    - PlaylistStats
+    """
+    try:
+        if args.use_async:
+            import asyncio
+
+            youtube = None
+
+            playlist_data, playlist_runtime = asyncio.run(
+                analyse_playlist_async(
+                    api_key, playlist_id, args.watched, cache, page_cache
+                )
+            )
+
+        else:
+            youtube = get_youtube_client(api_key)
+
+            playlist_data = load_playlist(playlist_id, youtube, page_cache)
+
+            playlist_runtime = None
+
+        stats = get_playlist_stats(
+            playlist_data,
+            youtube,
+            args.watched,
+            cache,
+            playlist_runtime,
+            playlist_id,
+        )
+
+        if args.snapshot_dir:
+            write_snapshot(
+                get_snapshot_path(args.snapshot_dir, playlist_id), playlist_data
+            )
+
+        return stats
+
+    except Exception as error:
+        return PlaylistStats(playlist_id, error=str(error))
+
+
+def iter_channel_stats(channels, youtube, cache, page_cache, args):
+    """
+    A generator to analyse channels one at a time: the stats of each of a
+    channel's playlists, then of the channel as a whole
+
+    input:
+    YouTube channel urls, ids or handles - iterable of strings
+    A build object for the YouTube api
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    The parsed arguments - argparse.Namespace
+
+    output:
+    Yields the stats of each playlist and channel, or the error that stopped
+    a channel being analysed - PlaylistStats
+    """
+    for channel in channels:
+        try:
+            results, channel_stats = analyse_channel(
+                channel, youtube, cache, page_cache, videos_watched=args.watched
+            )
+
+        except Exception as error:
+            yield PlaylistStats(channel, error=str(error))
+            continue
+
+        yield from results
+        yield channel_stats
+
+
+def read_batch_file(batch_file):
+    """
+    A function to read the playlist urls listed in a file, or stdin if the
+    file is -
+
+    input:
+    The path of the file of playlist urls - string
+
+    output:
+    The playlist urls - list of strings
+    """
+    if batch_file == "-":
+        return list(read_playlist_urls(sys.stdin))
+
+    with open(batch_file) as lines:
+        return list(read_playlist_urls(lines))
+
+
+def run_batch(
+    batch_file, youtube, cache, page_cache, args, key_pool=None, revalidator=None
+):
+    """
+    A function to analyse every playlist listed in a file, or stdin if the
+    file is -, and write the results. With --stale, stored playlists are
+    answered from the stored data and only the others are analysed
+
+    input:
+    The path of the file of playlist urls - string
+    A build object for the YouTube api
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    The parsed arguments - argparse.Namespace
+    The api keys to share the playlists between instead of using the one
+    client - KeyPool
+    What refreshes stale playlists in the background with --stale
+    - Revalidator
+
+    output:
+    writes information about each playlist to stdout
+    """
+    all_playlist_urls = read_batch_file(batch_file)
+    playlist_ids = {}
+    stored = {}
+
+    for playlist_url in all_playlist_urls:
+        try:
+            playlist_ids[playlist_url] = get_playlist_id(playlist_url)
+
+        except Exception:
+            playlist_ids[playlist_url] = playlist_url
+
+    if revalidator is not None:
+        for playlist_id in dict.fromkeys(playlist_ids.values()):
+            stats = get_stale_answer(
+                playlist_id, cache, page_cache, args.watched, revalidator
+            )
+
+            if stats is not None:
+                stored[playlist_id] = stats
+
+    playlist_urls = [
+        playlist_url
+        for playlist_url in all_playlist_urls
+        if playlist_ids[playlist_url] not in stored
+    ]
+
+    if not playlist_urls:
+        results = []
+
+    elif key_pool is not None:
+        results = analyse_playlists_sharded(
+            playlist_urls,
+            key_pool,
+            cache,
+            page_cache,
+            videos_watched=args.watched,
+            processes=args.processes,
+            snapshot_dir=args.snapshot_dir,
+        )
+
+    else:
+        results = analyse_playlists(
+            playlist_urls,
+            youtube,
+            cache,
+            page_cache,
+            videos_watched=args.watched,
+            snapshot_dir=args.snapshot_dir,
+        )
+
+    if stored:
+        analysed = {stats.playlist_id: stats for stats in results}
+
+        results = [
+            stored.get(playlist_id) or analysed[playlist_id]
+            for playlist_id in dict.fromkeys(playlist_ids.values())
+        ]
+
+    write_results(results, args.output_format)
+
 
-    youtube = build("youtube", "v3", developerKey=API_KEY)
+def run_server(youtube, cache, page_cache, args):
+    """
+    A function to serve playlist stats over HTTP until interrupted, keeping
+    the client, its connections and the caches warm between requests
+
+    input:
+    A build object for the YouTube api
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    The parsed arguments - argparse.Namespace
+
+    output:
+    None
+    """
+    from src.server import PlaylistService, make_server
+
+    server = make_server(
+        PlaylistService(youtube, cache, page_cache), args.host, args.port
+    )
+
+    host, port = server.server_address
+
+    print(f"Serving playlist stats on http://{host}:{port}", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        server.server_close()
 
+
+def run_interactive(api_key, args, cache, page_cache, revalidator=None):
+    """
+    A function to ask the user for a playlist and the amount of videos
+    they've watched, then print information about it
+
+    input:
+    The api key, None with --offline - string
+    The parsed arguments - argparse.Namespace
+    A cache of durations to check first - DurationCache
+    A store of previously fetched pages - PageCache
+    What refreshes stale playlists in the background with --stale
+    - Revalidator
+
+    output:
+    prints to the screen information about the playlist
+    """
     playlist_url = input("Enter playlist URL: ")
 
     videos_watched = int(input("Enter amount of videos watched: "))
 
-    playlist = get_playlist(playlist_url, youtube)
+    if args.offline or revalidator is not None:
+        write_results(
+            iter_playlist_stats(
+                [playlist_url],
+                api_key,
+                argparse.Namespace(**{**vars(args), "watched": videos_watched}),
+                cache,
+                page_cache,
+                revalidator,
+            ),
+            "text",
+        )
+        return
 
-    playlist_length = playlist["pageInfo"]["totalResults"]
+    if args.use_async:
+        import asyncio
+
+        youtube = None
+
+        playlist, playlist_runtime = asyncio.run(
+            analyse_playlist_async(
+                api_key, playlist_url, videos_watched, cache, page_cache
+            )
+        )
+
+        playlist_length = playlist["pageInfo"]["totalResults"]
+
+    else:
+        youtube = get_youtube_client(api_key)
+
+        playlist = load_playlist(playlist_url, youtube, page_cache)
+
+        playlist_runtime = None
+
+        playlist_length = playlist.total_results
 
     if not videos_watched:
-        no_videos_watched(playlist, playlist_length, youtube)
+        no_videos_watched(playlist, playlist_length, youtube, cache, playlist_runtime)
 
     else:
         playlist_length = playlist_length - videos_watched
-        has_watched_videos(playlist, playlist_length, youtube, videos_watched)
+        has_watched_videos(
+            playlist, playlist_length, youtube, videos_watched, cache, playlist_runtime
+        )
+
+
+def main(argv=None):
+    """
+    The main function that will be called when the program is ran. It calls the
+    util functions in the correct order to give the user information about a
+    given playlist, or about every playlist given with --playlist or --batch
+    or owned by a channel given with --channel, or serves them over HTTP
+    with --serve. With --from-snapshots, saved
+    playlists are analysed without the api, with --offline and --stale they're
+    answered from the data stored by earlier runs, and with --profile the run
+    is profiled
+    """
+    args = parse_args(argv)
+
+    if args.profile:
+        from src.profiling import profile_run
+
+        with profile_run(args.profile):
+            run(args)
+
+    else:
+        run(args)
+
+
+def run_offline(args):
+    """
+    A function to answer the playlists asked for with --playlist, --batch or
+    interactively from the data stored by earlier runs, without the api or
+    an api key
+
+    input:
+    The parsed arguments - argparse.Namespace
+
+    output:
+    writes information about each playlist to stdout
+    """
+    cache = DurationCache()
+
+    page_cache = PageCache()
+
+    try:
+        if args.batch or args.playlist:
+            playlists = read_batch_file(args.batch) if args.batch else args.playlist
+
+            write_results(
+                iter_playlist_stats(playlists, None, args, cache, page_cache),
+                args.output_format,
+            )
+
+        else:
+            run_interactive(None, args, cache, page_cache)
+
+    finally:
+        cache.close()
+
+        page_cache.close()
+
+        if args.metrics:
+            write_metrics(args.metrics)
+
+
+def run(args):
+    """
+    A function to do what the command line arguments ask for
+
+    input:
+    The parsed arguments - argparse.Namespace
+
+    output:
+    None
+    """
+    if args.from_snapshots:
+        write_results(
+            analyse_snapshots(iter_snapshot_paths(args.from_snapshots), args.watched),
+            args.output_format,
+        )
+        return
+
+    if args.offline:
+        run_offline(args)
+        return
+
+    if args.snapshot_dir:
+        os.makedirs(args.snapshot_dir, exist_ok=True)
+
+    API_KEY = get_api_key()
+
+    cache = DurationCache()
+
+    page_cache = PageCache()
+
+    quota_usage = QuotaUsage()
+
+    set_scheduler(RequestScheduler(quota_usage=quota_usage))
+
+    revalidator = None
+
+    try:
+        if args.stale:
+            revalidator = Revalidator(get_youtube_client(API_KEY), cache, page_cache)
+
+        if args.serve:
+            run_server(get_youtube_client(API_KEY), cache, page_cache, args)
+
+        elif args.batch:
+            api_keys = get_api_keys()
+
+            if len(api_keys) > 1 or args.processes:
+                from src.keys import KeyPool
+
+                key_pool = KeyPool(api_keys)
+
+                try:
+                    run_batch(
+                        args.batch,
+                        None,
+                        cache,
+                        page_cache,
+                        args,
+                        key_pool,
+                        revalidator,
+                    )
+
+                finally:
+                    key_pool.close()
+
+            else:
+                youtube = get_youtube_client(API_KEY)
+
+                run_batch(
+                    args.batch,
+                    youtube,
+                    cache,
+                    page_cache,
+                    args,
+                    revalidator=revalidator,
+                )
+
+        elif args.channel:
+            write_results(
+                iter_channel_stats(
+                    args.channel, get_youtube_client(API_KEY), cache, page_cache, args
+                ),
+                args.output_format,
+            )
+
+        elif args.playlist:
+            write_results(
+                iter_playlist_stats(
+                    args.playlist, API_KEY, args, cache, page_cache, revalidator
+                ),
+                args.output_format,
+            )
+
+        else:
+            run_interactive(API_KEY, args, cache, page_cache, revalidator)
+
+    finally:
+        if revalidator is not None:
+            revalidator.close()
+
+        cache.close()
+
+        page_cache.close()
+
+        quota_usage.close()
+
+        if args.metrics:
+            write_metrics(args.metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,390 @@
+import sys
+import json
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+METRIC_PREFIX = "playlist_analyser"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRIC_HELP = {
+    "api_request_seconds": ("histogram", "Time taken by each api request attempt"),
+    "api_requests_total": ("counter", "Api request attempts by outcome"),
+    "api_response_bytes_total": ("counter", "Decoded bytes of api reply bodies"),
+    "api_wire_bytes_total": (
+        "counter",
+        "Bytes of api reply bodies as received, before decompression",
+    ),
+    "api_retries_total": ("counter", "Api requests retried after failing"),
+    "quota_units_total": ("counter", "YouTube api quota units used"),
+    "cache_lookups_total": ("counter", "Cache lookups by cache and result"),
+    "stale_answers_total": (
+        "counter",
+        "Playlists answered from stored data by whether it was fresh or stale, "
+        "or missing so the api was used",
+    ),
+    "stale_refreshes_total": (
+        "counter",
+        "Background refreshes of stale playlists by result",
+    ),
+    "singleflight_calls_total": (
+        "counter",
+        "Fetches that ran, or were collapsed into an identical one in flight",
+    ),
+    "step_seconds": ("histogram", "Time taken by each step of an analysis"),
+    "playlist_quota_units_total": ("counter", "Quota units used per playlist"),
+    "playlist_seconds": ("histogram", "Time taken to analyse each playlist"),
+}
+
+
+class Histogram:
+    """
+    Counts of observed values in fixed buckets, like a Prometheus histogram,
+    along with their count, sum and largest value. Quantiles are estimated as
+    the upper bound of the bucket they fall in
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        A method to estimate a quantile of the observed values
+
+        input:
+        The quantile, from 0 to 1 - float
+
+        output:
+        The upper bound of the bucket the quantile falls in, or the largest
+        value if it's past the last bucket - float
+        """
+        rank = q * self.count
+        seen = 0
+
+        for bucket, count in zip(self.buckets, self.counts):
+            seen += count
+
+            if count and seen >= rank:
+                return min(bucket, self.max)
+
+        return self.max
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """
+    Counters and latency histograms for the analyser, keyed by metric name
+    and labels. Recording takes one lock, so it's cheap next to the api
+    requests it measures. The metrics can be exported as Prometheus text or
+    summarised as a dict for JSON
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def add(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+
+            histogram.observe(value)
+
+    def get_total(self, name):
+        """
+        A method to get the total of a counter across all of its labels
+
+        input:
+        The name of the counter - string
+
+        output:
+        The total - int
+        """
+        with self._lock:
+            return sum(
+                value
+                for (counter_name, _), value in self._counters.items()
+                if counter_name == name
+            )
+
+    def record_request(self, method, seconds, status):
+        self.observe("api_request_seconds", seconds, method=method)
+        self.add("api_requests_total", method=method, status=status)
+
+    def record_cache(self, cache, hits, misses):
+        if hits:
+            self.add("cache_lookups_total", hits, cache=cache, result="hit")
+
+        if misses:
+            self.add("cache_lookups_total", misses, cache=cache, result="miss")
+
+    @contextmanager
+    def time_step(self, step):
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe("step_seconds", time.perf_counter() - start, step=step)
+
+    @contextmanager
+    def measure_playlist(self, playlist_id):
+        """
+        A context manager to record the time and quota units used analysing
+        a playlist. Units are counted across the whole process, so playlists
+        must be analysed one at a time for them to be right
+
+        input:
+        The id of the playlist - string
+
+        output:
+        None
+        """
+        units = self.get_total("quota_units_total")
+        start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            self.observe(
+                "playlist_seconds", time.perf_counter() - start, playlist=playlist_id
+            )
+            self.add(
+                "playlist_quota_units_total",
+                self.get_total("quota_units_total") - units,
+                playlist=playlist_id,
+            )
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self):
+        """
+        A method to export the metrics in the Prometheus text format
+
+        input:
+        None
+
+        output:
+        The metrics - string
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, histogram.counts[:], histogram.count, histogram.sum)
+                for key, histogram in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                kind, description = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{METRIC_PREFIX}_{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), counts, count, total in histograms:
+            describe(name)
+            cumulative = 0
+
+            for bucket, bucket_count in zip(DEFAULT_BUCKETS, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labels, [("le", bucket)])
+                lines.append(
+                    f"{METRIC_PREFIX}_{name}_bucket{bucket_labels} {cumulative}"
+                )
+
+            bucket_labels = _format_labels(labels, [("le", "+Inf")])
+            lines.append(f"{METRIC_PREFIX}_{name}_bucket{bucket_labels} {count}")
+            lines.append(f"{METRIC_PREFIX}_{name}_sum{_format_labels(labels)} {total}")
+            lines.append(
+                f"{METRIC_PREFIX}_{name}_count{_format_labels(labels)} {count}"
+            )
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def summary(self):
+        """
+        A method to summarise the metrics: the value of every counter, and the
+        count, mean and estimated quantiles of every histogram
+
+        input:
+        None
+
+        output:
+        The metrics, by name, as lists of labelled values - dict
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+            summary = {}
+
+            for (name, labels), value in counters:
+                summary.setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+
+            for (name, labels), histogram in histograms:
+                summary.setdefault(name, []).append(
+                    {
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "sum": round(histogram.sum, 6),
+                        "mean": round(histogram.sum / histogram.count, 6),
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                        "p99": histogram.quantile(0.99),
+                        "max": round(histogram.max, 6),
+                    }
+                )
+
+        return summary
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """
+    A function to get the metrics every part of the analyser records to
+
+    input:
+    None
+
+    output:
+    The shared metrics - Metrics
+    """
+    return _metrics
+
+
+def write_metrics(metrics_format, stream=None):
+    """
+    A function to write the shared metrics out
+
+    input:
+    "prometheus" for the Prometheus text format, or "json" for a summary
+    - string
+    Where to write them, defaults to stderr - file
+
+    output:
+    writes the metrics to the stream
+    """
+    if stream is None:
+        stream = sys.stderr
+
+    if metrics_format == "prometheus":
+        stream.write(get_metrics().to_prometheus())
+
+    elif metrics_format == "json":
+        stream.write(json.dumps(get_metrics().summary(), indent=2) + "\n")
+
+    else:
+        raise Exception(f"Unknown metrics format: {metrics_format}")
+
+    stream.flush()
+
+
+def timed(step):
+    """
+    A decorator to record how long each call of a function takes as a step
+
+    input:
+    The name of the step - string
+
+    output:
+    The decorator - function
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_metrics().time_step(step):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_api_method(uri):
+    """
+    A function to get the api method a request url is for
+
+    input:
+    The url of a YouTube api request - string
+
+    output:
+    The api method, e.g. "videos.list", or "batch" for a batch request
+    - string
+    """
+    resource = urlparse(uri).path.rsplit("/", 1)[-1]
+
+    return resource if resource == "batch" else resource + ".list"
+
+
+class CountingHttp:
+    """
+    Wraps a httplib2.Http to record the size of every reply body it gets.
+    Everything else is passed through to the wrapped object
+    """
+
+    def __init__(self, http):
+        self._http = http
+
+    def request(self, uri, *args, **kwargs):
+        response, content = self._http.request(uri, *args, **kwargs)
+
+        get_metrics().add(
+            "api_response_bytes_total", len(content or b""), method=get_api_method(uri)
+        )
+
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
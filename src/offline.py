@@ -0,0 +1,254 @@
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.playlist import Playlist
+from src.stats import DurationStats
+from src.settings import get_setting
+from src.metrics import get_metrics
+from src.utils import (
+    PlaylistStats,
+    load_playlist,
+    load_playlist_durations,
+    parse_durations,
+)
+
+DEFAULT_STALE_AFTER = 60 * 60
+
+NOT_STORED_MESSAGE = "Playlist not stored for offline use"
+
+
+def get_stale_after():
+    """
+    A function to get how old stored playlist data can be before it's
+    refreshed, from STALE_AFTER in the .env file if it's set
+
+    input:
+    None
+
+    output:
+    if the value isn't a whole number - An error is raised
+
+    otherwise - The age in seconds - int
+    """
+    return get_setting("STALE_AFTER", DEFAULT_STALE_AFTER, minimum=0)
+
+
+def load_stored_playlist(playlist_id, page_cache):
+    """
+    A function to put a playlist back together from the pages stored by
+    earlier runs, without the api. Pages are used however old they are
+
+    input:
+    A YouTube playlist id - string
+    A store of previously fetched pages - PageCache
+
+    output:
+    if any of the playlist's pages isn't stored - None
+
+    otherwise - The playlist, without its durations, and when its oldest page
+    was fetched or last revalidated - tuple of Playlist and float
+    """
+    pages = []
+    fetched_at = math.inf
+    page_token = None
+    seen_tokens = set()
+
+    while True:
+        stored = page_cache.get_stored_page(playlist_id, page_token, ttl=math.inf)
+
+        if stored is None:
+            return None
+
+        page, page_fetched_at = stored
+        pages.append(page)
+        fetched_at = min(fetched_at, page_fetched_at)
+
+        page_token = page.get("nextPageToken")
+
+        if not page_token:
+            break
+
+        if page_token in seen_tokens:
+            return None
+
+        seen_tokens.add(page_token)
+
+    return Playlist.from_pages(pages, playlist_id), fetched_at
+
+
+def get_stored_stats(playlist_id, cache, page_cache, videos_watched=0):
+    """
+    A function to get the stats of a playlist from the pages and durations
+    stored by earlier runs, without the api. A video's duration doesn't
+    change, so stored durations are used however old they are; videos with
+    no stored duration are left out, as deleted and private videos are when
+    the api is used
+
+    input:
+    A YouTube playlist id - string
+    A cache of durations - DurationCache
+    A store of previously fetched pages - PageCache
+    The amount of videos watched - int
+
+    output:
+    if the playlist isn't stored - None
+
+    otherwise - The stats of the playlist, with the age of its pages in
+    seconds - PlaylistStats
+    """
+    stored = load_stored_playlist(playlist_id, page_cache)
+
+    if stored is None:
+        return None
+
+    playlist, fetched_at = stored
+
+    times = cache.get_many(playlist.iter_video_ids(), ttl=math.inf)
+
+    playlist.set_durations(dict(zip(times, parse_durations(times.values()))))
+
+    remaining = playlist[videos_watched:]
+
+    return PlaylistStats(
+        playlist_id=playlist_id,
+        video_count=len(playlist),
+        videos_watched=videos_watched,
+        videos_left=len(remaining),
+        runtime=remaining.runtime,
+        durations=DurationStats.from_playlist(remaining),
+        age=max(time.time() - fetched_at, 0),
+    )
+
+
+class Revalidator:
+    """
+    Refreshes stored playlists in background threads, so answers given from
+    stored data are up to date next time. A playlist already being refreshed
+    isn't refreshed again at the same time, and refreshes that fail, e.g.
+    because the api can't be reached or the quota has run out, are counted
+    and otherwise ignored, as the stored data is still there
+    """
+
+    def __init__(self, youtube, cache, page_cache, max_workers=2):
+        self.youtube = youtube
+        self.cache = cache
+        self.page_cache = page_cache
+
+        self._lock = threading.Lock()
+        self._refreshing = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="revalidator"
+        )
+
+    def refresh(self, playlist_id):
+        """
+        A method to start refreshing a playlist, unless it's already being
+        refreshed
+
+        input:
+        A YouTube playlist id - string
+
+        output:
+        The refresh - concurrent.futures.Future
+        """
+        with self._lock:
+            future = self._refreshing.get(playlist_id)
+
+            if future is None:
+                future = self._refreshing[playlist_id] = self._executor.submit(
+                    self._refresh, playlist_id
+                )
+
+            return future
+
+    def _refresh(self, playlist_id):
+        try:
+            playlist = load_playlist(playlist_id, self.youtube, self.page_cache)
+            load_playlist_durations(playlist, self.youtube, cache=self.cache)
+
+        except Exception:
+            get_metrics().add("stale_refreshes_total", result="error")
+            return False
+
+        finally:
+            with self._lock:
+                del self._refreshing[playlist_id]
+
+        get_metrics().add("stale_refreshes_total", result="ok")
+        return True
+
+    def close(self):
+        """
+        A method to wait for the refreshes that have started to finish
+
+        input:
+        None
+
+        output:
+        None
+        """
+        self._executor.shutdown(wait=True)
+
+
+def get_stale_answer(playlist_id, cache, page_cache, videos_watched, revalidator):
+    """
+    A function to answer with stored data when there is some, refreshing it
+    in the background if it's older than get_stale_after
+
+    input:
+    A YouTube playlist id - string
+    A cache of durations - DurationCache
+    A store of previously fetched pages - PageCache
+    The amount of videos watched - int
+    What refreshes stale playlists - Revalidator
+
+    output:
+    if the playlist isn't stored - None
+
+    otherwise - The stats of the playlist, with the age of the data
+    - PlaylistStats
+    """
+    stats = get_stored_stats(playlist_id, cache, page_cache, videos_watched)
+
+    if stats is None:
+        get_metrics().add("stale_answers_total", result="miss")
+        return None
+
+    if stats.age >= get_stale_after():
+        revalidator.refresh(playlist_id)
+        get_metrics().add("stale_answers_total", result="stale")
+
+    else:
+        get_metrics().add("stale_answers_total", result="fresh")
+
+    return stats
+
+
+def get_stale_stats(
+    playlist_id, cache, page_cache, videos_watched, analyse, revalidator
+):
+    """
+    A function to answer with stored data straight away when there is some,
+    see get_stale_answer, and to analyse the playlist with the api only when
+    nothing is stored. Stored answers never wait for the api, so they're
+    still given while it can't be reached or the quota has run out
+
+    input:
+    A YouTube playlist id - string
+    A cache of durations - DurationCache
+    A store of previously fetched pages - PageCache
+    The amount of videos watched - int
+    What analyses the playlist with the api - function returning
+    PlaylistStats
+    What refreshes stale playlists - Revalidator
+
+    output:
+    The stats of the playlist, with the age of the data if it was stored, or
+    the error that stopped it being analysed - PlaylistStats
+    """
+    stats = get_stale_answer(
+        playlist_id, cache, page_cache, videos_watched, revalidator
+    )
+
+    return analyse() if stats is None else stats
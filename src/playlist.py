@@ -0,0 +1,293 @@
+from array import array
+from bisect import bisect_right
+from itertools import chain
+
+
+def get_item_video_id(item):
+    """
+    A function to get the video id of a playlist item, whether it was
+    requested with the contentDetails part or the snippet part
+
+    input:
+    A playlist item - dict
+
+    output:
+    The video id - string
+    """
+    content_details = item.get("contentDetails")
+
+    if content_details is not None:
+        return content_details["videoId"]
+
+    return item["snippet"]["resourceId"]["videoId"]
+
+
+class Playlist:
+    """
+    A compact playlist, stored as columns rather than the nested dicts of the
+    api response. The video ids are packed end to end in one buffer with an
+    array of offsets into it, and the positions and durations (in seconds)
+    are arrays of unsigned ints, so a 10,000 video playlist takes a couple of
+    hundred KB rather than megabytes.
+
+    Slicing a playlist, e.g. playlist[videos_watched:], gives a view that
+    shares its columns with the original instead of copying them. Durations
+    start at 0 and are filled in with set_durations; writing them through a
+    view fills them in the original too
+    """
+
+    __slots__ = (
+        "playlist_id",
+        "total_results",
+        "_id_buffer",
+        "_id_offsets",
+        "positions",
+        "durations",
+    )
+
+    def __init__(
+        self,
+        playlist_id,
+        id_buffer,
+        id_offsets,
+        positions,
+        durations=None,
+        total_results=None,
+    ):
+        if durations is None:
+            durations = array("I", [0]) * len(positions)
+
+        self.playlist_id = playlist_id
+        self._id_buffer = memoryview(id_buffer)
+        self._id_offsets = memoryview(id_offsets)
+        self.positions = memoryview(positions)
+        self.durations = memoryview(durations)
+        self.total_results = len(positions) if total_results is None else total_results
+
+    @classmethod
+    def from_items(cls, items, playlist_id=None, total_results=None):
+        """
+        A method to build a playlist from playlist items, one at a time, so
+        the items can be streamed from the api without keeping them
+
+        input:
+        Playlist items - iterable of dicts
+        The id of the playlist - string
+        The number of items YouTube says the playlist has, defaults to the
+        number given - int
+
+        output:
+        The playlist - Playlist
+        """
+        id_buffer = bytearray()
+        id_offsets = array("I", [0])
+        positions = array("I")
+
+        for index, item in enumerate(items):
+            id_buffer += get_item_video_id(item).encode()
+            id_offsets.append(len(id_buffer))
+            positions.append(item.get("snippet", {}).get("position", index))
+
+        return cls(
+            playlist_id, id_buffer, id_offsets, positions, total_results=total_results
+        )
+
+    @classmethod
+    def from_pages(cls, pages, playlist_id=None):
+        """
+        A method to build a playlist from the pages of a playlist response,
+        holding only one page at a time
+
+        input:
+        Playlist pages - iterable of dicts, e.g. from get_playlist_pages
+        The id of the playlist - string
+
+        output:
+        The playlist - Playlist
+        """
+        pages = iter(pages)
+
+        first_page = next(pages, {})
+
+        total_results = first_page.get("pageInfo", {}).get("totalResults")
+
+        items = chain.from_iterable(
+            page.get("items", []) for page in chain([first_page], pages)
+        )
+
+        return cls.from_items(items, playlist_id, total_results)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self.video_id(index)
+
+        start, stop, step = index.indices(len(self))
+
+        if step != 1:
+            raise Exception("Playlist slices can't have a step")
+
+        stop = max(start, stop)
+        end = stop + 1
+
+        return Playlist(
+            self.playlist_id,
+            self._id_buffer,
+            self._id_offsets[start:end],
+            self.positions[start:stop],
+            self.durations[start:stop],
+        )
+
+    def video_id(self, index):
+        """
+        A method to get the id of a single video
+
+        input:
+        The index of the video in this playlist or view - int
+
+        output:
+        The video id - string
+        """
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("Playlist index out of range")
+
+        start = self._id_offsets[index]
+        end = self._id_offsets[index + 1]
+
+        return bytes(self._id_buffer[start:end]).decode()
+
+    def iter_video_ids(self):
+        """
+        A generator to get the id of every video in order
+
+        input:
+        None
+
+        output:
+        Yields each video id - string
+        """
+        for index in range(len(self)):
+            yield self.video_id(index)
+
+    def set_durations(self, durations):
+        """
+        A method to fill in the durations of the videos. Videos that aren't
+        given, such as deleted or private ones, last 0 seconds
+
+        input:
+        The duration of each video in seconds, keyed by video id - dict
+
+        output:
+        None
+        """
+        for index, video_id in enumerate(self.iter_video_ids()):
+            self.durations[index] = durations.get(video_id, 0)
+
+    @property
+    def runtime(self):
+        return sum(self.durations)
+
+    def duration_index(self):
+        """
+        A method to build a running total of the durations, once they're set
+
+        input:
+        None
+
+        output:
+        The running total of the durations - DurationIndex
+        """
+        return DurationIndex(self.durations)
+
+    @property
+    def nbytes(self):
+        return (
+            self._id_offsets[-1]
+            - self._id_offsets[0]
+            + self._id_offsets.nbytes
+            + self.positions.nbytes
+            + self.durations.nbytes
+        )
+
+
+class DurationIndex:
+    """
+    A running total of the durations of a playlist's videos, built once so
+    questions about any part of the playlist can be answered from it without
+    the api: the time left after some videos are watched and the runtime of a
+    range of videos in constant time, and how many videos fit in a length of
+    time with a binary search
+    """
+
+    __slots__ = ("_totals",)
+
+    def __init__(self, durations):
+        totals = array("Q", [0])
+        total = 0
+
+        for duration in durations:
+            total += duration
+            totals.append(total)
+
+        self._totals = totals
+
+    def __len__(self):
+        return len(self._totals) - 1
+
+    @property
+    def runtime(self):
+        return self._totals[-1]
+
+    def _clamp(self, index):
+        return min(max(index, 0), len(self))
+
+    def runtime_between(self, start, stop):
+        """
+        A method to get the runtime of a range of videos, like a slice
+
+        input:
+        The index of the first video - int
+        The index after the last video - int
+
+        output:
+        The runtime of the videos in seconds - int
+        """
+        start = self._clamp(start)
+        stop = self._clamp(stop)
+
+        return max(self._totals[stop] - self._totals[start], 0)
+
+    def time_left(self, videos_watched):
+        """
+        A method to get the runtime of the videos after the ones watched
+
+        input:
+        The amount of videos watched - int
+
+        output:
+        The runtime of the videos left in seconds - int
+        """
+        return self.runtime_between(videos_watched, len(self))
+
+    def videos_fitting(self, seconds, start=0):
+        """
+        A method to get how many whole videos, watched in order, fit in a
+        length of time
+
+        input:
+        The time there is to watch in seconds - int
+        The index of the next video to watch - int
+
+        output:
+        The number of videos that fit - int
+        """
+        start = self._clamp(start)
+
+        end = bisect_right(self._totals, self._totals[start] + seconds, start)
+
+        return end - 1 - start
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from src.metrics import get_metrics
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+
+def get_frame_label(frame):
+    """
+    A function to describe a stack frame for a collapsed stack
+
+    input:
+    The frame - frame
+
+    output:
+    The function with the file and line it's defined on, e.g.
+    "get_playlist (utils.py:378)" - string
+    """
+    code = frame.f_code
+
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class SamplingProfiler:
+    """
+    A profiler that looks at the stack of every thread every interval seconds
+    from a background thread, and counts how often each stack is seen. Unlike
+    cProfile it sees the worker threads that fetch pages and durations, and
+    it costs the same however many calls they make. The counts are written
+    as collapsed stacks, one "outer;inner;innermost count" line per stack,
+    which flamegraph.pl, speedscope and similar tools read
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=own_id)
+
+    def sample(self, exclude=None):
+        """
+        A method to count the current stack of every thread once
+
+        input:
+        The id of a thread to leave out - int
+
+        output:
+        None
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude:
+                continue
+
+            labels = []
+
+            while frame is not None:
+                labels.append(get_frame_label(frame))
+                frame = frame.f_back
+
+            thread_name = thread_names.get(thread_id, "thread")
+
+            labels.append(thread_name.rstrip("-_0123456789"))
+            labels.reverse()
+
+            self.stacks[";".join(labels)] += 1
+
+        self.samples += 1
+
+    def write_collapsed(self, path):
+        """
+        A method to write the stacks seen as collapsed stacks, the most seen
+        first
+
+        input:
+        Where to write them - string
+
+        output:
+        None
+        """
+        with open(path, "w") as collapsed_file:
+            for stack, count in self.stacks.most_common():
+                collapsed_file.write(f"{stack} {count}\n")
+
+
+def get_phase_timings():
+    """
+    A function to get the wall clock time spent in each step recorded with
+    timed or time_step so far
+
+    input:
+    None
+
+    output:
+    The step, how many times it ran and its total seconds, the longest total
+    first - list of tuples of string, int and float
+    """
+    steps = get_metrics().summary().get("step_seconds", [])
+
+    timings = [(step["labels"]["step"], step["count"], step["sum"]) for step in steps]
+
+    return sorted(timings, key=lambda timing: -timing[2])
+
+
+def format_phase_timings(timings, total_seconds):
+    """
+    A function to format phase timings as a table. Phases can run inside each
+    other or at the same time, so their times don't add up to the total
+
+    input:
+    The phase timings, see get_phase_timings - list of tuples
+    The wall clock time of the whole run in seconds - float
+
+    output:
+    The table - string
+    """
+    lines = [f"Phase timings (wall clock, {total_seconds:.3f}s in total):"]
+
+    width = max((len(step) for step, _, _ in timings), default=0)
+
+    for step, count, seconds in timings:
+        lines.append(f"  {step:<{width}}  {count:>6} calls  {seconds:>9.3f}s")
+
+    return "\n".join(lines)
+
+
+@contextmanager
+def profile_run(path, interval=DEFAULT_SAMPLE_INTERVAL, stream=None):
+    """
+    A context manager to profile everything run inside it. cProfile records
+    every call made by the calling thread, and a SamplingProfiler samples
+    every thread. Afterwards the cProfile stats are written to
+    path.pstats, the samples to path.collapsed, and the time spent in each
+    phase to the stream
+
+    input:
+    Where to write the profiles, without an extension - string
+    How often to sample the threads in seconds - float
+    Where to write the phase timings, defaults to stderr - file
+
+    output:
+    None
+    """
+    if stream is None:
+        stream = sys.stderr
+
+    profile = cProfile.Profile()
+    sampler = SamplingProfiler(interval)
+    start = time.perf_counter()
+
+    sampler.start()
+    profile.enable()
+
+    try:
+        yield
+
+    finally:
+        profile.disable()
+        sampler.stop()
+
+        total_seconds = time.perf_counter() - start
+
+        profile.dump_stats(f"{path}.pstats")
+        sampler.write_collapsed(f"{path}.collapsed")
+
+        stream.write(format_phase_timings(get_phase_timings(), total_seconds) + "\n")
+        stream.write(f"Profiles written to {path}.pstats and {path}.collapsed\n")
+        stream.flush()
@@ -0,0 +1,551 @@
+import json
+import time
+import random
+import weakref
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+from googleapiclient.errors import HttpError
+from src.settings import get_setting
+from src.metrics import get_metrics
+
+QUOTA_COSTS = {
+    "playlistItems.list": 1,
+    "videos.list": 1,
+    "playlists.list": 1,
+    "channels.list": 1,
+}
+
+DEFAULT_DAILY_QUOTA = 10_000
+
+DEFAULT_RATE_LIMIT = 50
+
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+
+KEY_REJECTED_REASONS = {
+    "keyInvalid",
+    "keyExpired",
+    "accessNotConfigured",
+    "ipRefererBlocked",
+    "API_KEY_INVALID",
+    "API_KEY_EXPIRED",
+    "API_KEY_SERVICE_BLOCKED",
+}
+
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+QUOTA_EXCEEDED_MESSAGE = (
+    "The YouTube api daily quota has run out, try again after it resets at "
+    "midnight Pacific Time"
+)
+
+NOT_ENOUGH_QUOTA_MESSAGE = "Not enough quota left"
+
+KEY_REJECTED_MESSAGE = "The api key was rejected"
+
+
+def get_quota_day():
+    """
+    A function to get the current quota day. YouTube's daily quota resets at
+    midnight Pacific Time
+
+    input:
+    None
+
+    output:
+    The date in Pacific Time - string
+    """
+    return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+
+def get_error_reason(content):
+    """
+    A function to get the reason YouTube gives in the body of an error reply,
+    such as "quotaExceeded"
+
+    input:
+    The body of the reply - bytes
+
+    output:
+    The reason of the first error, or an empty string if there isn't one
+    - string
+    """
+    try:
+        return json.loads(content)["error"]["errors"][0]["reason"]
+
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ""
+
+
+def get_error_details_reasons(content):
+    """
+    A function to get the reasons in the details of an error reply, where
+    Google puts ones like "API_KEY_INVALID"
+
+    input:
+    The body of the reply - bytes
+
+    output:
+    The reasons - set of strings
+    """
+    try:
+        details = json.loads(content)["error"].get("details", [])
+
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+    return {detail.get("reason") for detail in details if isinstance(detail, dict)}
+
+
+def get_error_status_and_reason(error):
+    """
+    A function to get the status code and reason of a failed api request,
+    whether it came from googleapiclient or the async client
+
+    input:
+    The error raised by the request - Exception
+
+    output:
+    The status code, or None if there isn't one, and the reason - tuple
+    """
+    if isinstance(error, HttpError):
+        return error.resp.status, get_error_reason(error.content)
+
+    status = getattr(error, "status", None)
+
+    if not isinstance(status, int):
+        return None, ""
+
+    return status, getattr(error, "message", "")
+
+
+def get_request_status(error):
+    """
+    A function to describe how an api request attempt ended, for metrics
+
+    input:
+    The error raised by the attempt, or None if it succeeded - Exception
+
+    output:
+    "ok", "connection_error", or the status code of the reply - string
+    """
+    if error is None:
+        return "ok"
+
+    if isinstance(error, OSError):
+        return "connection_error"
+
+    status, _ = get_error_status_and_reason(error)
+
+    return "error" if status is None else str(status)
+
+
+def is_retryable(error):
+    """
+    A function to decide whether a failed api request is worth retrying. Rate
+    limits, server errors and dropped connections are; a daily quota that's
+    run out isn't, as it won't come back until the quota resets
+
+    input:
+    The error raised by the request - Exception
+
+    output:
+    Whether to retry - bool
+    """
+    if isinstance(error, OSError):
+        return True
+
+    status, reason = get_error_status_and_reason(error)
+
+    if status is None:
+        return False
+
+    return status == 429 or status >= 500 or reason in RETRYABLE_REASONS
+
+
+def is_quota_exceeded(error):
+    """
+    A function to check whether a failed api request failed because the
+    daily quota has run out
+
+    input:
+    The error raised by the request - Exception
+
+    output:
+    Whether the quota has run out - bool
+    """
+    _, reason = get_error_status_and_reason(error)
+
+    return reason in ("quotaExceeded", "dailyLimitExceeded")
+
+
+def is_key_rejected(error):
+    """
+    A function to check whether a failed api request failed because the api
+    key is invalid, expired or not allowed to use the YouTube api
+
+    input:
+    The error raised by the request - Exception
+
+    output:
+    Whether the key was rejected - bool
+    """
+    status, reason = get_error_status_and_reason(error)
+
+    if status not in (400, 403):
+        return False
+
+    reasons = {reason}
+
+    if isinstance(error, HttpError):
+        reasons |= get_error_details_reasons(error.content)
+
+    return bool(reasons & KEY_REJECTED_REASONS)
+
+
+def is_key_error(message):
+    """
+    A function to check whether an error message is about the api key rather
+    than the playlist, so the work might succeed with another key
+
+    input:
+    The error message - string
+
+    output:
+    Whether the error is a quota or key error - bool
+    """
+    return str(message).startswith(
+        (QUOTA_EXCEEDED_MESSAGE, NOT_ENOUGH_QUOTA_MESSAGE, KEY_REJECTED_MESSAGE)
+    )
+
+
+class RequestScheduler:
+    """
+    The scheduler every YouTube api request goes through. It keeps count of
+    the quota units used today, limits the request rate with a token bucket
+    and retries rate limited, failed and dropped requests with jittered
+    exponential backoff. If a quota_usage store is given, the units used are
+    shared with other runs on the same day.
+
+    Once YouTube says the quota has run out, the scheduler treats the rest of
+    the day's quota as used, and once it rejects the api key every later
+    request fails straight away, so other keys can take over the work
+    """
+
+    def __init__(
+        self,
+        daily_quota=None,
+        rate_limit=None,
+        max_retries=5,
+        base_delay=0.5,
+        max_delay=32,
+        quota_usage=None,
+    ):
+        if daily_quota is None:
+            daily_quota = get_setting("DAILY_QUOTA", DEFAULT_DAILY_QUOTA)
+
+        if rate_limit is None:
+            rate_limit = get_setting("RATE_LIMIT", DEFAULT_RATE_LIMIT)
+
+        self.daily_quota = daily_quota
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.quota_usage = quota_usage
+
+        self.rejected = False
+
+        self._lock = threading.Lock()
+        self._tokens = float(rate_limit)
+        self._refilled_at = time.monotonic()
+        self._day = get_quota_day()
+        self._used_units = quota_usage.get_used(self._day) if quota_usage else 0
+
+    @property
+    def remaining_units(self):
+        with self._lock:
+            self._roll_day()
+            return max(self.daily_quota - self._used_units, 0)
+
+    @property
+    def available(self):
+        return not self.rejected and self.remaining_units > 0
+
+    def _roll_day(self):
+        day = get_quota_day()
+
+        if day != self._day:
+            self._day = day
+            self._used_units = (
+                self.quota_usage.get_used(day) if self.quota_usage else 0
+            )
+
+    def check_budget(self, units):
+        """
+        A method to stop before starting work the remaining daily quota can't
+        cover, rather than failing part way through
+
+        input:
+        The quota units the work will use - int
+
+        output:
+        if there isn't enough quota left - An error is raised
+
+        otherwise - None
+        """
+        remaining_units = self.remaining_units
+
+        if units > remaining_units:
+            raise Exception(
+                f"{NOT_ENOUGH_QUOTA_MESSAGE}: {units} units needed but only "
+                f"{remaining_units} of {self.daily_quota} remain today"
+            )
+
+    def _use_units(self, units):
+        with self._lock:
+            self._roll_day()
+            self._used_units += units
+
+            if self.quota_usage is not None:
+                self.quota_usage.add_used(self._day, units)
+
+    def _take_token(self, tokens=1):
+        """
+        A method to take tokens from the bucket. If the bucket is empty the
+        tokens are borrowed from the future, so callers queue up in order
+
+        input:
+        How many tokens to take - int
+
+        output:
+        How long to wait until the tokens are really available - float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens + (now - self._refilled_at) * self.rate_limit,
+            )
+            self._refilled_at = now
+            self._tokens -= tokens
+
+            return max(-self._tokens / self.rate_limit, 0)
+
+    def get_backoff(self, attempt):
+        """
+        A method to get how long to wait before a retry, with full jitter
+
+        input:
+        How many attempts have failed so far, minus one - int
+
+        output:
+        The delay in seconds - float
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _start_attempt(self, method, requests=1):
+        """
+        A method to check the quota, wait for a token and count the units of
+        an attempt at a request
+
+        input:
+        The api method of the request, e.g. "videos.list" - string
+        How many api requests the request carries - int
+
+        output:
+        How long to wait before sending the request - float
+        """
+        if self.rejected:
+            raise Exception(KEY_REJECTED_MESSAGE)
+
+        units = QUOTA_COSTS.get(method, 1) * requests
+
+        self.check_budget(units)
+
+        wait = self._take_token(requests)
+
+        self._use_units(units)
+
+        get_metrics().add("quota_units_total", units, method=method)
+
+        return wait
+
+    def _get_retry_delay(self, error, attempt):
+        """
+        A method to decide what to do after an attempt at a request fails
+
+        input:
+        The error raised by the attempt - Exception
+        How many attempts have failed so far, minus one - int
+
+        output:
+        if the quota has run out, or the request can't or shouldn't be retried
+        again - An error is raised
+
+        otherwise - How long to wait before retrying - float
+        """
+        if is_quota_exceeded(error):
+            with self._lock:
+                self._roll_day()
+                self._used_units = max(self._used_units, self.daily_quota)
+
+            raise Exception(QUOTA_EXCEEDED_MESSAGE)
+
+        if is_key_rejected(error):
+            self.rejected = True
+
+            raise Exception(KEY_REJECTED_MESSAGE)
+
+        if attempt == self.max_retries or not is_retryable(error):
+            raise error
+
+        return self.get_backoff(attempt)
+
+    def execute(self, request, method, http=None, requests=1):
+        """
+        A method to execute a googleapiclient request through the scheduler. A
+        batch request counts as the number of api requests it carries, for
+        the quota and the rate limit
+
+        input:
+        The request to execute - googleapiclient.http.HttpRequest or
+        BatchHttpRequest
+        The api method of the request, e.g. "videos.list" - string
+        The http object to execute it with - httplib2.Http
+        How many api requests the request carries - int
+
+        output:
+        if the request still fails after retrying, or there isn't enough quota
+        - An error is raised
+
+        otherwise - The response - dict
+        """
+        metrics = get_metrics()
+
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._start_attempt(method, requests))
+
+            start = time.perf_counter()
+
+            try:
+                response = request.execute(http=http)
+
+            except (HttpError, OSError) as error:
+                metrics.record_request(
+                    method, time.perf_counter() - start, get_request_status(error)
+                )
+
+                delay = self._get_retry_delay(error, attempt)
+
+                metrics.add("api_retries_total", method=method)
+
+                time.sleep(delay)
+
+            else:
+                metrics.record_request(method, time.perf_counter() - start, "ok")
+
+                return response
+
+    async def execute_async(self, send, method):
+        """
+        The async version of execute, for requests made with the async client
+
+        input:
+        A function that sends the request - coroutine function
+        The api method of the request, e.g. "videos.list" - string
+
+        output:
+        if the request still fails after retrying, or there isn't enough quota
+        - An error is raised
+
+        otherwise - What send returns
+        """
+        import asyncio
+
+        metrics = get_metrics()
+
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._start_attempt(method))
+
+            start = time.perf_counter()
+
+            try:
+                response = await send()
+
+            except Exception as error:
+                metrics.record_request(
+                    method, time.perf_counter() - start, get_request_status(error)
+                )
+
+                delay = self._get_retry_delay(error, attempt)
+
+                metrics.add("api_retries_total", method=method)
+
+                await asyncio.sleep(delay)
+
+            else:
+                metrics.record_request(method, time.perf_counter() - start, "ok")
+
+                return response
+
+
+_scheduler = None
+
+_client_schedulers = weakref.WeakKeyDictionary()
+
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(youtube=None):
+    """
+    A function to get the scheduler all api requests go through, creating a
+    default one the first time if set_scheduler hasn't been called. A client
+    given its own scheduler, e.g. for its own api key, gets that one instead
+
+    input:
+    The client the requests are made with, if there is one - a build
+    object for the YouTube api
+
+    output:
+    The scheduler - RequestScheduler
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if youtube is not None:
+            scheduler = _client_schedulers.get(youtube)
+
+            if scheduler is not None:
+                return scheduler
+
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+
+        return _scheduler
+
+
+def set_scheduler(scheduler, youtube=None):
+    """
+    A function to replace the scheduler all api requests go through, or the
+    one the requests of a single client go through
+
+    input:
+    The new scheduler, or None to go back to the default - RequestScheduler
+    The client to use it for, defaults to every client - a build object for
+    the YouTube api
+
+    output:
+    None
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if youtube is None:
+            _scheduler = scheduler
+
+        elif scheduler is None:
+            _client_schedulers.pop(youtube, None)
+
+        else:
+            _client_schedulers[youtube] = scheduler
@@ -0,0 +1,240 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from src.settings import get_setting
+from src.formatters import to_record
+from src.metrics import get_metrics
+from src.singleflight import SingleFlight
+from src.stats import DurationStats
+from src.utils import (
+    PlaylistStats,
+    get_duration_index,
+    get_playlist_id,
+    get_playlist_stats,
+    load_playlist,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+
+DEFAULT_PORT = 8080
+
+DEFAULT_PLAYLIST_TTL = 300
+
+MAX_DISTRIBUTIONS_PER_PLAYLIST = 32
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class PlaylistService:
+    """
+    Everything a server needs to analyse playlists, kept warm for the life of
+    the process: one YouTube client, the caches, and every playlist asked
+    about in the last playlist_ttl seconds along with the running total of
+    its durations, so asking about the same playlist again with a different
+    amount of videos watched doesn't use the api. The distribution of the
+    durations left is kept for the MAX_DISTRIBUTIONS_PER_PLAYLIST amounts
+    watched asked about most recently, so repeated requests don't go over the
+    playlist again. Requests for a playlist that's still loading wait for it
+    rather than loading it again
+    """
+
+    def __init__(self, youtube, cache=None, page_cache=None, playlist_ttl=None):
+        if playlist_ttl is None:
+            playlist_ttl = get_setting(
+                "SERVER_PLAYLIST_TTL", DEFAULT_PLAYLIST_TTL, minimum=0
+            )
+
+        self.youtube = youtube
+        self.cache = cache
+        self.page_cache = page_cache
+        self.playlist_ttl = playlist_ttl
+
+        self._lock = threading.Lock()
+        self._playlists = {}
+        self._loads = SingleFlight("playlist")
+
+    def get_playlist(self, playlist_id):
+        """
+        A method to get a playlist and the running total of its durations,
+        loading them if they haven't been loaded in the last playlist_ttl
+        seconds
+
+        input:
+        A YouTube playlist id - string
+
+        output:
+        If theres an error retrieving the playlist - an error will be raised
+        The playlist and its durations - tuple of Playlist and DurationIndex
+        """
+        playlist, duration_index, _ = self._get_loaded(playlist_id)
+
+        return playlist, duration_index
+
+    def _get_loaded(self, playlist_id):
+        now = time.monotonic()
+
+        with self._lock:
+            loaded = self._playlists.get(playlist_id)
+
+        if loaded is not None and now - loaded[0] < self.playlist_ttl:
+            return loaded[1:]
+
+        return self._loads.do(playlist_id, self._load_playlist, playlist_id, now)
+
+    def _load_playlist(self, playlist_id, now):
+        playlist = load_playlist(playlist_id, self.youtube, self.page_cache)
+
+        duration_index = get_duration_index(playlist, self.youtube, cache=self.cache)
+
+        distributions = OrderedDict({0: DurationStats.from_playlist(playlist)})
+
+        with self._lock:
+            for expired_id in [
+                loaded_id
+                for loaded_id, (loaded_at, *_) in self._playlists.items()
+                if now - loaded_at >= self.playlist_ttl
+            ]:
+                del self._playlists[expired_id]
+
+            self._playlists[playlist_id] = (
+                now,
+                playlist,
+                duration_index,
+                distributions,
+            )
+
+        return playlist, duration_index, distributions
+
+    def _get_distribution(self, playlist, distributions, videos_watched):
+        with self._lock:
+            durations = distributions.get(videos_watched)
+
+            if durations is not None:
+                distributions.move_to_end(videos_watched)
+                return durations
+
+        durations = DurationStats.from_playlist(playlist[videos_watched:])
+
+        with self._lock:
+            distributions[videos_watched] = durations
+
+            while len(distributions) > MAX_DISTRIBUTIONS_PER_PLAYLIST:
+                distributions.popitem(last=False)
+
+        return durations
+
+    def get_stats(self, playlist_id, videos_watched=0):
+        """
+        A method to get the stats of a playlist
+
+        input:
+        A YouTube playlist id - string
+        The amount of videos watched - int
+
+        output:
+        If theres an error retrieving the playlist - an error will be raised
+        The stats of the playlist - PlaylistStats
+        """
+        playlist, duration_index, distributions = self._get_loaded(playlist_id)
+
+        return get_playlist_stats(
+            playlist,
+            self.youtube,
+            videos_watched,
+            duration_index=duration_index,
+            durations=self._get_distribution(playlist, distributions, videos_watched),
+        )
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the stats of playlists as JSON, in the same records --format jsonl
+    writes:
+
+    GET /playlists/{id}/stats?watched=N
+    GET /health
+    GET /metrics, in the Prometheus text format
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+
+        if parts == ["health"]:
+            self.send_json(200, {"status": "ok"})
+            return
+
+        if parts == ["metrics"]:
+            self.send_content(
+                200, get_metrics().to_prometheus().encode(), PROMETHEUS_CONTENT_TYPE
+            )
+            return
+
+        if len(parts) != 3 or parts[0] != "playlists" or parts[2] != "stats":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            playlist_id = get_playlist_id(unquote(parts[1]))
+
+            videos_watched = int(parse_qs(url.query).get("watched", ["0"])[0])
+
+            if videos_watched < 0:
+                raise ValueError
+
+        except ValueError:
+            self.send_json(400, {"error": "watched must be a whole number"})
+            return
+
+        except Exception as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        try:
+            stats = self.server.service.get_stats(playlist_id, videos_watched)
+
+        except Exception as error:
+            stats = PlaylistStats(playlist_id, error=str(error))
+            self.send_json(502, to_record(stats))
+            return
+
+        self.send_json(200, to_record(stats))
+
+    def send_json(self, status, body):
+        self.send_content(status, json.dumps(body).encode(), "application/json")
+
+    def send_content(self, status, content, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    A function to make a HTTP server for a playlist service. Each request is
+    handled in its own thread
+
+    input:
+    What to analyse the playlists with - PlaylistService
+    The address to listen on - string
+    The port to listen on, 0 for any free port - int
+
+    output:
+    The server, ready for serve_forever - ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    return server
@@ -0,0 +1,52 @@
+import os
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    A function to load the settings in the .env file into the environment.
+    dotenv is only imported, and the file only read, the first time it's
+    called
+
+    input:
+    None
+
+    output:
+    None
+    """
+    global _env_loaded
+
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_setting(name, default, minimum=1):
+    """
+    A function to read a whole number setting from the .env file
+
+    input:
+    The name of the setting - string
+    The value to use if it isn't set - int
+    The smallest value allowed, 0 or 1 - int
+
+    output:
+    if the value isn't a whole number of at least minimum - An error is raised
+
+    otherwise - The setting - int
+    """
+    load_env()
+
+    value = os.environ.get(name)
+
+    if not value:
+        return default
+
+    if not value.isdigit() or int(value) < minimum:
+        kind = "positive" if minimum else "whole"
+        raise Exception(f"{name} must be a {kind} number")
+
+    return int(value)
@@ -0,0 +1,108 @@
+import threading
+from src.metrics import get_metrics
+
+
+class _Call:
+    """
+    One call in flight, which the callers that arrive while it runs wait on
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one. The first caller
+    for a key runs the work; callers that ask for the same key before it's
+    done wait and get its result, or its error, instead of running the work
+    again. Once it's done the key is forgotten, so this never serves stale
+    results the way a cache could.
+
+    How many calls ran and how many were collapsed into another are counted,
+    on the object and in the shared metrics
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.collapsed = 0
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        A method to run function, or wait for the call already running for
+        the same key
+
+        input:
+        What identifies the work, e.g. a playlist id and page token - hashable
+        The work - function
+        The arguments of the work
+
+        output:
+        If the work raises an error - the error is raised for every caller
+        What the work returned
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+
+            if call is None:
+                call = self._in_flight[key] = _Call()
+                leader = True
+                self.calls += 1
+
+            else:
+                leader = False
+                self.collapsed += 1
+
+        get_metrics().add(
+            "singleflight_calls_total",
+            group=self.name,
+            result="ran" if leader else "collapsed",
+        )
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+
+        except BaseException as error:
+            call.error = error
+            raise
+
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+            call.done.set()
+
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def stats(self):
+        """
+        A method to get how many calls were made and how many were collapsed
+
+        input:
+        None
+
+        output:
+        The counts of calls that ran and calls that shared one - dict
+        """
+        with self._lock:
+            return {"calls": self.calls, "collapsed": self.collapsed}
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+from array import array
+from src.playlist import Playlist
+
+SNAPSHOT_MAGIC = b"YTPLSNAP"
+
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_EXTENSION = ".ytsnap"
+
+# magic, version, byte order (0 little, 1 big), item count, id bytes,
+# metadata bytes
+SNAPSHOT_HEADER = struct.Struct("<8sHHQQQ")
+
+SNAPSHOT_ALIGNMENT = 8
+
+
+def _get_padding(size):
+    return -size % SNAPSHOT_ALIGNMENT
+
+
+def _swap_column(column):
+    swapped = array("I", bytes(column))
+    swapped.byteswap()
+
+    return swapped
+
+
+def get_snapshot_path(snapshot_dir, playlist_id):
+    """
+    A function to get where the snapshot of a playlist is kept
+
+    input:
+    The directory of snapshots - string
+    A YouTube playlist id - string
+
+    output:
+    The path of the snapshot - string
+    """
+    return os.path.join(snapshot_dir, playlist_id + SNAPSHOT_EXTENSION)
+
+
+def write_snapshot(path, playlist, metadata=None):
+    """
+    A function to save a playlist, with its durations, as a snapshot that
+    can be memory mapped later. The file is a fixed header followed by the
+    fetch metadata as JSON, then the id offsets, positions and durations as
+    arrays of unsigned 32 bit ints, then the packed video ids, each section
+    starting on an 8 byte boundary. The file is written next to path and
+    moved into place, so readers never see half of one
+
+    input:
+    Where to save the snapshot - string
+    A YouTube playlist with its durations set - Playlist
+    More fetch metadata to save, e.g. the etag of the first page - dict
+
+    output:
+    None
+    """
+    id_offsets = array("I", playlist._id_offsets)
+    first_offset = id_offsets[0]
+
+    if first_offset:
+        id_offsets = array("I", (offset - first_offset for offset in id_offsets))
+
+    end = first_offset + id_offsets[-1]
+    id_buffer = bytes(playlist._id_buffer[first_offset:end])
+
+    metadata = json.dumps(
+        {
+            "playlist_id": playlist.playlist_id,
+            "total_results": playlist.total_results,
+            "fetched_at": time.time(),
+            **(metadata or {}),
+        }
+    ).encode()
+
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        0 if sys.byteorder == "little" else 1,
+        len(playlist),
+        len(id_buffer),
+        len(metadata),
+    )
+
+    sections = [
+        header,
+        metadata,
+        id_offsets.tobytes(),
+        bytes(playlist.positions),
+        bytes(playlist.durations),
+        id_buffer,
+    ]
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "wb") as snapshot_file:
+        for section in sections:
+            snapshot_file.write(section)
+            snapshot_file.write(b"\0" * _get_padding(len(section)))
+
+    os.replace(temporary_path, path)
+
+
+class Snapshot:
+    """
+    A playlist read back from a snapshot. The file is memory mapped and the
+    playlist's columns are views of the mapping, so opening a snapshot reads
+    only its header and metadata, and the operating system pages the rest in
+    as it's used and can share it between processes. The playlist is read
+    only, and has to be used before the snapshot is closed
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self.metadata, self.playlist = self._read()
+
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _read(self):
+        if len(self._mmap) < SNAPSHOT_HEADER.size:
+            raise Exception(f"{self.path} is not a playlist snapshot")
+
+        magic, version, byte_order, count, id_bytes, metadata_bytes = (
+            SNAPSHOT_HEADER.unpack_from(self._mmap)
+        )
+
+        if magic != SNAPSHOT_MAGIC:
+            raise Exception(f"{self.path} is not a playlist snapshot")
+
+        if version != SNAPSHOT_VERSION:
+            raise Exception(f"Unsupported snapshot version: {version}")
+
+        sizes = [metadata_bytes, (count + 1) * 4, count * 4, count * 4, id_bytes]
+        starts = []
+        offset = SNAPSHOT_HEADER.size + _get_padding(SNAPSHOT_HEADER.size)
+
+        for size in sizes:
+            starts.append(offset)
+            offset += size + _get_padding(size)
+
+        if starts[-1] + id_bytes > len(self._mmap):
+            raise Exception(f"{self.path} is truncated")
+
+        start = starts[0]
+        end = start + metadata_bytes
+        metadata = json.loads(self._mmap[start:end])
+
+        swap = byte_order != (0 if sys.byteorder == "little" else 1)
+
+        view = memoryview(self._mmap)
+        columns = []
+
+        for start, size in zip(starts[1:], sizes[1:]):
+            end = start + size
+            columns.append(view[start:end])
+
+        view.release()
+
+        id_offsets, positions, durations, id_buffer = columns
+
+        if swap:
+            id_offsets, positions, durations = [
+                _swap_column(column) for column in (id_offsets, positions, durations)
+            ]
+
+        else:
+            id_offsets, positions, durations = [
+                column.cast("I") for column in (id_offsets, positions, durations)
+            ]
+
+        playlist = Playlist(
+            metadata.get("playlist_id"),
+            id_buffer,
+            id_offsets,
+            positions,
+            durations,
+            metadata.get("total_results"),
+        )
+
+        return metadata, playlist
+
+    @property
+    def fetched_at(self):
+        return self.metadata.get("fetched_at")
+
+    def close(self):
+        """
+        A method to unmap the snapshot. The views of the playlist are released
+        first, so it mustn't be used afterwards
+
+        input:
+        None
+
+        output:
+        None
+        """
+        playlist = self.playlist
+
+        for column in (
+            playlist._id_buffer,
+            playlist._id_offsets,
+            playlist.positions,
+            playlist.durations,
+        ):
+            column.release()
+
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_snapshot_paths(snapshot_dir):
+    """
+    A generator to list the snapshots in a directory, in name order
+
+    input:
+    The directory of snapshots - string
+
+    output:
+    Yields the path of each snapshot - string
+    """
+    for name in sorted(os.listdir(snapshot_dir)):
+        if name.endswith(SNAPSHOT_EXTENSION):
+            yield os.path.join(snapshot_dir, name)
+
+
+def analyse_snapshots(paths, videos_watched=0):
+    """
+    A generator to get the stats of saved playlists without the api, opening
+    one snapshot at a time
+
+    input:
+    The paths of snapshots - iterable of strings
+    The amount of videos watched in each playlist - int
+
+    output:
+    Yields the stats of each playlist, or the error that stopped its
+    snapshot being read - PlaylistStats
+    """
+    from src.stats import DurationStats
+    from src.utils import PlaylistStats
+
+    for path in paths:
+        try:
+            snapshot = Snapshot(path)
+
+        except Exception as error:
+            yield PlaylistStats(path, error=str(error))
+            continue
+
+        with snapshot:
+            playlist = snapshot.playlist
+            remaining = playlist[videos_watched:]
+
+            stats = PlaylistStats(
+                playlist_id=playlist.playlist_id,
+                video_count=len(playlist),
+                videos_watched=videos_watched,
+                videos_left=len(remaining),
+                runtime=remaining.runtime,
+                durations=DurationStats.from_playlist(remaining),
+            )
+
+            del playlist, remaining
+
+        yield stats
@@ -0,0 +1,240 @@
+import math
+from src.metrics import Histogram
+
+RELATIVE_ACCURACY = 0.01
+
+MAX_SKETCH_BUCKETS = 2048
+
+DURATION_BUCKETS = (60, 300, 600, 1200, 1800, 3600, 7200, 10800)
+
+
+class DurationStats:
+    """
+    Streaming stats of video durations in seconds, built in one pass without
+    keeping the durations: the count, total, shortest and longest are exact,
+    the counts per DURATION_BUCKETS bucket are exact, and quantiles such as
+    the median come from a sketch of logarithmic buckets that's accurate to
+    within relative_accuracy of the true value.
+
+    The sketch has at most max_buckets buckets whatever the number of
+    durations; with the defaults that's enough for every duration from a
+    second to years before the shortest buckets are merged together. Stats
+    can be merged, e.g. to sum up many playlists
+    """
+
+    __slots__ = (
+        "relative_accuracy",
+        "max_buckets",
+        "_gamma_log",
+        "_sketch",
+        "_zero_count",
+        "_histogram",
+        "min",
+    )
+
+    def __init__(
+        self, relative_accuracy=RELATIVE_ACCURACY, max_buckets=MAX_SKETCH_BUCKETS
+    ):
+        if not 0 < relative_accuracy < 1:
+            raise Exception("The relative accuracy must be between 0 and 1")
+
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma_log = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self._sketch = {}
+        self._zero_count = 0
+        self._histogram = Histogram(DURATION_BUCKETS)
+        self.min = None
+
+    @classmethod
+    def from_playlist(cls, playlist):
+        """
+        A method to get the stats of the durations of a playlist, or a view of
+        one. Videos lasting 0 seconds, which is how videos the api didn't
+        return are stored, are left out
+
+        input:
+        A YouTube playlist with its durations set - Playlist
+
+        output:
+        The stats of the durations - DurationStats
+        """
+        stats = cls()
+        stats.update(seconds for seconds in playlist.durations if seconds)
+
+        return stats
+
+    def add(self, seconds):
+        """
+        A method to add one duration
+
+        input:
+        The duration in seconds - int
+
+        output:
+        None
+        """
+        if seconds < 0:
+            raise Exception(f"Durations can't be negative: {seconds}")
+
+        self._histogram.observe(seconds)
+        self.min = seconds if self.min is None else min(self.min, seconds)
+
+        if seconds == 0:
+            self._zero_count += 1
+            return
+
+        key = math.ceil(math.log(seconds) / self._gamma_log)
+        self._sketch[key] = self._sketch.get(key, 0) + 1
+
+        if len(self._sketch) > self.max_buckets:
+            self._collapse()
+
+    def update(self, durations):
+        """
+        A method to add durations one at a time, so they can be streamed
+
+        input:
+        Durations in seconds - iterable of ints
+
+        output:
+        None
+        """
+        for seconds in durations:
+            self.add(seconds)
+
+    def merge(self, other):
+        """
+        A method to add the durations of other stats to these ones
+
+        input:
+        Stats with the same relative accuracy - DurationStats
+
+        output:
+        None
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise Exception("Can't merge stats with different accuracies")
+
+        for key, count in other._sketch.items():
+            self._sketch[key] = self._sketch.get(key, 0) + count
+
+        while len(self._sketch) > self.max_buckets:
+            self._collapse()
+
+        self._zero_count += other._zero_count
+
+        histogram = self._histogram
+        histogram.counts = [
+            count + other_count
+            for count, other_count in zip(histogram.counts, other._histogram.counts)
+        ]
+        histogram.count += other._histogram.count
+        histogram.sum += other._histogram.sum
+        histogram.max = max(histogram.max, other._histogram.max)
+
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def _collapse(self):
+        lowest, second_lowest = sorted(self._sketch)[:2]
+
+        self._sketch[second_lowest] += self._sketch.pop(lowest)
+
+    @property
+    def count(self):
+        return self._histogram.count
+
+    @property
+    def total(self):
+        return self._histogram.sum
+
+    @property
+    def max(self):
+        return self._histogram.max if self.count else None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    @property
+    def nbuckets(self):
+        return len(self._sketch)
+
+    def quantile(self, q):
+        """
+        A method to estimate a quantile of the durations
+
+        input:
+        The quantile, from 0 to 1 - float
+
+        output:
+        The estimated duration in seconds, within relative_accuracy of the
+        true one, or None if there are no durations - float
+        """
+        if not 0 <= q <= 1:
+            raise Exception("The quantile must be between 0 and 1")
+
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self._zero_count
+
+        if seen > rank:
+            return 0
+
+        gamma = math.exp(self._gamma_log)
+
+        for key in sorted(self._sketch):
+            seen += self._sketch[key]
+
+            if seen > rank:
+                estimate = 2 * gamma**key / (gamma + 1)
+
+                return min(max(estimate, self.min), self.max)
+
+        return self.max
+
+    def histogram(self):
+        """
+        A method to get how many durations fall in each of DURATION_BUCKETS
+
+        input:
+        None
+
+        output:
+        The upper bound of each bucket in seconds, or None for the bucket past
+        the last one, and the number of durations up to it but over the bound
+        before - list of tuples of int and int
+        """
+        return list(zip([*DURATION_BUCKETS, None], self._histogram.counts))
+
+    def to_dict(self):
+        """
+        A method to summarise the stats for JSON
+
+        input:
+        None
+
+        output:
+        The count, total, mean, shortest, longest, median, 90th and 99th
+        percentiles in seconds, and the histogram - dict
+        """
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "median": self.median,
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "histogram": [
+                {"le": bound, "count": count} for bound, count in self.histogram()
+            ],
+        }
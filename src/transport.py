@@ -0,0 +1,231 @@
+import os
+import zlib
+import threading
+from urllib.parse import urlparse
+from urllib.request import getproxies, proxy_bypass
+from src.settings import get_setting, load_env
+from src.metrics import CountingHttp, get_api_method, get_metrics
+
+DEFAULT_HTTP_TIMEOUT = 60
+
+DEFAULT_HTTP_CONNECT_TIMEOUT = 10
+
+HTTP_TRANSPORTS = ("urllib3", "httplib2")
+
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+def get_http_transport():
+    """
+    A function to get which library sends the api requests, from
+    HTTP_TRANSPORT in the .env file if it's set. urllib3 is used unless it's
+    set to httplib2 or urllib3 isn't installed
+
+    input:
+    None
+
+    output:
+    if the value isn't one of HTTP_TRANSPORTS - An error is raised
+
+    otherwise - "urllib3" or "httplib2" - string
+    """
+    load_env()
+
+    transport = os.environ.get("HTTP_TRANSPORT") or "urllib3"
+
+    if transport not in HTTP_TRANSPORTS:
+        raise Exception(f"HTTP_TRANSPORT must be one of {', '.join(HTTP_TRANSPORTS)}")
+
+    if transport == "urllib3":
+        try:
+            import urllib3  # noqa: F401
+
+        except ImportError:
+            return "httplib2"
+
+    return transport
+
+
+def decode_content(content, encoding):
+    """
+    A function to decompress the body of a reply
+
+    input:
+    The body as it was received - bytes
+    The Content-Encoding of the reply, None if it isn't compressed - string
+
+    output:
+    if the body can't be decompressed - An error is raised
+
+    otherwise - The decompressed body - bytes
+    """
+    if encoding == "gzip":
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(content)
+
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+
+    return content
+
+
+class PooledHttp:
+    """
+    A stand-in for httplib2.Http that sends requests through a urllib3 pool.
+    Unlike httplib2.Http it's thread safe, so one is shared by every thread:
+    connections are kept alive and reused across threads, up to pool_size
+    per host, so DNS lookups and TLS handshakes only happen when the pool
+    grows. Replies are asked for gzipped and decompressed here, so the bytes
+    received are counted before decompression, as api_wire_bytes_total.
+
+    Proxies are taken from the usual environment variables. Requests aren't
+    retried or redirected, as the scheduler does the retrying
+    """
+
+    def __init__(self, pool_size=None, timeout=None, connect_timeout=None):
+        import urllib3
+
+        if pool_size is None:
+            from src.utils import get_max_concurrency
+
+            pool_size = get_setting("HTTP_POOL_SIZE", get_max_concurrency())
+
+        if timeout is None:
+            timeout = get_setting("HTTP_TIMEOUT", DEFAULT_HTTP_TIMEOUT)
+
+        if connect_timeout is None:
+            connect_timeout = get_setting(
+                "HTTP_CONNECT_TIMEOUT", DEFAULT_HTTP_CONNECT_TIMEOUT
+            )
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._pool_options = {
+            "maxsize": pool_size,
+            "retries": False,
+            "timeout": urllib3.Timeout(connect=connect_timeout, read=timeout),
+        }
+        self._pool = urllib3.PoolManager(**self._pool_options)
+        self._proxies = getproxies()
+        self._proxy_pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, uri):
+        import urllib3
+
+        url = urlparse(uri)
+        proxy_url = self._proxies.get(url.scheme)
+
+        if proxy_url is None or proxy_bypass(url.hostname):
+            return self._pool
+
+        with self._lock:
+            pool = self._proxy_pools.get(proxy_url)
+
+            if pool is None:
+                pool = self._proxy_pools[proxy_url] = urllib3.ProxyManager(
+                    proxy_url, **self._pool_options
+                )
+
+            return pool
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        """
+        A method to send a request, as httplib2.Http.request does
+
+        input:
+        The url - string
+        The HTTP method - string
+        The body - bytes or string
+        The request headers - dict
+        The other arguments of httplib2.Http.request, which are ignored
+
+        output:
+        if the connection fails or times out - A ConnectionError is raised
+
+        otherwise - The reply and its decompressed body - tuple of
+        httplib2.Response and bytes
+        """
+        import httplib2
+        import urllib3
+
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        headers.setdefault("accept-encoding", ACCEPT_ENCODING)
+
+        try:
+            reply = self._get_pool(uri).request(
+                method,
+                uri,
+                body=body,
+                headers=headers,
+                preload_content=False,
+                decode_content=False,
+            )
+
+            try:
+                content = reply.read(decode_content=False)
+
+            finally:
+                reply.release_conn()
+
+        except urllib3.exceptions.HTTPError as error:
+            raise ConnectionError(str(error)) from error
+
+        get_metrics().add(
+            "api_wire_bytes_total", len(content), method=get_api_method(uri)
+        )
+
+        response = httplib2.Response(
+            {"status": reply.status, **{k.lower(): v for k, v in reply.headers.items()}}
+        )
+        response.reason = reply.reason
+
+        encoding = response.pop("content-encoding", None)
+
+        if encoding is not None:
+            content = decode_content(content, encoding)
+            response["-content-encoding"] = encoding
+            response["content-length"] = str(len(content))
+
+        return response, content
+
+    def close(self):
+        self._pool.clear()
+
+        with self._lock:
+            for pool in self._proxy_pools.values():
+                pool.clear()
+
+
+_shared_http = None
+
+_shared_http_lock = threading.Lock()
+
+
+def get_shared_http():
+    """
+    A function to get the http object every thread sends api requests with,
+    creating it the first time
+
+    input:
+    None
+
+    output:
+    A PooledHttp wrapped to count the bytes of replies, or None if
+    get_http_transport says to use httplib2 - CountingHttp
+    """
+    global _shared_http
+
+    if _shared_http is None:
+        if get_http_transport() != "urllib3":
+            return None
+
+        with _shared_http_lock:
+            if _shared_http is None:
+                _shared_http = CountingHttp(PooledHttp())
+
+    return _shared_http
@@ -1,15 +1,53 @@
 import os
 import re
 import datetime
-from dotenv import load_dotenv
+import threading
+from array import array
+from urllib.parse import urlparse
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
+from src.playlist import Playlist, get_item_video_id
+from src.stats import DurationStats
+from src.metrics import CountingHttp, get_metrics, timed
+from src.singleflight import SingleFlight
+from src.settings import get_setting, load_env
+from src.scheduler import QUOTA_COSTS, get_scheduler
 
-load_dotenv()
+MAX_IDS_PER_REQUEST = 50
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+DEFAULT_HTTP_BATCH_SIZE = 0
+
+MAX_REQUESTS_PER_BATCH = 1000
+
+PLAYLIST_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+CHANNEL_ID_PATTERN = re.compile(r"UC[A-Za-z0-9_-]{22}")
+
+CHANNEL_PLAYLIST_FIELDS = "nextPageToken,pageInfo/totalResults,items(id)"
+
+PLAYLIST_ITEM_FIELDS = (
+    "etag,nextPageToken,pageInfo/totalResults,items(contentDetails/videoId)"
+)
+
+VIDEO_FIELDS = "items(id,contentDetails/duration)"
+
+PLAYLIST_PAGE_FLIGHT = SingleFlight("playlist_page")
+
+VIDEO_CHUNK_FLIGHT = SingleFlight("video_chunk")
+
+DURATION_PATTERN = re.compile(
+    r"P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?"
+)
 
 
 def get_api_key():
     """
-    A function to get the api key from the .env file
+    A function to get the api key from the .env file, from API_KEY or else
+    the first of API_KEYS
 
     input:
     None
@@ -19,7 +57,11 @@ def get_api_key():
 
     if a key exists - Returns the api key - string
     """
-    api_key = os.environ.get("API_KEY")
+    load_env()
+
+    api_key = (
+        os.environ.get("API_KEY") or os.environ.get("API_KEYS", "").split(",")[0]
+    ).strip()
 
     if not api_key:
         raise Exception("No api key found")
@@ -27,6 +69,68 @@ def get_api_key():
     return api_key
 
 
+def get_api_keys():
+    """
+    A function to get every api key to share work between, from API_KEYS in
+    the .env file, separated by commas, or from API_KEY if it isn't set
+
+    input:
+    None
+
+    Output:
+    if no key - An error is raised
+
+    if keys exist - Returns the distinct api keys - list of strings
+    """
+    load_env()
+
+    api_keys = [
+        api_key.strip()
+        for api_key in os.environ.get("API_KEYS", "").split(",")
+        if api_key.strip()
+    ]
+
+    if not api_keys:
+        return [get_api_key()]
+
+    return list(dict.fromkeys(api_keys))
+
+
+def get_max_concurrency():
+    """
+    A function to get the maximum number of api requests to have in flight at
+    once, from MAX_CONCURRENCY in the .env file if it's set
+
+    input:
+    None
+
+    Output:
+    if the value isn't a positive number - An error is raised
+
+    otherwise - The concurrency limit - int
+    """
+    return get_setting("MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+
+
+def get_http_batch_size():
+    """
+    A function to get how many videos().list requests to send together in
+    each batch HTTP request, from HTTP_BATCH_SIZE in the .env file if it's
+    set. Batching is off unless it's more than 1
+
+    input:
+    None
+
+    Output:
+    if the value isn't a whole number - An error is raised
+
+    otherwise - The batch size, at most 1000 - int
+    """
+    batch_size = get_setting("HTTP_BATCH_SIZE", DEFAULT_HTTP_BATCH_SIZE, minimum=0)
+
+    return min(batch_size, MAX_REQUESTS_PER_BATCH)
+
+
 def extract_playlist_id(playlist_url):
     """
     A function to extract the playlist id from a given YouTube url
@@ -53,52 +157,523 @@ def extract_playlist_id(playlist_url):
     return playlist_id
 
 
-def get_playlist(playlist_url, youtube):
+_idle_http = []
+
+_idle_http_lock = threading.Lock()
+
+_youtube_clients = {}
+
+_youtube_clients_lock = threading.Lock()
+
+
+def get_playlist_id(playlist):
+    """
+    A function to get a playlist id from either a YouTube url or a bare
+    playlist id
+
+    input:
+    A YouTube playlist url or id - string
+
+    output:
+    A YouTube playlist id - string
+    """
+    if PLAYLIST_ID_PATTERN.fullmatch(playlist):
+        return playlist
+
+    return extract_playlist_id(playlist)
+
+
+def get_youtube_client(api_key):
+    """
+    A function to get a build object for the YouTube api. googleapiclient is
+    only imported the first time it's called, the discovery document bundled
+    with it is used rather than downloading one, and the same client is
+    reused for the rest of the process
+
+    input:
+    The api key - string
+
+    output:
+    A build object for the YouTube api
+    """
+    with _youtube_clients_lock:
+        youtube = _youtube_clients.get(api_key)
+
+        if youtube is None:
+            with get_metrics().time_step("build_client"):
+                from googleapiclient.discovery import build
+
+                youtube = build(
+                    "youtube",
+                    "v3",
+                    developerKey=api_key,
+                    static_discovery=True,
+                    cache_discovery=False,
+                )
+
+            _youtube_clients[api_key] = youtube
+
+        return youtube
+
+
+@contextmanager
+def _borrow_http():
+    """
+    A context manager to borrow a http object to send api requests with.
+    With the urllib3 transport, see get_http_transport, every thread shares
+    one pooled http object. Otherwise it's borrowed from a pool of httplib2
+    objects: they aren't thread safe, so each one is only used by one thread
+    at a time, but they're kept after use so their keep-alive connections are
+    reused by later requests, even from new threads
+
+    input:
+    None
+
+    output:
+    A http object the calling thread can use until it's done - PooledHttp or
+    httplib2.Http
+    """
+    from src.transport import get_shared_http
+
+    shared_http = get_shared_http()
+
+    if shared_http is not None:
+        yield shared_http
+        return
+
+    with _idle_http_lock:
+        http = _idle_http.pop() if _idle_http else None
+
+    if http is None:
+        from googleapiclient.http import build_http
+
+        http = CountingHttp(build_http())
+
+    try:
+        yield http
+
+    finally:
+        with _idle_http_lock:
+            _idle_http.append(http)
+
+
+def get_playlist_page_params(playlist_id, page_token=None, rich_metadata=False):
+    """
+    A function to get the query parameters for a page of playlist items. By
+    default only the contentDetails part is requested, with a field mask so
+    YouTube sends nothing but the video ids, the page token, the total and
+    the etag. With rich_metadata the whole snippet and contentDetails parts
+    are requested instead, for callers that want titles, thumbnails and so on
+
+    input:
+    A YouTube playlist id - string
+    The token of the page to get, None for the first page - string
+    Whether to request every field of the items - bool
+
+    output:
+    The query parameters - dict
+    """
+    if rich_metadata:
+        params = {"part": "snippet,contentDetails"}
+
+    else:
+        params = {"part": "contentDetails", "fields": PLAYLIST_ITEM_FIELDS}
+
+    params["playlistId"] = playlist_id
+    params["maxResults"] = MAX_IDS_PER_REQUEST
+
+    if page_token:
+        params["pageToken"] = page_token
+
+    return params
+
+
+def get_playlist_page(
+    playlist_id, youtube, page_token=None, page_cache=None, rich_metadata=False
+):
+    """
+    A function to request a single page of items from a given playlist. If a
+    page cache is given and it has this page, the request is sent with the
+    stored etag and the stored page is returned if YouTube replies 304 Not
+    Modified. Calls for a page that's already being requested wait for that
+    request and share its page instead of sending another
+
+    input:
+    A YouTube playlist id - string
+    A build object for the YouTube api
+    The token of the page to get, None for the first page - string
+    A store of previously fetched pages - PageCache
+    Whether to request every field of the items, see
+    get_playlist_page_params - bool
+
+    output:
+    A single page of the playlist response - dict
+    """
+    return PLAYLIST_PAGE_FLIGHT.do(
+        (playlist_id, page_token, rich_metadata),
+        _request_playlist_page,
+        playlist_id,
+        youtube,
+        page_token,
+        page_cache,
+        rich_metadata,
+    )
+
+
+def _request_playlist_page(playlist_id, youtube, page_token, page_cache, rich_metadata):
+    params = get_playlist_page_params(playlist_id, page_token, rich_metadata)
+
+    request = youtube.playlistItems().list(**params)
+
+    fields = params.get("fields", "")
+    stored_page = None
+
+    if page_cache is not None:
+        stored_page = page_cache.get_page(playlist_id, page_token, fields)
+
+    if stored_page is not None:
+        request.headers["If-None-Match"] = stored_page["etag"]
+
+    try:
+        with _borrow_http() as http:
+            page = get_scheduler(youtube).execute(
+                request, "playlistItems.list", http
+            )
+
+    except HttpError as error:
+        if stored_page is not None and error.resp.status == 304:
+            page_cache.touch_page(playlist_id, page_token, fields)
+            return stored_page
+
+        raise
+
+    if page_cache is not None:
+        page_cache.put_page(playlist_id, page_token, page, fields)
+
+    return page
+
+
+def check_playlist_budget(first_page, youtube=None):
+    """
+    A function to check there's enough quota left to get the rest of a
+    playlist's pages, using the total number of items on its first page
+
+    input:
+    The first page of the playlist response - dict
+    The client the pages are requested with - a build object for the
+    YouTube api
+
+    output:
+    if there isn't enough quota left - An error is raised
+
+    otherwise - None
     """
-    A function to make a request to the YouTube api and return a dictionary
-    of videos from a given playlist
+    total_results = first_page.get("pageInfo", {}).get("totalResults", 0)
+
+    pages_left = max(-(-total_results // MAX_IDS_PER_REQUEST) - 1, 0)
+
+    get_scheduler(youtube).check_budget(
+        pages_left * QUOTA_COSTS["playlistItems.list"]
+    )
+
+
+def get_playlist_pages(playlist_id, youtube, page_cache=None, rich_metadata=False):
+    """
+    A generator that follows nextPageToken through every page of a playlist.
+    As soon as a page arrives the request for the next one is sent in the
+    background, so it downloads while the caller processes the current page
 
     input:
-    A YouTube playlist url - string
+    A YouTube playlist id - string
     A build object for the YouTube api
+    A store of previously fetched pages - PageCache
+    Whether to request every field of the items - bool
+
+    output:
+    If theres an error retrieving a page, or not enough quota is left to get
+    the rest of the pages - an error will be raised
+    Yields each page of the playlist response in order - dict
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            get_playlist_page, playlist_id, youtube, None, page_cache, rich_metadata
+        )
+        is_first_page = True
+
+        while future is not None:
+            try:
+                page = future.result()
+
+            except HttpError:
+                raise Exception("Error getting playlist")
+
+            if is_first_page:
+                check_playlist_budget(page, youtube)
+                is_first_page = False
+
+            next_page_token = page.get("nextPageToken")
+
+            if next_page_token:
+                future = executor.submit(
+                    get_playlist_page,
+                    playlist_id,
+                    youtube,
+                    next_page_token,
+                    page_cache,
+                    rich_metadata,
+                )
+
+            else:
+                future = None
+
+            yield page
+
+
+@timed("get_playlist")
+def get_playlist(playlist_url, youtube, page_cache=None, rich_metadata=False):
+    """
+    A function to make requests to the YouTube api and return a dictionary
+    of every video in a given playlist, across all of its pages
+
+    input:
+    A YouTube playlist url or id - string
+    A build object for the YouTube api
+    A store of previously fetched pages - PageCache
+    Whether to request every field of the items, rather than just the video
+    ids - bool
 
     output:
     If theres an error retrieving the playlist - an error will be raised
     If the request is successful - A dictionary of videos and information
     about them - dict
     """
-    playlist_id = extract_playlist_id(playlist_url)
+    playlist_id = get_playlist_id(playlist_url)
 
-    try:
-        request = youtube.playlistItems().list(
-            part="snippet", playlistId=f"{playlist_id}", maxResults=50
-        )
+    playlist = None
+
+    for page in get_playlist_pages(playlist_id, youtube, page_cache, rich_metadata):
+        if playlist is None:
+            playlist = {**page, "items": []}
+            playlist.pop("nextPageToken", None)
+
+        playlist["items"].extend(page.get("items", []))
+
+    return playlist
+
+
+@timed("load_playlist")
+def load_playlist(playlist_url, youtube, page_cache=None):
+    """
+    A function to get every video in a playlist as a compact Playlist,
+    building it page by page so the full response is never held in memory
+
+    input:
+    A YouTube playlist url or id - string
+    A build object for the YouTube api
+    A store of previously fetched pages - PageCache
 
-        response = request.execute()
+    output:
+    If theres an error retrieving the playlist - an error will be raised
+    The videos of the playlist, without their durations - Playlist
+    """
+    playlist_id = get_playlist_id(playlist_url)
+
+    return Playlist.from_pages(
+        get_playlist_pages(playlist_id, youtube, page_cache), playlist_id
+    )
+
+
+def get_channel_id(channel, youtube):
+    """
+    A function to get a channel id from a YouTube channel url, a bare channel
+    id or a handle such as @name. Handles are looked up with the api
+
+    input:
+    A YouTube channel url, id or handle - string
+    A build object for the YouTube api
+
+    output:
+    If the channel can't be found - an error will be raised
+    A YouTube channel id - string
+    """
+    channel = channel.strip()
+
+    if CHANNEL_ID_PATTERN.fullmatch(channel):
+        return channel
+
+    if "youtube.com" in channel:
+        path = urlparse(channel if "//" in channel else "//" + channel).path
+        parts = [part for part in path.split("/") if part]
+
+        if len(parts) >= 2 and parts[0] == "channel":
+            return parts[1]
+
+        if not parts or not parts[0].startswith("@"):
+            raise Exception("URL not a channel")
+
+        channel = parts[0]
+
+    if not channel.startswith("@"):
+        raise Exception("Invalid channel")
+
+    request = youtube.channels().list(part="id", forHandle=channel, fields="items(id)")
+
+    try:
+        with _borrow_http() as http:
+            response = get_scheduler(youtube).execute(request, "channels.list", http)
 
     except HttpError:
-        raise Exception("Error getting playlist")
+        raise Exception("Error getting channel")
+
+    if not response.get("items"):
+        raise Exception("Channel not found")
+
+    return response["items"][0]["id"]
+
+
+def iter_channel_playlist_ids(channel_id, youtube):
+    """
+    A generator that pages through the playlists a channel owns
+
+    input:
+    A YouTube channel id - string
+    A build object for the YouTube api
+
+    output:
+    If theres an error retrieving the playlists - an error will be raised
+    Yields the id of each playlist - string
+    """
+    page_token = None
+
+    while True:
+        params = {
+            "part": "id",
+            "channelId": channel_id,
+            "maxResults": MAX_IDS_PER_REQUEST,
+            "fields": CHANNEL_PLAYLIST_FIELDS,
+        }
+
+        if page_token:
+            params["pageToken"] = page_token
+
+        request = youtube.playlists().list(**params)
+
+        try:
+            with _borrow_http() as http:
+                page = get_scheduler(youtube).execute(request, "playlists.list", http)
+
+        except HttpError:
+            raise Exception("Error getting channel playlists")
 
-    return response
+        for item in page.get("items", []):
+            yield item["id"]
 
+        page_token = page.get("nextPageToken")
 
-def get_videos(video_ids, youtube):
+        if not page_token:
+            break
+
+
+def iter_video_ids(items):
+    """
+    A generator to pull the video id out of each playlist item. It accepts
+    any iterable of items, so it can be fed straight from get_playlist_pages
+
+    input:
+    Playlist items - iterable of dicts
+
+    output:
+    Yields the video id of each item in order - string
+    """
+    for item in items:
+        yield get_item_video_id(item)
+
+
+def get_videos(video_ids, youtube, rich_metadata=False):
     """
     A function that will request information about a given list of videos
-    from the YouTube api
+    from the YouTube api. By default a field mask means only the id and
+    duration of each video are sent
 
     input:
     A list of video ids - List of strings
     A build object for the YouTube api
+    Whether to request the snippet and every field of contentDetails - bool
 
     output:
     A dictionary of videos and information about them
     """
-    request = youtube.videos().list(part="contentDetails", id=video_ids)
+    if rich_metadata:
+        request = youtube.videos().list(part="snippet,contentDetails", id=video_ids)
+
+    else:
+        request = youtube.videos().list(
+            part="contentDetails", id=video_ids, fields=VIDEO_FIELDS
+        )
 
     return request
 
 
+def parse_duration(time):
+    """
+    A function to convert a single YouTube formatted time to seconds. Weeks
+    and days are supported, and P0D, which YouTube gives live and upcoming
+    videos, is 0
+
+    input:
+    A YouTube formatted time - string
+
+    output:
+    if the time isn't an ISO 8601 duration - An error is raised
+
+    otherwise - The time in seconds - int
+    """
+    match = DURATION_PATTERN.fullmatch(time)
+
+    if match is None:
+        raise Exception(f"Invalid duration: {time}")
+
+    weeks, days, hours, minutes, seconds = match.groups()
+
+    return (
+        (int(weeks) * 604800 if weeks else 0)
+        + (int(days) * 86400 if days else 0)
+        + (int(hours) * 3600 if hours else 0)
+        + (int(minutes) * 60 if minutes else 0)
+        + (int(seconds) if seconds else 0)
+    )
+
+
+@timed("parse_durations")
+def parse_durations(times):
+    """
+    A function to convert many YouTube formatted times to seconds in one
+    pass. Most videos share a handful of distinct durations, so each distinct
+    string is only parsed once
+
+    input:
+    YouTube formatted times - iterable of strings
+
+    output:
+    if a time isn't an ISO 8601 duration - An error is raised
+
+    otherwise - The times in seconds - array of ints
+    """
+    parsed = {}
+    converted = array("q")
+
+    for time in times:
+        seconds = parsed.get(time)
+
+        if seconds is None:
+            seconds = parsed[time] = parse_duration(time)
+
+        converted.append(seconds)
+
+    return converted
+
+
+@timed("convert_times")
 def convert_times(times):
     """
     A function to convert a list of times from the YouTube formatted times to
@@ -110,46 +685,364 @@ def convert_times(times):
     output:
     A list of times converted into seconds - list of ints
     """
-    converted_list = []
+    return parse_durations(times).tolist()
 
-    for time in times:
-        pattern = r"PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?"
-        hours, minutes, seconds = re.match(pattern, time).groups()
 
-        hours = int(hours) if hours else 0
-        minutes = int(minutes) if minutes else 0
-        seconds = int(seconds) if seconds else 0
+def chunk_video_ids(video_ids, size=MAX_IDS_PER_REQUEST):
+    """
+    A generator to split video ids into chunks small enough for a single
+    videos().list request
+
+    input:
+    Video ids - iterable of strings
+    The largest chunk to yield - int
+
+    output:
+    Yields the ids in order, size at a time - list of strings
+    """
+    chunk = []
+
+    for video_id in video_ids:
+        chunk.append(video_id)
 
-        converted_list.append(hours * 3600 + minutes * 60 + seconds)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
 
-    return converted_list
+    if chunk:
+        yield chunk
 
 
-def get_playlist_runtime(playlist, youtube):
+def get_chunk_durations(video_ids, youtube):
     """
-    A function to take a given playlist and find out the total runtime of all the
-    videos in that playlist
+    A function to get the durations of a single chunk of videos. Calls for
+    the same videos while they're being requested share that request
 
     input:
-    A YouTube playlist - A dictionary of playlist videos
+    Up to 50 video ids - list of strings
     A build object for the YouTube api
 
     output:
-    The total time of all the videos given in seconds - int
+    If theres an error retrieving the videos - an error will be raised
+    The YouTube formatted duration of each video found - dict of strings
     """
-    video_ids = [item["snippet"]["resourceId"]["videoId"] for item in playlist["items"]]
+    return VIDEO_CHUNK_FLIGHT.do(
+        frozenset(video_ids), _request_chunk_durations, video_ids, youtube
+    )
 
-    videos = get_videos(video_ids, youtube)
 
-    videos_response = videos.execute()
+def _request_chunk_durations(video_ids, youtube):
+    try:
+        with _borrow_http() as http:
+            response = get_scheduler(youtube).execute(
+                get_videos(video_ids, youtube), "videos.list", http
+            )
 
-    playlist_times = [
-        item["contentDetails"]["duration"] for item in videos_response["items"]
-    ]
+    except HttpError:
+        raise Exception("Error getting videos")
+
+    return get_response_durations(response)
+
+
+def get_response_durations(response):
+    """
+    A function to get the durations from a videos().list response
+
+    input:
+    The response - dict
+
+    output:
+    The YouTube formatted duration of each video in it - dict of strings
+    """
+    return {
+        item["id"]: item["contentDetails"]["duration"] for item in response["items"]
+    }
+
+
+def get_batch_request(requests, callback):
+    """
+    A function to put requests into one batch HTTP request. The batch is sent
+    to the host the requests go to, so clients built for another api
+    endpoint batch there too, as new_batch_http_request always uses the
+    default endpoint. YouTube's batch path is "batch" at the root of the host
+
+    input:
+    The requests, keyed by request id - dict of
+    googleapiclient.http.HttpRequest
+    What to call with the request id, response and error of each request in
+    the batch - function
+
+    output:
+    The batch request - googleapiclient.http.BatchHttpRequest
+    """
+    from googleapiclient.http import BatchHttpRequest
+
+    url = urlparse(next(iter(requests.values())).uri)
+
+    batch = BatchHttpRequest(
+        callback=callback, batch_uri=f"{url.scheme}://{url.netloc}/batch"
+    )
+
+    for request_id, request in requests.items():
+        batch.add(request, request_id=request_id)
+
+    return batch
+
+
+def get_batch_durations(chunks, youtube):
+    """
+    A function to get the durations of several chunks of videos with one
+    batch HTTP request, which carries a videos().list request for each chunk
+    and so saves a round trip per chunk. Each request in a batch succeeds or
+    fails on its own: the chunks whose requests failed are requested again by
+    themselves, so their errors are retried, or raised, like any other
+    request's
+
+    input:
+    Chunks of up to 50 video ids - list of lists of strings
+    A build object for the YouTube api
+
+    output:
+    If theres an error retrieving the videos - an error will be raised
+    The YouTube formatted duration of each video found - dict of strings
+    """
+    responses = {}
+    failed_chunks = []
+
+    def collect(request_id, response, error):
+        if error is None:
+            responses[request_id] = response
+
+        else:
+            failed_chunks.append(chunks[int(request_id)])
+
+    batch = get_batch_request(
+        {str(index): get_videos(chunk, youtube) for index, chunk in enumerate(chunks)},
+        collect,
+    )
+
+    try:
+        with _borrow_http() as http:
+            get_scheduler(youtube).execute(
+                batch, "videos.list", http, requests=len(chunks)
+            )
+
+    except HttpError:
+        raise Exception("Error getting videos")
+
+    durations = {}
+
+    for response in responses.values():
+        durations.update(get_response_durations(response))
+
+    for chunk in failed_chunks:
+        durations.update(_request_chunk_durations(chunk, youtube))
+
+    return durations
+
+
+@timed("get_video_duration_map")
+def get_video_duration_map(video_ids, youtube, max_concurrency=None, cache=None):
+    """
+    A function to get the durations of any number of videos, keyed by video
+    id. Each distinct id is looked up once: the ids the cache doesn't have are
+    split into chunks of 50 and the chunks are requested in parallel, with at
+    most max_concurrency requests in flight at once. If HTTP_BATCH_SIZE is
+    set, see get_http_batch_size, that many chunks are sent in each batch
+    HTTP request instead of one request per chunk. New durations are stored
+    in the cache
+
+    input:
+    Video ids - iterable of strings
+    A build object for the YouTube api
+    The most requests to send at once, defaults to get_max_concurrency - int
+    A cache of durations to check first - DurationCache
+
+    output:
+    If theres an error retrieving the videos, or not enough quota is left to
+    get them - an error will be raised
+    The YouTube formatted duration of each video found. Videos the api
+    doesn't return, such as deleted or private ones, are left out - dict of
+    strings
+    """
+    if max_concurrency is None:
+        max_concurrency = get_max_concurrency()
 
-    converted_times = convert_times(playlist_times)
+    video_ids = list(dict.fromkeys(video_ids))
 
-    return sum(converted_times)
+    durations = cache.get_many(video_ids) if cache is not None else {}
+
+    missing_ids = [video_id for video_id in video_ids if video_id not in durations]
+
+    chunks = list(chunk_video_ids(missing_ids))
+
+    get_scheduler(youtube).check_budget(len(chunks) * QUOTA_COSTS["videos.list"])
+
+    batch_size = get_http_batch_size()
+
+    if batch_size > 1:
+        get_durations = get_batch_durations
+        requests = list(chunk_video_ids(chunks, batch_size))
+
+    else:
+        get_durations = get_chunk_durations
+        requests = chunks
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        fetched = {}
+
+        for request_durations in executor.map(
+            get_durations, requests, [youtube] * len(requests)
+        ):
+            fetched.update(request_durations)
+
+    if cache is not None and fetched:
+        cache.put_many(fetched)
+
+    durations.update(fetched)
+
+    return durations
+
+
+def get_video_durations(video_ids, youtube, max_concurrency=None, cache=None):
+    """
+    A function to get the durations of any number of videos in order, using
+    get_video_duration_map to look them up
+
+    input:
+    Video ids - iterable of strings
+    A build object for the YouTube api
+    The most requests to send at once, defaults to get_max_concurrency - int
+    A cache of durations to check first - DurationCache
+
+    output:
+    The YouTube formatted durations in the order of the ids given. Videos the
+    api doesn't return, such as deleted or private ones, are left out - list
+    of strings
+    """
+    video_ids = list(video_ids)
+
+    durations = get_video_duration_map(video_ids, youtube, max_concurrency, cache)
+
+    return [durations[video_id] for video_id in video_ids if video_id in durations]
+
+
+def load_playlist_durations(playlist, youtube, max_concurrency=None, cache=None):
+    """
+    A function to look up the durations of the videos in a playlist and fill
+    them in. Given a view, only the videos in the view are looked up
+
+    input:
+    A YouTube playlist, or a slice of one - Playlist
+    A build object for the YouTube api
+    The most requests to send at once, defaults to get_max_concurrency - int
+    A cache of durations to check first - DurationCache
+
+    output:
+    If theres an error retrieving the videos - an error will be raised
+    otherwise - None
+    """
+    durations = get_video_duration_map(
+        playlist.iter_video_ids(), youtube, max_concurrency, cache
+    )
+
+    playlist.set_durations(dict(zip(durations, parse_durations(durations.values()))))
+
+
+def get_duration_index(playlist, youtube, max_concurrency=None, cache=None):
+    """
+    A function to look up the duration of every video in a playlist and
+    build a running total of them, so the time left for any number of videos
+    watched can be worked out without the api
+
+    input:
+    A YouTube playlist - Playlist
+    A build object for the YouTube api
+    The most requests to send at once, defaults to get_max_concurrency - int
+    A cache of durations to check first - DurationCache
+
+    output:
+    If theres an error retrieving the videos - an error will be raised
+    The running total of the durations - DurationIndex
+    """
+    load_playlist_durations(playlist, youtube, max_concurrency, cache)
+
+    return playlist.duration_index()
+
+
+@timed("get_duration_stats")
+def get_duration_stats(
+    playlist_url, youtube, page_cache=None, cache=None, videos_watched=0, stats=None
+):
+    """
+    A function to get the stats of the durations of a playlist in one pass,
+    looking up the durations of each page of videos as soon as it arrives.
+    Only one page is held at a time, so any number of playlists can be summed
+    up in the same stats in bounded memory
+
+    input:
+    A YouTube playlist url or id - string
+    A build object for the YouTube api
+    A store of previously fetched pages - PageCache
+    A cache of durations to check first - DurationCache
+    The amount of videos watched, which are skipped - int
+    Stats to add the durations to, e.g. those of other playlists
+    - DurationStats
+
+    output:
+    If theres an error retrieving the playlist or its videos - an error will
+    be raised
+    The stats of the durations of the videos left. Videos the api doesn't
+    return, and ones lasting 0 seconds, are left out - DurationStats
+    """
+    if stats is None:
+        stats = DurationStats()
+
+    playlist_id = get_playlist_id(playlist_url)
+
+    to_skip = videos_watched
+
+    for page in get_playlist_pages(playlist_id, youtube, page_cache):
+        video_ids = list(iter_video_ids(page.get("items", [])))
+
+        skipped = min(to_skip, len(video_ids))
+        to_skip -= skipped
+        video_ids = video_ids[skipped:]
+
+        if not video_ids:
+            continue
+
+        durations = get_video_duration_map(video_ids, youtube, 1, cache)
+
+        seconds = dict(zip(durations, parse_durations(durations.values())))
+
+        stats.update(
+            seconds[video_id] for video_id in video_ids if seconds.get(video_id)
+        )
+
+    return stats
+
+
+def get_playlist_runtime(playlist, youtube, max_concurrency=None, cache=None):
+    """
+    A function to take a given playlist and find out the total runtime of all the
+    videos in that playlist
+
+    input:
+    A YouTube playlist - Playlist, or a dictionary of playlist videos
+    A build object for the YouTube api
+    The most requests to send at once, defaults to get_max_concurrency - int
+    A cache of durations to check first - DurationCache
+
+    output:
+    The total time of all the videos given in seconds - int
+    """
+    if not isinstance(playlist, Playlist):
+        playlist = Playlist.from_items(playlist["items"])
+
+    load_playlist_durations(playlist, youtube, max_concurrency, cache)
+
+    return playlist.runtime
 
 
 def get_average_video_runtime(runtime, video_count):
@@ -168,55 +1061,161 @@ def get_average_video_runtime(runtime, video_count):
     return str(datetime.timedelta(seconds=average_video_runtime))
 
 
-def no_videos_watched(playlist, playlist_length, youtube):
+@dataclass
+class PlaylistStats:
+    """
+    The result of analysing a playlist: how many videos it has, how many are
+    left after the ones watched, and the runtime of the videos left in
+    seconds. durations has the median, percentiles and histogram of the
+    durations of the videos left, when they were looked up. Stats answered
+    from stored data rather than the api have the age of the data in
+    seconds. If the playlist couldn't be analysed, error says why
     """
-    A function for if the user hasn't watched any of the videos in the
-    playlist
+
+    playlist_id: str = None
+    video_count: int = 0
+    videos_watched: int = 0
+    videos_left: int = 0
+    runtime: int = 0
+    error: str = None
+    durations: DurationStats = field(default=None, compare=False, repr=False)
+    age: float = field(default=None, compare=False)
+
+    @property
+    def average_runtime(self):
+        if self.durations is not None:
+            return self.durations.mean or 0
+
+        return self.runtime / self.videos_left if self.videos_left else 0
+
+
+def get_playlist_stats(
+    playlist,
+    youtube,
+    videos_watched=0,
+    cache=None,
+    playlist_runtime=None,
+    playlist_id=None,
+    video_count=None,
+    duration_index=None,
+    durations=None,
+):
+    """
+    A function to work out the stats of a playlist without printing anything.
+    For a Playlist, the durations of every video are looked up once and the
+    time left comes from their running total
 
     input:
-    A YouTube playlist - A dictionary of playlist videos
-    The number of items in the playlist - int
-    A build object for the YouTube
+    A YouTube playlist - Playlist, or a dictionary of playlist videos
+    A build object for the YouTube api
+    The amount of videos watched - int
+    A cache of durations to check first - DurationCache
+    The runtime of the videos left if it's already known - int
+    The id of the playlist - string
+    The number of items in the playlist, defaults to the number given - int
+    The running total of the playlist's durations, if it's already been
+    built - DurationIndex
+    The distribution of the durations of the videos left, if it's already
+    been worked out - DurationStats
 
     output:
-    prints to the screen information about the playlist
+    The stats of the playlist. For a Playlist whose runtime wasn't given,
+    they include the distribution of the durations of the videos left
+    - PlaylistStats
     """
-    playlist_runtime = get_playlist_runtime(playlist, youtube)
+    if isinstance(playlist, Playlist):
+        video_items = playlist
+
+        if playlist_id is None:
+            playlist_id = playlist.playlist_id
+
+        if playlist_runtime is None:
+            if duration_index is None:
+                duration_index = get_duration_index(playlist, youtube, cache=cache)
 
-    average_video_runtime = get_average_video_runtime(playlist_runtime, playlist_length)
+            playlist_runtime = duration_index.time_left(videos_watched)
 
-    print("No videos watched")
+            if durations is None:
+                durations = DurationStats.from_playlist(playlist[videos_watched:])
 
-    print("Total playlist runtime: ", str(datetime.timedelta(seconds=playlist_runtime)))
+    else:
+        video_items = playlist["items"]
 
-    print("Average video runtime: ", average_video_runtime)
+        if playlist_runtime is None:
+            playlist_runtime = get_playlist_runtime(
+                {"items": video_items[videos_watched:]}, youtube, cache=cache
+            )
 
-    print("Playlist length: ", playlist_length)
+    if video_count is None:
+        video_count = len(video_items)
 
+    return PlaylistStats(
+        playlist_id=playlist_id,
+        video_count=video_count,
+        videos_watched=videos_watched,
+        videos_left=max(len(video_items) - videos_watched, 0),
+        runtime=playlist_runtime,
+        durations=durations,
+    )
 
-def has_watched_videos(playlist, playlist_length, youtube, videos_watched):
+
+def no_videos_watched(
+    playlist, playlist_length, youtube, cache=None, playlist_runtime=None
+):
     """
-    A function for if the user has watched videos in the
+    A function for if the user hasn't watched any of the videos in the
     playlist
 
     input:
     A YouTube playlist - A dictionary of playlist videos
     The number of items in the playlist - int
     A build object for the YouTube
-    The amount of videos watched - int
+    A cache of durations to check first - DurationCache
+    The runtime if it's already known, e.g. from the async client - int
 
     output:
     prints to the screen information about the playlist
     """
-    remaining_items = playlist["items"][videos_watched:]
+    from src.formatters import format_text
+
+    stats = get_playlist_stats(
+        playlist,
+        youtube,
+        cache=cache,
+        playlist_runtime=playlist_runtime,
+        video_count=playlist_length,
+    )
+
+    print(format_text(stats))
+
+
+def has_watched_videos(
+    playlist,
+    playlist_length,
+    youtube,
+    videos_watched,
+    cache=None,
+    playlist_runtime=None,
+):
+    """
+    A function for if the user has watched videos in the
+    playlist
 
-    updated_playlist = {**playlist, "items": remaining_items}
+    input:
+    A YouTube playlist - A dictionary of playlist videos
+    The number of items in the playlist - int
+    A build object for the YouTube
+    The amount of videos watched - int
+    A cache of durations to check first - DurationCache
+    The runtime of the videos left if it's already known - int
 
-    playlist_length = len(remaining_items)
+    output:
+    prints to the screen information about the playlist
+    """
+    from src.formatters import format_text
 
-    playlist_runtime = get_playlist_runtime(updated_playlist, youtube)
-    average_video_runtime = get_average_video_runtime(playlist_runtime, playlist_length)
+    stats = get_playlist_stats(
+        playlist, youtube, videos_watched, cache, playlist_runtime
+    )
 
-    print("Playlist time left: ", str(datetime.timedelta(seconds=playlist_runtime)))
-    print("Average runtime of videos left: ", average_video_runtime)
-    print("Videos left: ", playlist_length)
+    print(format_text(stats))
@@ -0,0 +1,14 @@
+import pytest
+from src.metrics import get_metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """
+    Starts and ends every test with empty shared metrics
+    """
+    get_metrics().reset()
+
+    yield
+
+    get_metrics().reset()
@@ -0,0 +1,179 @@
+import math
+import asyncio
+import pytest
+from unittest.mock import patch
+from benchmarks.fake_youtube import make_fake_server
+from src.cache import DurationCache, PageCache
+from src.async_utils import (
+    AsyncYouTubeClient,
+    get_playlist_page_async,
+    get_playlist_pages_async,
+    get_video_durations_async,
+    get_playlist_and_runtime_async,
+)
+
+
+async def collect_pages(fake, playlist_id):
+    async with AsyncYouTubeClient("test_key", fake.url, 4) as client:
+        return [page async for page in get_playlist_pages_async(playlist_id, client)]
+
+
+async def analyse(fake, videos_watched=0, cache=None, page_cache=None):
+    async with AsyncYouTubeClient("test_key", fake.url, 4) as client:
+        return await get_playlist_and_runtime_async(
+            "https://youtube.com/list=playlist-id",
+            client,
+            videos_watched,
+            cache,
+            page_cache,
+        )
+
+
+async def get_first_page(fake, page_cache):
+    async with AsyncYouTubeClient("test_key", fake.url, 4) as client:
+        return await get_playlist_page_async("playlist-id", client, None, page_cache)
+
+
+class TestGetPlaylistPageAsync:
+    """
+    Class to test the get_playlist_page_async function
+    """
+
+    def test_unchanged_page_served_from_cache(self, tmp_path):
+        """
+        Testing that the stored page is returned when YouTube replies 304 Not
+        Modified, and that it's marked as just fetched
+        """
+        page_cache = PageCache(
+            tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000
+        )
+
+        with make_fake_server(10) as fake:
+            with patch("src.cache.time.time", return_value=1000):
+                page = asyncio.run(get_first_page(fake, page_cache))
+
+            result = asyncio.run(get_first_page(fake, page_cache))
+
+        assert result == page
+        assert page_cache.get_stored_page("playlist-id")[1] > 1000
+
+        page_cache.close()
+
+
+class TestGetPlaylistPagesAsync:
+    """
+    Class to test the get_playlist_pages_async function
+    """
+
+    def test_every_page_followed(self):
+        """
+        Testing that every page of the playlist is yielded in order
+        """
+        with make_fake_server(120) as fake:
+            pages = asyncio.run(collect_pages(fake, "playlist-id"))
+
+        assert [len(page["items"]) for page in pages] == [50, 50, 20]
+        assert "nextPageToken" not in pages[-1]
+
+    def test_api_key_sent(self):
+        """
+        Testing that the api key is sent with every request
+        """
+        with make_fake_server(10) as fake:
+            asyncio.run(collect_pages(fake, "playlist-id"))
+
+        assert all(params["key"] == "test_key" for _, params in fake.requests)
+
+    def test_error_raised(self):
+        """
+        Testing that an error from the api raises the correct error
+        """
+        with make_fake_server(10) as fake:
+            with pytest.raises(Exception) as excinfo:
+                asyncio.run(collect_pages(fake, "missing-playlist"))
+
+        assert "Error getting playlist" in str(excinfo.value)
+
+
+class TestGetVideoDurationsAsync:
+    """
+    Class to test the get_video_durations_async function
+    """
+
+    def test_only_missing_ids_requested_in_chunks(self, tmp_path):
+        """
+        Testing that cached ids aren't requested and no request has more than
+        50 ids
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=1000)
+        cache.put_many({"v0": "PT0S"})
+
+        async def get_durations(fake):
+            async with AsyncYouTubeClient("test_key", fake.url, 4) as client:
+                return await get_video_durations_async(
+                    [f"v{n}" for n in range(120)], client, cache
+                )
+
+        with make_fake_server(120) as fake:
+            result = asyncio.run(get_durations(fake))
+
+        requested = [params["id"].split(",") for _, params in fake.requests]
+
+        assert result == {f"v{n}": f"PT{n}S" for n in range(120)}
+        assert sorted(len(ids) for ids in requested) == [19, 50, 50]
+        assert "v0" not in sum(requested, [])
+
+
+class TestGetPlaylistAndRuntimeAsync:
+    """
+    Class to test the get_playlist_and_runtime_async function
+    """
+
+    def test_runtime_of_whole_playlist(self):
+        """
+        Testing that the playlist is returned with the runtime of every video
+        """
+        with make_fake_server(120) as fake:
+            playlist, runtime = asyncio.run(analyse(fake))
+
+        assert playlist["pageInfo"]["totalResults"] == 120
+        assert len(playlist["items"]) == 120
+        assert runtime == sum(range(120))
+
+    def test_runtime_of_videos_left(self):
+        """
+        Testing that only the videos after videos_watched are counted
+        """
+        with make_fake_server(120) as fake:
+            _, runtime = asyncio.run(analyse(fake, videos_watched=100))
+
+        assert runtime == sum(range(100, 120))
+
+    def test_connections_reused(self):
+        """
+        Testing that requests share the pooled keep-alive connections
+        """
+        with make_fake_server(500, page_size=10) as fake:
+            asyncio.run(analyse(fake))
+
+        assert len(fake.connections) <= 4 < len(fake.requests)
+
+    def test_unchanged_pages_revalidated(self, tmp_path):
+        """
+        Testing that a second run revalidates pages with their etags and gets
+        its durations from the cache
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=1000)
+        page_cache = PageCache(
+            tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000
+        )
+
+        with make_fake_server(120) as fake:
+            asyncio.run(analyse(fake, cache=cache, page_cache=page_cache))
+
+            fake.requests.clear()
+
+            _, runtime = asyncio.run(analyse(fake, cache=cache, page_cache=page_cache))
+
+        assert runtime == sum(range(120))
+        assert [resource for resource, _ in fake.requests] == ["playlistItems"] * 3
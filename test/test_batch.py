@@ -0,0 +1,379 @@
+import io
+import json
+from unittest.mock import Mock, patch
+from googleapiclient.errors import HttpError
+from src.keys import KeyPool
+from src.scheduler import is_key_error
+from src.snapshot import Snapshot, get_snapshot_path
+from src.stats import DurationStats
+from src.utils import PlaylistStats, VIDEO_FIELDS
+from src.batch import (
+    read_playlist_urls,
+    analyse_channel,
+    analyse_playlists,
+    analyse_playlists_sharded,
+)
+
+
+def make_mock_youtube(playlists):
+    """
+    Builds a mock YouTube api serving the given playlists, a dict of playlist
+    id to video ids, in pages of 2, where video "v<n>" lasts n seconds
+    """
+    mock_youtube = Mock()
+
+    def mock_playlist_items(part, fields, playlistId, maxResults, pageToken="0"):
+        request = Mock()
+        start = int(pageToken)
+        end = start + 2
+        video_ids = playlists[playlistId]
+        page = {
+            "items": [
+                {"snippet": {"resourceId": {"videoId": video_id}}}
+                for video_id in video_ids[start:end]
+            ]
+        }
+
+        if end < len(video_ids):
+            page["nextPageToken"] = str(end)
+
+        request.execute.return_value = page
+        return request
+
+    def mock_videos(part, id, fields):
+        request = Mock()
+        request.execute.return_value = {
+            "items": [
+                {"id": video_id, "contentDetails": {"duration": f"PT{video_id[1:]}S"}}
+                for video_id in id
+            ]
+        }
+        return request
+
+    mock_youtube.playlistItems.return_value.list.side_effect = mock_playlist_items
+    mock_youtube.videos.return_value.list.side_effect = mock_videos
+
+    return mock_youtube
+
+
+class TestReadPlaylistUrls:
+    """
+    Class to test the read_playlist_urls function
+    """
+
+    def test_blank_and_comment_lines_skipped(self):
+        """
+        Testing that only the urls are read, without surrounding whitespace
+        """
+        lines = io.StringIO("# nightly\nhttps://youtube.com/list=a\n\n  url2  \n")
+
+        result = list(read_playlist_urls(lines))
+
+        assert result == ["https://youtube.com/list=a", "url2"]
+
+
+class TestAnalysePlaylists:
+    """
+    Class to test the analyse_playlists function
+    """
+
+    def test_results_for_each_playlist(self):
+        """
+        Testing that each playlist gets its own runtime and length
+        """
+        mock_youtube = make_mock_youtube({"a": ["v1", "v2", "v3"], "b": ["v10"]})
+
+        result = analyse_playlists(
+            ["https://youtube.com/list=a", "https://youtube.com/list=b"], mock_youtube
+        )
+
+        assert result == [
+            PlaylistStats("a", video_count=3, videos_left=3, runtime=6),
+            PlaylistStats("b", video_count=1, videos_left=1, runtime=10),
+        ]
+
+    def test_videos_watched_skipped(self):
+        """
+        Testing that only the videos after videos_watched are counted or
+        looked up
+        """
+        mock_youtube = make_mock_youtube({"a": ["v1", "v2", "v3"]})
+
+        result = analyse_playlists(
+            ["https://youtube.com/list=a"], mock_youtube, videos_watched=2
+        )
+
+        mock_youtube.videos.return_value.list.assert_called_once_with(
+            part="contentDetails", id=["v3"], fields=VIDEO_FIELDS
+        )
+
+        assert result == [
+            PlaylistStats(
+                "a", video_count=3, videos_watched=2, videos_left=1, runtime=3
+            )
+        ]
+
+    def test_shared_videos_resolved_once(self):
+        """
+        Testing that videos in several playlists are only requested once
+        """
+        mock_youtube = make_mock_youtube(
+            {"a": ["v1", "v2", "v3"], "b": ["v2", "v3", "v4"], "c": ["v1", "v4"]}
+        )
+
+        analyse_playlists(
+            [f"https://youtube.com/list={playlist_id}" for playlist_id in "abc"],
+            mock_youtube,
+        )
+
+        calls = mock_youtube.videos.return_value.list.call_args_list
+        requested = [video_id for call in calls for video_id in call.kwargs["id"]]
+
+        assert sorted(requested) == ["v1", "v2", "v3", "v4"]
+
+    def test_repeated_playlists_analysed_once(self):
+        """
+        Testing that a playlist listed twice is only fetched and reported once
+        """
+        mock_youtube = make_mock_youtube({"a": ["v1"]})
+
+        result = analyse_playlists(
+            ["https://youtube.com/list=a", "https://youtu.be/list=a&index=2"],
+            mock_youtube,
+        )
+
+        assert result == [PlaylistStats("a", video_count=1, videos_left=1, runtime=1)]
+
+    def test_errors_reported_per_playlist(self):
+        """
+        Testing that an invalid url doesn't stop the other playlists
+        """
+        mock_youtube = make_mock_youtube({"a": ["v1"]})
+
+        result = analyse_playlists(
+            ["https://example.com", "https://youtube.com/list=a"], mock_youtube
+        )
+
+        assert result == [
+            PlaylistStats("https://example.com", error="Invalid URL"),
+            PlaylistStats("a", video_count=1, videos_left=1, runtime=1),
+        ]
+
+
+class TestAnalysePlaylistsSnapshots:
+    """
+    Class to test saving snapshots from analyse_playlists
+    """
+
+    def test_snapshots_have_every_duration(self, tmp_path):
+        """
+        Testing that each playlist is saved with the durations of the watched
+        videos too, while the stats still skip them
+        """
+        mock_youtube = make_mock_youtube({"a": ["v1", "v2", "v3"]})
+
+        result = analyse_playlists(
+            ["a"], mock_youtube, videos_watched=2, snapshot_dir=tmp_path
+        )
+
+        assert result[0].runtime == 3
+
+        with Snapshot(get_snapshot_path(tmp_path, "a")) as snapshot:
+            assert list(snapshot.playlist.durations) == [1, 2, 3]
+
+
+class TestAnalyseChannel:
+    """
+    Class to test the analyse_channel function
+    """
+
+    def test_playlists_and_channel_total(self):
+        """
+        Testing that each of the channel's playlists is analysed, and that
+        the channel total counts videos shared between playlists once
+        """
+        channel_id = "UC" + "c" * 22
+        mock_youtube = make_mock_youtube(
+            {"a": ["v1", "v2", "v3"], "b": ["v2", "v3", "v4"]}
+        )
+        mock_request = mock_youtube.playlists.return_value.list.return_value
+        mock_request.execute.return_value = {"items": [{"id": "a"}, {"id": "b"}]}
+
+        results, channel_stats = analyse_channel(channel_id, mock_youtube)
+
+        assert results == [
+            PlaylistStats("a", video_count=3, videos_left=3, runtime=6),
+            PlaylistStats("b", video_count=3, videos_left=3, runtime=9),
+        ]
+        assert channel_stats == PlaylistStats(
+            channel_id, video_count=4, videos_left=4, runtime=10
+        )
+        assert channel_stats.durations.max == 4
+
+        calls = mock_youtube.videos.return_value.list.call_args_list
+        requested = [video_id for call in calls for video_id in call.kwargs["id"]]
+
+        assert sorted(requested) == ["v1", "v2", "v3", "v4"]
+
+    def test_videos_watched_skipped(self):
+        """
+        Testing that the channel total only has the videos left in each
+        playlist
+        """
+        channel_id = "UC" + "c" * 22
+        mock_youtube = make_mock_youtube({"a": ["v1", "v2"], "b": ["v3", "v4"]})
+        mock_request = mock_youtube.playlists.return_value.list.return_value
+        mock_request.execute.return_value = {"items": [{"id": "a"}, {"id": "b"}]}
+
+        _, channel_stats = analyse_channel(channel_id, mock_youtube, videos_watched=1)
+
+        assert channel_stats.video_count == 2
+        assert channel_stats.runtime == 6
+
+    def test_merged_total_matches_distinct_videos(self):
+        """
+        Testing that the channel's distribution, merged from its playlists',
+        is the same as that of its distinct videos, whether or not they
+        repeat within or across playlists
+        """
+        channel_id = "UC" + "c" * 22
+        mock_youtube = make_mock_youtube(
+            {
+                "a": ["v10", "v20"],
+                "b": ["v30", "v30", "v40"],
+                "c": ["v50", "v60"],
+                "d": ["v60", "v70"],
+            }
+        )
+        mock_request = mock_youtube.playlists.return_value.list.return_value
+        mock_request.execute.return_value = {
+            "items": [{"id": "a"}, {"id": "b"}, {"id": "c"}, {"id": "d"}]
+        }
+
+        _, channel_stats = analyse_channel(channel_id, mock_youtube)
+
+        expected = DurationStats()
+        expected.update([10, 20, 30, 40, 50, 60, 70])
+
+        assert channel_stats.video_count == 7
+        assert channel_stats.durations.to_dict() == expected.to_dict()
+
+
+def make_quota_error():
+    """
+    Builds the error YouTube gives when a key's daily quota has run out
+    """
+    content = json.dumps({"error": {"errors": [{"reason": "quotaExceeded"}]}})
+
+    return HttpError(resp=Mock(status=403), content=content.encode())
+
+
+def make_exhausted_youtube():
+    """
+    Builds a mock YouTube api whose key's daily quota has run out
+    """
+    mock_youtube = Mock()
+    mock_youtube.playlistItems.return_value.list.return_value.execute.side_effect = (
+        make_quota_error()
+    )
+
+    return mock_youtube
+
+
+class TestAnalysePlaylistsSharded:
+    """
+    Class to test the analyse_playlists_sharded function
+    """
+
+    playlists = {"a": ["v1", "v2"], "b": ["v3"], "c": ["v4"], "d": ["v5", "v6"]}
+
+    def test_playlists_spread_across_keys(self, tmp_path):
+        """
+        Testing that every key gets a share of the playlists
+        """
+        clients = {
+            "key-1": make_mock_youtube(self.playlists),
+            "key-2": make_mock_youtube(self.playlists),
+        }
+        key_pool = KeyPool(list(clients), tmp_path / "cache.sqlite3")
+
+        with patch("src.keys.get_youtube_client", side_effect=clients.get):
+            result = analyse_playlists_sharded("abcd", key_pool)
+
+        key_pool.close()
+
+        assert [stats.runtime for stats in result] == [3, 3, 4, 11]
+
+        for mock_youtube in clients.values():
+            assert mock_youtube.playlistItems.return_value.list.call_count == 2
+
+    def test_work_moves_off_exhausted_key(self, tmp_path):
+        """
+        Testing that the playlists of a key whose quota runs out are analysed
+        with the other keys, in the order given
+        """
+        clients = {
+            "key-1": make_mock_youtube(self.playlists),
+            "key-2": make_exhausted_youtube(),
+        }
+        key_pool = KeyPool(list(clients), tmp_path / "cache.sqlite3")
+
+        with patch("src.keys.get_youtube_client", side_effect=clients.get):
+            result = analyse_playlists_sharded(
+                ["a", "https://example.com", "b", "c", "d"], key_pool
+            )
+
+        assert result == [
+            PlaylistStats("a", video_count=2, videos_left=2, runtime=3),
+            PlaylistStats("https://example.com", error="Invalid URL"),
+            PlaylistStats("b", video_count=1, videos_left=1, runtime=3),
+            PlaylistStats("c", video_count=1, videos_left=1, runtime=4),
+            PlaylistStats("d", video_count=2, videos_left=2, runtime=11),
+        ]
+        assert key_pool.available_keys() == ["key-1"]
+
+        key_pool.close()
+
+    def test_work_moves_off_key_exhausted_looking_up_durations(self, tmp_path):
+        """
+        Testing that the playlists of a key whose quota runs out while their
+        durations are looked up are analysed with the other keys
+        """
+        exhausted_youtube = make_mock_youtube(self.playlists)
+        exhausted_youtube.videos.return_value.list.side_effect = None
+        exhausted_youtube.videos.return_value.list.return_value.execute.side_effect = (
+            make_quota_error()
+        )
+
+        clients = {
+            "key-1": exhausted_youtube,
+            "key-2": make_mock_youtube(self.playlists),
+        }
+        key_pool = KeyPool(list(clients), tmp_path / "cache.sqlite3")
+
+        with patch("src.keys.get_youtube_client", side_effect=clients.get):
+            result = analyse_playlists_sharded("abcd", key_pool)
+
+        assert [stats.error for stats in result] == [None] * 4
+        assert [stats.runtime for stats in result] == [3, 3, 4, 11]
+        assert key_pool.available_keys() == ["key-2"]
+
+        key_pool.close()
+
+    def test_error_kept_when_no_keys_left(self, tmp_path):
+        """
+        Testing that playlists keep their quota error once every key has been
+        tried
+        """
+        key_pool = KeyPool(["key-1"], tmp_path / "cache.sqlite3")
+
+        with patch(
+            "src.keys.get_youtube_client", return_value=make_exhausted_youtube()
+        ):
+            result = analyse_playlists_sharded(["a", "b"], key_pool)
+
+        key_pool.close()
+
+        assert len(result) == 2
+        assert any("daily quota has run out" in stats.error for stats in result)
+        assert all(is_key_error(stats.error) for stats in result)
@@ -0,0 +1,350 @@
+import math
+import sqlite3
+import pytest
+from unittest.mock import Mock, patch
+from googleapiclient.errors import HttpError
+from src.cache import DurationCache, PageCache, get_cache_dir
+from src.utils import VIDEO_FIELDS, get_playlist_page, get_video_durations
+
+
+class TestGetCacheDir:
+    """
+    Class to test the get_cache_dir function
+    """
+
+    def test_cache_dir_read_from_env_and_created(self, monkeypatch, tmp_path):
+        """
+        Testing that get_cache_dir uses CACHE_DIR and creates it
+        """
+        cache_dir = tmp_path / "cache"
+        monkeypatch.setenv("CACHE_DIR", str(cache_dir))
+
+        result = get_cache_dir()
+
+        assert result == str(cache_dir)
+        assert cache_dir.is_dir()
+
+
+class TestDurationCache:
+    """
+    Class to test the DurationCache class
+    """
+
+    def test_put_then_get(self, tmp_path):
+        """
+        Testing that stored durations are returned and unknown ids are left out
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+
+        cache.put_many({"a": "PT1S", "b": "PT2S"})
+
+        assert cache.get_many(["a", "b", "c"]) == {"a": "PT1S", "b": "PT2S"}
+
+    def test_cache_persists_between_connections(self, tmp_path):
+        """
+        Testing that durations are still there after the cache is reopened
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+        cache.put_many({"a": "PT1S"})
+        cache.close()
+
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+
+        assert cache.get_many(["a"]) == {"a": "PT1S"}
+
+    def test_expired_entries_missing(self, tmp_path):
+        """
+        Testing that entries older than the ttl aren't returned
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_many({"a": "PT1S"})
+
+        with patch("src.cache.time.time", return_value=1061):
+            assert cache.get_many(["a"]) == {}
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        """
+        Testing that the least recently used entries are evicted once the
+        cache is full
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=600, max_entries=2)
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_many({"a": "PT1S", "b": "PT2S"})
+
+        with patch("src.cache.time.time", return_value=1001):
+            cache.get_many(["a"])
+
+        with patch("src.cache.time.time", return_value=1002):
+            cache.put_many({"c": "PT3S"})
+
+        with patch("src.cache.time.time", return_value=1003):
+            result = cache.get_many(["a", "b", "c"])
+
+        assert len(cache) == 2
+        assert result == {"a": "PT1S", "c": "PT3S"}
+
+    def test_no_limit(self, tmp_path):
+        """
+        Testing that nothing is evicted when max_entries is 0
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=0)
+
+        cache.put_many({"a": "PT1S", "b": "PT2S"})
+
+        assert len(cache) == 2
+        assert cache.get_many(["a", "b"]) == {"a": "PT1S", "b": "PT2S"}
+
+    def test_get_many_handles_large_batches(self, tmp_path):
+        """
+        Testing that lookups of more ids than SQLite allows in one query work
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=5000)
+        durations = {f"v{n}": f"PT{n}S" for n in range(2000)}
+
+        cache.put_many(durations)
+
+        assert cache.get_many(durations) == durations
+
+    def test_ttl_overridden(self, tmp_path):
+        """
+        Testing that expired entries are returned when a longer ttl is given
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_many({"a": "PT1S"})
+
+        with patch("src.cache.time.time", return_value=5000):
+            assert cache.get_many(["a"], ttl=float("inf")) == {"a": "PT1S"}
+
+
+class TestGetVideoDurationsWithCache:
+    """
+    Class to test get_video_durations when given a DurationCache
+    """
+
+    def test_only_missing_ids_requested(self, tmp_path):
+        """
+        Testing that cached videos aren't requested again and that new
+        durations are stored
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+        cache.put_many({"a": "PT1S"})
+
+        mock_youtube = Mock()
+        mock_request = mock_youtube.videos.return_value.list.return_value
+        mock_request.execute.return_value = {
+            "items": [{"id": "b", "contentDetails": {"duration": "PT2S"}}]
+        }
+
+        result = get_video_durations(["a", "b", "a"], mock_youtube, 2, cache)
+
+        mock_youtube.videos.return_value.list.assert_called_once_with(
+            part="contentDetails", id=["b"], fields=VIDEO_FIELDS
+        )
+
+        assert result == ["PT1S", "PT2S", "PT1S"]
+        assert cache.get_many(["b"]) == {"b": "PT2S"}
+
+    def test_no_request_when_everything_cached(self, tmp_path):
+        """
+        Testing that no api request is made when every duration is cached
+        """
+        cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+        cache.put_many({"a": "PT1S", "b": "PT2S"})
+
+        mock_youtube = Mock()
+
+        result = get_video_durations(["a", "b"], mock_youtube, 2, cache)
+
+        mock_youtube.videos.return_value.list.assert_not_called()
+
+        assert result == ["PT1S", "PT2S"]
+
+
+class TestPageCache:
+    """
+    Class to test the PageCache class
+    """
+
+    def test_put_then_get(self, tmp_path):
+        """
+        Testing that a stored page is returned for the same playlist and token
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        page = {"etag": "e1", "items": [1, 2]}
+
+        cache.put_page("playlist-id", None, page)
+
+        assert cache.get_page("playlist-id") == page
+        assert cache.get_page("playlist-id", "token") is None
+
+    def test_pages_without_etag_not_stored(self, tmp_path):
+        """
+        Testing that pages that can't be revalidated aren't stored
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+
+        cache.put_page("playlist-id", None, {"items": [1, 2]})
+
+        assert cache.get_page("playlist-id") is None
+
+    def test_stored_page_with_fetch_time(self, tmp_path):
+        """
+        Testing that a stored page is returned with when it was fetched, and
+        touching it moves that time on
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        page = {"etag": "e1", "items": [1, 2]}
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_page("playlist-id", None, page)
+
+        assert cache.get_stored_page("playlist-id") == (page, 1000)
+
+        with patch("src.cache.time.time", return_value=2000):
+            cache.touch_page("playlist-id")
+
+        assert cache.get_stored_page("playlist-id") == (page, 2000)
+        assert cache.get_stored_page("playlist-id", "token") is None
+
+    def test_field_masks_stored_apart(self, tmp_path):
+        """
+        Testing that pages requested with different field masks don't replace
+        each other
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        plain_page = {"etag": "e1", "items": [1]}
+        rich_page = {"etag": "e2", "items": [{"snippet": {}}]}
+
+        cache.put_page("playlist-id", None, plain_page)
+        cache.put_page("playlist-id", None, rich_page, fields="")
+
+        assert cache.get_page("playlist-id") == plain_page
+        assert cache.get_page("playlist-id", fields="") == rich_page
+
+    def test_expired_pages_missing(self, tmp_path):
+        """
+        Testing that pages older than the ttl are treated as missing unless a
+        longer ttl is given
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=10)
+        page = {"etag": "e1", "items": [1]}
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_page("playlist-id", None, page)
+
+        with patch("src.cache.time.time", return_value=1061):
+            assert cache.get_page("playlist-id") is None
+            assert cache.get_stored_page("playlist-id", ttl=math.inf) == (page, 1000)
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        """
+        Testing that the least recently used pages are evicted once the store
+        is full
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=600, max_entries=2)
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_page("a", None, {"etag": "a"})
+            cache.put_page("b", None, {"etag": "b"})
+
+        with patch("src.cache.time.time", return_value=1001):
+            cache.get_page("a")
+
+        with patch("src.cache.time.time", return_value=1002):
+            cache.put_page("c", None, {"etag": "c"})
+
+        with patch("src.cache.time.time", return_value=1003):
+            assert len(cache) == 2
+            assert cache.get_page("b") is None
+            assert cache.get_page("a") == {"etag": "a"}
+
+    def test_old_store_replaced(self, tmp_path):
+        """
+        Testing that a page store from before pages were keyed by field mask
+        is replaced rather than breaking
+        """
+        path = tmp_path / "cache.sqlite3"
+
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "CREATE TABLE playlist_pages (playlist_id TEXT, page_token TEXT, "
+                "etag TEXT, page TEXT, fetched_at REAL)"
+            )
+
+        cache = PageCache(path, ttl=math.inf, max_entries=10)
+        cache.put_page("playlist-id", None, {"etag": "e1"})
+
+        assert cache.get_page("playlist-id") == {"etag": "e1"}
+
+
+class TestGetPlaylistPageWithCache:
+    """
+    Class to test get_playlist_page when given a PageCache
+    """
+
+    def test_unchanged_page_served_from_cache(self, tmp_path):
+        """
+        Testing that the stored etag is sent and the stored page is returned
+        when YouTube replies 304 Not Modified
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        page = {"etag": "e1", "items": [1, 2]}
+
+        with patch("src.cache.time.time", return_value=1000):
+            cache.put_page("playlist-id", None, page)
+
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems.return_value.list.return_value
+        mock_request.headers = {}
+        mock_request.execute.side_effect = HttpError(
+            resp=Mock(status=304), content=b""
+        )
+
+        result = get_playlist_page("playlist-id", mock_youtube, page_cache=cache)
+
+        assert mock_request.headers["If-None-Match"] == "e1"
+        assert result == page
+        assert cache.get_stored_page("playlist-id")[1] > 1000
+
+    def test_changed_page_replaces_stored_page(self, tmp_path):
+        """
+        Testing that a changed page is returned and replaces the stored one
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        cache.put_page("playlist-id", "token", {"etag": "e1", "items": [1]})
+
+        new_page = {"etag": "e2", "items": [1, 2]}
+
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems.return_value.list.return_value
+        mock_request.headers = {}
+        mock_request.execute.return_value = new_page
+
+        result = get_playlist_page(
+            "playlist-id", mock_youtube, "token", page_cache=cache
+        )
+
+        assert result == new_page
+        assert cache.get_page("playlist-id", "token") == new_page
+
+    def test_other_errors_raised(self, tmp_path):
+        """
+        Testing that errors other than 304 are still raised
+        """
+        cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+        cache.put_page("playlist-id", None, {"etag": "e1", "items": [1]})
+
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems.return_value.list.return_value
+        mock_request.headers = {}
+        mock_request.execute.side_effect = HttpError(
+            resp=Mock(status=404), content=b""
+        )
+
+        with pytest.raises(HttpError):
+            get_playlist_page("playlist-id", mock_youtube, page_cache=cache)
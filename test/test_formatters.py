@@ -0,0 +1,224 @@
+import io
+import csv
+import json
+import pytest
+from src.stats import DurationStats
+from src.utils import PlaylistStats
+from src.formatters import format_text, to_record, write_results
+
+
+class TestFormatText:
+    """
+    Class to test the format_text function
+    """
+
+    def test_no_videos_watched(self):
+        """
+        Testing the text for a playlist with no videos watched
+        """
+        stats = PlaylistStats("a", video_count=10, videos_left=10, runtime=600)
+
+        result = format_text(stats)
+
+        assert result.split("\n") == [
+            "Playlist:  a",
+            "No videos watched",
+            "Total playlist runtime:  0:10:00",
+            "Average video runtime:  0:01:00",
+            "Playlist length:  10",
+        ]
+
+    def test_videos_watched(self):
+        """
+        Testing the text for a playlist with videos watched
+        """
+        stats = PlaylistStats(
+            video_count=10, videos_watched=6, videos_left=4, runtime=120
+        )
+
+        result = format_text(stats)
+
+        assert result.split("\n") == [
+            "Playlist time left:  0:02:00",
+            "Average runtime of videos left:  0:00:30",
+            "Videos left:  4",
+        ]
+
+    def test_distribution(self):
+        """
+        Testing that the average is of the videos with a known duration, and
+        that the spread of the durations is shown when it was looked up
+        """
+        durations = DurationStats()
+        durations.update([60, 60, 60, 3420])
+
+        stats = PlaylistStats(
+            "a", video_count=5, videos_left=5, runtime=3600, durations=durations
+        )
+
+        result = format_text(stats).split("\n")
+
+        assert "Average video runtime:  0:15:00" in result
+        assert "Median video runtime:  0:01:00" in result
+        assert "Shortest video:  0:01:00" in result
+        assert "Longest video:  0:57:00" in result
+        assert "Videos up to 0:01:00:  3" in result
+        assert "Videos up to 1:00:00:  1" in result
+        assert "Videos up to 0:05:00:  0" not in result
+        assert result[-1] == "Playlist length:  5"
+
+    def test_empty_playlist(self):
+        """
+        Testing that an empty playlist doesn't divide by zero
+        """
+        result = format_text(PlaylistStats("a"))
+
+        assert "Average video runtime:  0:00:00" in result
+
+    def test_error(self):
+        """
+        Testing the text for a playlist that couldn't be analysed
+        """
+        stats = PlaylistStats("a", error="Error getting playlist")
+
+        assert format_text(stats) == "Playlist:  a\nError:  Error getting playlist"
+
+    def test_age(self):
+        """
+        Testing that the age of stored data is shown
+        """
+        stats = PlaylistStats("a", video_count=1, videos_left=1, runtime=60, age=3725.4)
+
+        assert format_text(stats).split("\n")[-1] == "Stored data age:  1:02:05"
+
+
+class TestToRecord:
+    """
+    Class to test the to_record function
+    """
+
+    def test_record_fields(self):
+        """
+        Testing that the stats are flattened into a record
+        """
+        stats = PlaylistStats(
+            "a", video_count=4, videos_watched=1, videos_left=3, runtime=100
+        )
+
+        assert to_record(stats) == {
+            "playlist_id": "a",
+            "video_count": 4,
+            "videos_watched": 1,
+            "videos_left": 3,
+            "runtime_seconds": 100,
+            "average_runtime_seconds": 33.333,
+            "runtime": "0:01:40",
+            "average_runtime": "0:00:33",
+            "min_runtime_seconds": None,
+            "median_runtime_seconds": None,
+            "p90_runtime_seconds": None,
+            "p99_runtime_seconds": None,
+            "max_runtime_seconds": None,
+            "videos_up_to_60_seconds": None,
+            "videos_up_to_300_seconds": None,
+            "videos_up_to_600_seconds": None,
+            "videos_up_to_1200_seconds": None,
+            "videos_up_to_1800_seconds": None,
+            "videos_up_to_3600_seconds": None,
+            "videos_up_to_7200_seconds": None,
+            "videos_up_to_10800_seconds": None,
+            "videos_over_10800_seconds": None,
+            "age_seconds": None,
+            "error": None,
+        }
+
+    def test_distribution_fields(self):
+        """
+        Testing that the spread of the durations is added to the record
+        """
+        durations = DurationStats()
+        durations.update([10, 20, 30])
+
+        stats = PlaylistStats("a", video_count=3, videos_left=3, runtime=60)
+        stats.durations = durations
+
+        result = to_record(stats)
+
+        assert result["min_runtime_seconds"] == 10
+        assert result["median_runtime_seconds"] == pytest.approx(20, rel=0.01)
+        assert result["max_runtime_seconds"] == 30
+        assert result["videos_up_to_60_seconds"] == 3
+        assert result["videos_over_10800_seconds"] == 0
+
+    def test_age_field(self):
+        """
+        Testing that the age of stored data is added to the record
+        """
+        stats = PlaylistStats(
+            "a", video_count=1, videos_left=1, runtime=60, age=5.12345
+        )
+
+        assert to_record(stats)["age_seconds"] == 5.123
+
+
+class TestWriteResults:
+    """
+    Class to test the write_results function
+    """
+
+    results = [
+        PlaylistStats("a", video_count=2, videos_left=2, runtime=60),
+        PlaylistStats("b", error="Error getting playlist"),
+    ]
+
+    def test_jsonl(self):
+        """
+        Testing that each result is written as a line of JSON
+        """
+        stream = io.StringIO()
+
+        write_results(iter(self.results), "jsonl", stream)
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+        assert lines[0]["playlist_id"] == "a"
+        assert lines[0]["runtime_seconds"] == 60
+        assert lines[1] == {"playlist_id": "b", "error": "Error getting playlist"}
+
+    def test_csv(self):
+        """
+        Testing that the results are written as CSV with a header
+        """
+        stream = io.StringIO()
+
+        write_results(self.results, "csv", stream)
+
+        rows = list(csv.DictReader(io.StringIO(stream.getvalue())))
+
+        assert rows[0]["playlist_id"] == "a"
+        assert rows[0]["average_runtime_seconds"] == "30.0"
+        assert rows[1]["error"] == "Error getting playlist"
+
+    def test_text(self):
+        """
+        Testing that the results are written as text separated by blank lines
+        """
+        stream = io.StringIO()
+
+        write_results(self.results, "text", stream)
+
+        assert stream.getvalue() == (
+            format_text(self.results[0])
+            + "\n\n"
+            + format_text(self.results[1])
+            + "\n\n"
+        )
+
+    def test_unknown_format_raises_exception(self):
+        """
+        Testing that an unknown format raises the expected error
+        """
+        with pytest.raises(Exception) as excinfo:
+            write_results(self.results, "xml", io.StringIO())
+
+        assert "Unknown output format: xml" in str(excinfo.value)
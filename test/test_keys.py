@@ -0,0 +1,70 @@
+from unittest.mock import Mock, patch
+from src.keys import KeyPool, get_key_label
+from src.scheduler import get_scheduler
+
+
+class TestGetKeyLabel:
+    """
+    Class to test the get_key_label function
+    """
+
+    def test_label_hides_key(self):
+        """
+        Testing that the label is short, stable and doesn't contain the key
+        """
+        label = get_key_label("secret-key")
+
+        assert len(label) == 12
+        assert label == get_key_label("secret-key")
+        assert "secret" not in label
+
+
+class TestKeyPool:
+    """
+    Class to test the KeyPool class
+    """
+
+    def test_each_key_has_its_own_quota(self, tmp_path):
+        """
+        Testing that units used by one key don't count against another
+        """
+        key_pool = KeyPool(["a", "b"], tmp_path / "cache.sqlite3")
+
+        key_pool.get_scheduler("a").execute(Mock(), "videos.list")
+
+        assert (
+            key_pool.get_scheduler("b").remaining_units
+            == key_pool.get_scheduler("a").remaining_units + 1
+        )
+        assert key_pool.available_keys() == ["b", "a"]
+
+        key_pool.close()
+
+    def test_clients_use_their_key_scheduler(self, tmp_path):
+        """
+        Testing that the requests of each key's client go through its
+        scheduler
+        """
+        key_pool = KeyPool(["a", "b"], tmp_path / "cache.sqlite3")
+        clients = {"a": Mock(), "b": Mock()}
+
+        with patch("src.keys.get_youtube_client", side_effect=clients.get):
+            youtube = key_pool.get_client("b")
+
+        assert youtube is clients["b"]
+        assert get_scheduler(youtube) is key_pool.get_scheduler("b")
+
+        key_pool.close()
+
+    def test_unavailable_keys_left_out(self, tmp_path):
+        """
+        Testing that rejected keys and keys marked unavailable aren't offered
+        """
+        key_pool = KeyPool(["a", "b", "c"], tmp_path / "cache.sqlite3")
+
+        key_pool.get_scheduler("a").rejected = True
+        key_pool.mark_unavailable("c")
+
+        assert key_pool.available_keys() == ["b"]
+
+        key_pool.close()
@@ -1,4 +1,14 @@
+import sys
+import json
+import pytest
+import subprocess
 from src.main import main
+from src.scheduler import set_scheduler
+from src.metrics import get_metrics
+from src.playlist import Playlist
+from src.snapshot import Snapshot, get_snapshot_path, write_snapshot
+from src.utils import PlaylistStats
+from benchmarks.fake_youtube import make_fake_server
 from unittest.mock import Mock, patch
 
 
@@ -7,6 +17,18 @@ class TestMain:
     Class to test the main function
     """
 
+    @pytest.fixture(autouse=True)
+    def cache_dir(self, monkeypatch, tmp_path):
+        """
+        Keeps the quota usage main records out of the real cache directory,
+        and puts the default scheduler back afterwards
+        """
+        monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+
+        yield
+
+        set_scheduler(None)
+
     def test_main_gets_api_key(self, monkeypatch):
         monkeypatch.setattr(
             "builtins.input",
@@ -16,17 +38,21 @@ class TestMain:
         mock_api_key = "test_key"
         monkeypatch.setattr("src.main.get_api_key", lambda: mock_api_key)
 
-        with patch("src.main.get_playlist") as mock_get_playlist, patch(
+        with patch("src.main.load_playlist") as mock_load_playlist, patch(
             "src.main.no_videos_watched"
-        ), patch("src.main.has_watched_videos"), patch("src.main.build") as mock_build:
+        ), patch("src.main.has_watched_videos"), patch(
+            "src.main.get_youtube_client"
+        ) as mock_build, patch(
+            "src.main.DurationCache"
+        ), patch(
+            "src.main.PageCache"
+        ):
 
-            mock_get_playlist.return_value = {"pageInfo": {"totalResults": 10}}
+            mock_load_playlist.return_value = Mock(total_results=10)
 
-            main()
+            main([])
 
-            mock_build.assert_called_once_with(
-                "youtube", "v3", developerKey=mock_api_key
-            )
+            mock_build.assert_called_once_with(mock_api_key)
 
     def test_main_gets_user_input_correctly(self, monkeypatch):
         """
@@ -41,21 +67,27 @@ class TestMain:
         mock_api_key = "test_key"
         monkeypatch.setattr("src.main.get_api_key", lambda: mock_api_key)
 
-        with patch("src.main.get_playlist") as mock_get_playlist, patch(
+        with patch("src.main.load_playlist") as mock_load_playlist, patch(
             "src.main.no_videos_watched"
-        ), patch("src.main.has_watched_videos"), patch("src.main.build") as mock_build:
+        ), patch("src.main.has_watched_videos"), patch(
+            "src.main.get_youtube_client"
+        ) as mock_build, patch(
+            "src.main.DurationCache"
+        ), patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
 
             mock_youtube_client = Mock()
             mock_build.return_value = mock_youtube_client
 
-            mock_get_playlist.return_value = {"pageInfo": {"totalResults": 10}}
+            mock_load_playlist.return_value = Mock(total_results=10)
 
-            main()
+            main([])
 
-        mock_build.assert_called_once_with("youtube", "v3", developerKey=mock_api_key)
+        mock_build.assert_called_once_with(mock_api_key)
 
-        mock_get_playlist.assert_called_once_with(
-            "https://test.com", mock_youtube_client
+        mock_load_playlist.assert_called_once_with(
+            "https://test.com", mock_youtube_client, mock_page_cache.return_value
         )
 
     def test_has_watched_videos_isnt_called(self, monkeypatch):
@@ -71,29 +103,37 @@ class TestMain:
         mock_api_key = "test_key"
         monkeypatch.setattr("src.main.get_api_key", lambda: mock_api_key)
 
-        with patch("src.main.get_playlist") as mock_get_playlist, patch(
+        with patch("src.main.load_playlist") as mock_load_playlist, patch(
             "src.main.no_videos_watched"
         ) as mock_no_videos, patch(
             "src.main.has_watched_videos"
         ) as mock_has_watched, patch(
-            "src.main.build"
-        ) as mock_build:
+            "src.main.get_youtube_client"
+        ) as mock_build, patch(
+            "src.main.DurationCache"
+        ) as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
 
             mock_youtube_client = Mock()
             mock_build.return_value = mock_youtube_client
 
-            mock_get_playlist.return_value = {"pageInfo": {"totalResults": 10}}
+            mock_load_playlist.return_value = Mock(total_results=10)
 
-            main()
+            main([])
 
-        mock_build.assert_called_once_with("youtube", "v3", developerKey=mock_api_key)
+        mock_build.assert_called_once_with(mock_api_key)
 
-        mock_get_playlist.assert_called_once_with(
-            "https://test.com", mock_youtube_client
+        mock_load_playlist.assert_called_once_with(
+            "https://test.com", mock_youtube_client, mock_page_cache.return_value
         )
 
         mock_no_videos.assert_called_once_with(
-            {"pageInfo": {"totalResults": 10}}, 10, mock_youtube_client
+            mock_load_playlist.return_value,
+            10,
+            mock_youtube_client,
+            mock_cache.return_value,
+            None,
         )
 
         mock_has_watched.assert_not_called()
@@ -111,29 +151,503 @@ class TestMain:
         mock_api_key = "test_key"
         monkeypatch.setattr("src.main.get_api_key", lambda: mock_api_key)
 
-        with patch("src.main.get_playlist") as mock_get_playlist, patch(
+        with patch("src.main.load_playlist") as mock_load_playlist, patch(
             "src.main.no_videos_watched"
         ) as mock_no_videos, patch(
             "src.main.has_watched_videos"
         ) as mock_has_watched, patch(
-            "src.main.build"
-        ) as mock_build:
+            "src.main.get_youtube_client"
+        ) as mock_build, patch(
+            "src.main.DurationCache"
+        ) as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
 
             mock_youtube_client = Mock()
             mock_build.return_value = mock_youtube_client
 
-            mock_get_playlist.return_value = {"pageInfo": {"totalResults": 10}}
+            mock_load_playlist.return_value = Mock(total_results=10)
 
-            main()
+            main([])
 
-        mock_build.assert_called_once_with("youtube", "v3", developerKey=mock_api_key)
+        mock_build.assert_called_once_with(mock_api_key)
 
-        mock_get_playlist.assert_called_once_with(
-            "https://test.com", mock_youtube_client
+        mock_load_playlist.assert_called_once_with(
+            "https://test.com", mock_youtube_client, mock_page_cache.return_value
         )
 
         mock_has_watched.assert_called_once_with(
-            {"pageInfo": {"totalResults": 10}}, 9, mock_youtube_client, 1
+            mock_load_playlist.return_value,
+            9,
+            mock_youtube_client,
+            1,
+            mock_cache.return_value,
+            None,
         )
 
         mock_no_videos.assert_not_called()
+
+    def test_async_mode_uses_async_client(self, monkeypatch, capsys):
+        """
+        Testing that with --async playlists given as urls or bare ids are
+        analysed with the async client, and no googleapiclient client is built
+        """
+        from src.async_utils import AsyncYouTubeClient
+
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        fake = make_fake_server(playlist_id="PLabc")
+
+        with fake, patch(
+            "src.async_utils.AsyncYouTubeClient",
+            lambda api_key: AsyncYouTubeClient(api_key, fake.url),
+        ), patch("src.main.get_youtube_client") as mock_build:
+
+            main(
+                [
+                    "--async",
+                    "--playlist",
+                    "https://www.youtube.com/playlist?list=PLabc",
+                    "--playlist",
+                    "PLabc",
+                    "--watched",
+                    "20",
+                    "--format",
+                    "jsonl",
+                ]
+            )
+
+        results = list(map(json.loads, capsys.readouterr().out.splitlines()))
+
+        mock_build.assert_not_called()
+
+        assert len(results) == 2
+
+        for result in results:
+            assert result["playlist_id"] == "PLabc"
+            assert result["error"] is None
+            assert result["videos_left"] == 100
+            assert result["runtime_seconds"] == sum(range(20, 120))
+
+    def test_batch_mode_reads_file(self, monkeypatch, tmp_path):
+        """
+        Testing that with --batch the urls are read from the file and nothing
+        is asked for
+        """
+        batch_file = tmp_path / "playlists.txt"
+        batch_file.write_text(
+            "https://youtube.com/list=a\nhttps://youtube.com/list=b\n"
+        )
+
+        monkeypatch.setattr("builtins.input", Mock(side_effect=AssertionError))
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+        monkeypatch.setattr("src.main.get_api_keys", lambda: ["test_key"])
+
+        with patch("src.main.analyse_playlists") as mock_analyse, patch(
+            "src.main.write_results"
+        ) as mock_write, patch("src.main.get_youtube_client") as mock_build, patch(
+            "src.main.DurationCache"
+        ) as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
+
+            main(["--batch", str(batch_file)])
+
+        mock_analyse.assert_called_once_with(
+            ["https://youtube.com/list=a", "https://youtube.com/list=b"],
+            mock_build.return_value,
+            mock_cache.return_value,
+            mock_page_cache.return_value,
+            videos_watched=0,
+            snapshot_dir=None,
+        )
+
+        mock_write.assert_called_once_with(mock_analyse.return_value, "text")
+
+    def test_batch_mode_shards_across_keys(self, monkeypatch, tmp_path):
+        """
+        Testing that with several api keys the batch is shared between them
+        """
+        batch_file = tmp_path / "playlists.txt"
+        batch_file.write_text("https://youtube.com/list=a\n")
+
+        monkeypatch.setattr("src.main.get_api_key", lambda: "key-a")
+        monkeypatch.setenv("API_KEYS", "key-a,key-b")
+
+        with patch("src.main.analyse_playlists_sharded") as mock_sharded, patch(
+            "src.main.write_results"
+        ), patch("src.main.DurationCache") as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache, patch(
+            "src.keys.QuotaUsage"
+        ):
+
+            main(["--batch", str(batch_file), "--processes", "2"])
+
+        args, kwargs = mock_sharded.call_args
+
+        assert args[0] == ["https://youtube.com/list=a"]
+        assert args[1].api_keys == ["key-a", "key-b"]
+        assert args[2:] == (mock_cache.return_value, mock_page_cache.return_value)
+        assert kwargs == {"videos_watched": 0, "processes": 2, "snapshot_dir": None}
+
+    def test_channel_flag_writes_results(self, monkeypatch):
+        """
+        Testing that with --channel each playlist is written, followed by the
+        channel total, and a channel that fails doesn't stop the others
+        """
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        playlist_stats = PlaylistStats("a")
+        channel_stats = PlaylistStats("UCx")
+
+        def analyse_channel(channel, *args, **kwargs):
+            if channel == "@broken":
+                raise Exception("Channel not found")
+
+            return [playlist_stats], channel_stats
+
+        with patch("src.main.analyse_channel", side_effect=analyse_channel), patch(
+            "src.main.get_youtube_client"
+        ), patch("src.main.write_results") as mock_write, patch(
+            "src.main.DurationCache"
+        ), patch(
+            "src.main.PageCache"
+        ):
+
+            written = []
+            mock_write.side_effect = lambda results, output_format: written.extend(
+                results
+            )
+
+            main(["--channel", "@broken", "--channel", "UCx"])
+
+        assert written == [
+            PlaylistStats("@broken", error="Channel not found"),
+            playlist_stats,
+            channel_stats,
+        ]
+
+    def test_playlist_snapshot_saved(self, monkeypatch, tmp_path):
+        """
+        Testing that with --snapshot-dir each playlist analysed is saved
+        """
+        playlist = Playlist.from_items([{"contentDetails": {"videoId": "v1"}}], "a")
+        playlist.set_durations({"v1": 5})
+        snapshot_dir = tmp_path / "snapshots"
+
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        with patch("src.main.load_playlist", return_value=playlist), patch(
+            "src.main.get_playlist_stats"
+        ), patch("src.main.get_youtube_client"), patch(
+            "src.main.write_results",
+            side_effect=lambda results, output_format: list(results),
+        ), patch(
+            "src.main.DurationCache"
+        ), patch(
+            "src.main.PageCache"
+        ):
+
+            main(["--playlist", "a", "--snapshot-dir", str(snapshot_dir)])
+
+        with Snapshot(get_snapshot_path(snapshot_dir, "a")) as snapshot:
+            assert list(snapshot.playlist.durations) == [5]
+
+    def test_snapshots_analysed_without_api(self, monkeypatch, tmp_path):
+        """
+        Testing that --from-snapshots needs no api key or client
+        """
+        playlist = Playlist.from_items(
+            [{"contentDetails": {"videoId": "v1"}}], "PLsaved"
+        )
+        playlist.set_durations({"v1": 61})
+        write_snapshot(get_snapshot_path(tmp_path, "PLsaved"), playlist)
+
+        monkeypatch.setattr(
+            "src.main.get_api_key", Mock(side_effect=AssertionError("no api"))
+        )
+
+        with patch("src.main.write_results") as mock_write:
+            main(["--from-snapshots", str(tmp_path), "--format", "jsonl"])
+
+        results, output_format = mock_write.call_args.args
+
+        assert [stats.runtime for stats in results] == [61]
+        assert output_format == "jsonl"
+
+    def test_heavy_modules_not_imported_at_startup(self):
+        """
+        Testing that importing main doesn't import the modules that are only
+        needed once a request is made
+        """
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, src.main; print(*sorted(sys.modules), sep='\\n')",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        imported = set(result.stdout.split())
+
+        assert "googleapiclient.discovery" not in imported
+        assert "googleapiclient.http" not in imported
+        assert "asyncio" not in imported
+        assert "aiohttp" not in imported
+        assert "dotenv" not in imported
+
+    def test_playlist_flag_writes_results(self, monkeypatch):
+        """
+        Testing that with --playlist each playlist is analysed without
+        prompting and written in the chosen format
+        """
+        monkeypatch.setattr("builtins.input", Mock(side_effect=AssertionError))
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        with patch("src.main.load_playlist") as mock_load_playlist, patch(
+            "src.main.get_playlist_stats"
+        ) as mock_get_stats, patch("src.main.get_youtube_client") as mock_build, patch(
+            "src.main.write_results"
+        ) as mock_write, patch(
+            "src.main.DurationCache"
+        ) as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
+
+            mock_write.side_effect = lambda results, output_format: list(results)
+
+            main(
+                [
+                    "--playlist",
+                    "https://youtube.com/list=a",
+                    "--playlist",
+                    "b",
+                    "--watched",
+                    "2",
+                    "--format",
+                    "jsonl",
+                ]
+            )
+
+        assert mock_write.call_args.args[1] == "jsonl"
+
+        mock_load_playlist.assert_any_call(
+            "a", mock_build.return_value, mock_page_cache.return_value
+        )
+
+        mock_get_stats.assert_called_with(
+            mock_load_playlist.return_value,
+            mock_build.return_value,
+            2,
+            mock_cache.return_value,
+            None,
+            "b",
+        )
+
+    def test_serve_flag_runs_server(self, monkeypatch):
+        """
+        Testing that --serve serves stats with a warm client and the caches
+        instead of prompting
+        """
+        monkeypatch.setattr("builtins.input", Mock(side_effect=AssertionError))
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        with patch("src.server.make_server") as mock_make_server, patch(
+            "src.main.get_youtube_client"
+        ) as mock_build, patch("src.main.DurationCache") as mock_cache, patch(
+            "src.main.PageCache"
+        ) as mock_page_cache:
+
+            mock_server = mock_make_server.return_value
+            mock_server.server_address = ("127.0.0.1", 9000)
+            mock_server.serve_forever.side_effect = KeyboardInterrupt
+
+            main(["--serve", "--port", "9000"])
+
+        service, host, port = mock_make_server.call_args.args
+
+        assert (host, port) == ("127.0.0.1", 9000)
+        assert service.youtube is mock_build.return_value
+        assert service.cache is mock_cache.return_value
+        assert service.page_cache is mock_page_cache.return_value
+
+        mock_server.server_close.assert_called_once()
+
+    def test_metrics_written_at_exit(self, monkeypatch, capsys):
+        """
+        Testing that --metrics writes the metrics to stderr, with the quota
+        units used by each playlist
+        """
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        def analyse_playlist(playlist_id, *args):
+            get_metrics().add("quota_units_total", 2, method="videos.list")
+            return PlaylistStats(playlist_id)
+
+        with patch("src.main.analyse_playlist", side_effect=analyse_playlist), patch(
+            "src.main.DurationCache"
+        ), patch("src.main.PageCache"):
+
+            main(["--playlist", "a", "--format", "jsonl", "--metrics", "json"])
+
+        summary = json.loads(capsys.readouterr().err)
+
+        assert summary["playlist_quota_units_total"] == [
+            {"labels": {"playlist": "a"}, "value": 2}
+        ]
+
+    def test_profile_written(self, monkeypatch, capsys, tmp_path):
+        """
+        Testing that --profile writes the profiles and the phase timings
+        """
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        with patch(
+            "src.main.analyse_playlist", side_effect=lambda *args: PlaylistStats("a")
+        ), patch("src.main.DurationCache"), patch("src.main.PageCache"):
+
+            main(["--playlist", "a", "--profile", str(tmp_path / "run")])
+
+        assert (tmp_path / "run.pstats").exists()
+        assert (tmp_path / "run.collapsed").exists()
+        assert "Phase timings" in capsys.readouterr().err
+
+    def test_offline_answers_from_stored_data(self, monkeypatch, capsys):
+        """
+        Testing that --offline answers from the stored pages and durations
+        without an api key, and says when a playlist isn't stored
+        """
+        from src.cache import DurationCache, PageCache
+
+        monkeypatch.setattr("src.main.get_api_key", Mock(side_effect=AssertionError))
+
+        page_cache = PageCache()
+        page_cache.put_page(
+            "a",
+            None,
+            {
+                "etag": "e1",
+                "pageInfo": {"totalResults": 2},
+                "items": [
+                    {"contentDetails": {"videoId": "v1"}},
+                    {"contentDetails": {"videoId": "v2"}},
+                ],
+            },
+        )
+        page_cache.close()
+
+        cache = DurationCache()
+        cache.put_many({"v1": "PT1M", "v2": "PT2M"})
+        cache.close()
+
+        main(["--offline", "--playlist", "a", "--playlist", "b", "--format", "jsonl"])
+
+        first, second = map(json.loads, capsys.readouterr().out.splitlines())
+
+        assert first["runtime_seconds"] == 180
+        assert first["age_seconds"] >= 0
+        assert second == {
+            "playlist_id": "b",
+            "error": "Playlist not stored for offline use",
+        }
+
+    def test_stale_answers_stored_playlists_and_analyses_others(self, monkeypatch):
+        """
+        Testing that --stale answers stored playlists from the stored data and
+        only analyses the others with the api
+        """
+        monkeypatch.setattr("src.main.get_api_key", lambda: "test_key")
+
+        stored = PlaylistStats("a", age=10)
+
+        with patch(
+            "src.offline.get_stored_stats",
+            side_effect=lambda playlist_id, *args: (
+                stored if playlist_id == "a" else None
+            ),
+        ), patch(
+            "src.main.analyse_playlist", side_effect=lambda *args: PlaylistStats("b")
+        ) as mock_analyse, patch(
+            "src.main.Revalidator"
+        ) as mock_revalidator, patch(
+            "src.main.get_youtube_client"
+        ), patch(
+            "src.main.write_results"
+        ) as mock_write:
+
+            mock_write.side_effect = lambda results, output_format: list(results)
+
+            main(["--stale", "--playlist", "a", "--playlist", "b"])
+
+        assert mock_analyse.call_count == 1
+        assert mock_analyse.call_args.args[0] == "b"
+        mock_revalidator.return_value.close.assert_called_once()
+
+    def test_stale_batch_shards_others_across_keys(self, monkeypatch, tmp_path):
+        """
+        Testing that --stale --batch answers stored playlists from the stored
+        data and shares the others between the api keys, keeping the order
+        """
+        batch_file = tmp_path / "playlists.txt"
+        batch_file.write_text("https://youtube.com/list=a\nb\na\n")
+
+        monkeypatch.setattr("src.main.get_api_key", lambda: "key-a")
+        monkeypatch.setenv("API_KEYS", "key-a,key-b")
+
+        stored = PlaylistStats("a", age=10)
+
+        with patch(
+            "src.offline.get_stored_stats",
+            side_effect=lambda playlist_id, *args: (
+                stored if playlist_id == "a" else None
+            ),
+        ), patch(
+            "src.main.analyse_playlists_sharded", return_value=[PlaylistStats("b")]
+        ) as mock_sharded, patch(
+            "src.main.Revalidator"
+        ), patch(
+            "src.main.get_youtube_client"
+        ), patch(
+            "src.main.write_results"
+        ) as mock_write, patch(
+            "src.keys.QuotaUsage"
+        ):
+
+            main(["--stale", "--batch", str(batch_file)])
+
+        assert mock_sharded.call_args.args[0] == ["b"]
+        assert mock_sharded.call_args.args[1].api_keys == ["key-a", "key-b"]
+        assert mock_write.call_args.args[0] == [stored, PlaylistStats("b")]
+
+    @pytest.mark.parametrize(
+        "argv",
+        [
+            ["--offline", "--serve"],
+            ["--offline", "--channel", "@channel"],
+            ["--stale", "--serve"],
+            ["--stale", "--channel", "@channel"],
+            ["--offline", "--stale"],
+            ["--async", "--snapshot-dir", "snapshots"],
+        ],
+    )
+    def test_unsupported_modes_rejected(self, argv, capsys):
+        """
+        Testing that options can't be combined with modes they don't support
+        """
+        with pytest.raises(SystemExit):
+            main(argv)
+
+        assert "can't be used" in capsys.readouterr().err
+
+    def test_negative_watched_rejected(self, capsys):
+        """
+        Testing that a negative amount of videos watched is rejected
+        """
+        with pytest.raises(SystemExit):
+            main(["--playlist", "PLxxxx", "--watched", "-1"])
+
+        assert "--watched must be a whole number" in capsys.readouterr().err
@@ -0,0 +1,286 @@
+import io
+import json
+import pytest
+from unittest.mock import Mock, patch
+from src.metrics import (
+    CountingHttp,
+    Histogram,
+    Metrics,
+    get_api_method,
+    get_metrics,
+    timed,
+    write_metrics,
+)
+
+
+class TestHistogram:
+    """
+    Class to test the Histogram class
+    """
+
+    def test_values_counted_in_buckets(self):
+        """
+        Testing that each value is counted in the first bucket it fits under
+        """
+        histogram = Histogram((1, 2, 5))
+
+        for value in (0.5, 1, 1.5, 3, 100):
+            histogram.observe(value)
+
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.count == 5
+        assert histogram.sum == 106
+        assert histogram.max == 100
+
+    def test_quantiles(self):
+        """
+        Testing that quantiles are the upper bound of their bucket, or the
+        largest value past the last bucket
+        """
+        histogram = Histogram((1, 2, 5))
+
+        for value in [0.5] * 90 + [4] * 9 + [50]:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.5) == 1
+        assert histogram.quantile(0.95) == 5
+        assert histogram.quantile(1) == 50
+
+    def test_empty_quantile(self):
+        """
+        Testing that an empty histogram's quantiles are 0
+        """
+        assert Histogram().quantile(0.5) == 0
+
+
+class TestMetrics:
+    """
+    Class to test the Metrics class
+    """
+
+    def test_counters_added_by_labels(self):
+        """
+        Testing that counters with the same name and labels are added up
+        """
+        metrics = Metrics()
+
+        metrics.add("quota_units_total", 1, method="videos.list")
+        metrics.add("quota_units_total", 2, method="videos.list")
+        metrics.add("quota_units_total", 4, method="playlistItems.list")
+
+        assert metrics.get_total("quota_units_total") == 7
+        assert metrics.summary()["quota_units_total"] == [
+            {"labels": {"method": "playlistItems.list"}, "value": 4},
+            {"labels": {"method": "videos.list"}, "value": 3},
+        ]
+
+    def test_prometheus_text(self):
+        """
+        Testing the Prometheus text format of counters and histograms
+        """
+        metrics = Metrics()
+
+        metrics.record_request("videos.list", 0.02, "ok")
+
+        lines = metrics.to_prometheus().splitlines()
+
+        assert "# TYPE playlist_analyser_api_requests_total counter" in lines
+        assert (
+            'playlist_analyser_api_requests_total{method="videos.list",status="ok"} 1'
+            in lines
+        )
+        assert "# TYPE playlist_analyser_api_request_seconds histogram" in lines
+        assert (
+            'playlist_analyser_api_request_seconds_bucket{method="videos.list",'
+            'le="0.01"} 0' in lines
+        )
+        assert (
+            'playlist_analyser_api_request_seconds_bucket{method="videos.list",'
+            'le="0.025"} 1' in lines
+        )
+        assert (
+            'playlist_analyser_api_request_seconds_bucket{method="videos.list",'
+            'le="+Inf"} 1' in lines
+        )
+        assert (
+            'playlist_analyser_api_request_seconds_count{method="videos.list"} 1'
+            in lines
+        )
+
+    def test_empty_prometheus_text(self):
+        """
+        Testing that no metrics export as nothing
+        """
+        assert Metrics().to_prometheus() == ""
+
+    def test_cache_hits_and_misses(self):
+        """
+        Testing that cache lookups are counted by result
+        """
+        metrics = Metrics()
+
+        metrics.record_cache("durations", 3, 1)
+        metrics.record_cache("durations", 0, 2)
+
+        assert metrics.summary()["cache_lookups_total"] == [
+            {"labels": {"cache": "durations", "result": "hit"}, "value": 3},
+            {"labels": {"cache": "durations", "result": "miss"}, "value": 3},
+        ]
+
+    def test_playlist_measured(self):
+        """
+        Testing that the quota units used while analysing a playlist are
+        recorded against it
+        """
+        metrics = Metrics()
+        metrics.add("quota_units_total", 5, method="videos.list")
+
+        with metrics.measure_playlist("a"):
+            metrics.add("quota_units_total", 3, method="videos.list")
+
+        summary = metrics.summary()
+
+        assert summary["playlist_quota_units_total"] == [
+            {"labels": {"playlist": "a"}, "value": 3}
+        ]
+        assert summary["playlist_seconds"][0]["count"] == 1
+
+
+class TestTimed:
+    """
+    Class to test the timed decorator
+    """
+
+    def test_calls_timed_as_steps(self):
+        """
+        Testing that each call is recorded, even if it raises
+        """
+
+        @timed("double")
+        def double(value):
+            if value is None:
+                raise ValueError
+
+            return value * 2
+
+        assert double(2) == 4
+
+        with pytest.raises(ValueError):
+            double(None)
+
+        assert get_metrics().summary()["step_seconds"][0]["labels"] == {
+            "step": "double"
+        }
+        assert get_metrics().summary()["step_seconds"][0]["count"] == 2
+
+
+class TestCountingHttp:
+    """
+    Class to test the CountingHttp class
+    """
+
+    def test_reply_bytes_counted(self):
+        """
+        Testing that the size of each reply body is recorded by api method
+        and the reply is passed through
+        """
+        http = Mock()
+        http.request.return_value = ({"status": "200"}, b"12345")
+
+        counting_http = CountingHttp(http)
+
+        result = counting_http.request(
+            "https://youtube.googleapis.com/youtube/v3/videos?id=a", method="GET"
+        )
+
+        http.request.assert_called_once_with(
+            "https://youtube.googleapis.com/youtube/v3/videos?id=a", method="GET"
+        )
+
+        assert result == ({"status": "200"}, b"12345")
+        assert counting_http.timeout is http.timeout
+        assert get_metrics().summary()["api_response_bytes_total"] == [
+            {"labels": {"method": "videos.list"}, "value": 5}
+        ]
+
+    def test_api_method(self):
+        """
+        Testing that the api method is taken from the request path
+        """
+        assert get_api_method("http://x/youtube/v3/playlistItems?a=1") == (
+            "playlistItems.list"
+        )
+        assert get_api_method("http://x/batch") == "batch"
+
+
+class TestWriteMetrics:
+    """
+    Class to test the write_metrics function
+    """
+
+    def test_json_summary(self):
+        """
+        Testing that the summary is written as JSON
+        """
+        get_metrics().add("api_retries_total", method="videos.list")
+        stream = io.StringIO()
+
+        write_metrics("json", stream)
+
+        assert json.loads(stream.getvalue()) == {
+            "api_retries_total": [{"labels": {"method": "videos.list"}, "value": 1}]
+        }
+
+    def test_prometheus(self):
+        """
+        Testing that the Prometheus text is written
+        """
+        get_metrics().add("api_retries_total", method="videos.list")
+        stream = io.StringIO()
+
+        write_metrics("prometheus", stream)
+
+        assert stream.getvalue() == get_metrics().to_prometheus()
+
+    def test_unknown_format_raises_exception(self):
+        """
+        Testing that an unknown format raises the expected error
+        """
+        with pytest.raises(Exception) as excinfo:
+            write_metrics("xml", io.StringIO())
+
+        assert "Unknown metrics format: xml" in str(excinfo.value)
+
+
+class TestSchedulerMetrics:
+    """
+    Class to test the metrics the scheduler records
+    """
+
+    def test_attempts_retries_and_quota_recorded(self):
+        """
+        Testing that every attempt, retry and quota unit is recorded
+        """
+        from src.scheduler import RequestScheduler
+        from test_scheduler import make_http_error
+
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = [make_http_error(503), {"items": []}]
+
+        with patch("src.scheduler.time.sleep"):
+            scheduler.execute(request, "videos.list")
+
+        summary = get_metrics().summary()
+
+        assert summary["api_requests_total"] == [
+            {"labels": {"method": "videos.list", "status": "503"}, "value": 1},
+            {"labels": {"method": "videos.list", "status": "ok"}, "value": 1},
+        ]
+        assert summary["api_retries_total"] == [
+            {"labels": {"method": "videos.list"}, "value": 1}
+        ]
+        assert summary["quota_units_total"] == [
+            {"labels": {"method": "videos.list"}, "value": 2}
+        ]
+        assert summary["api_request_seconds"][0]["count"] == 2
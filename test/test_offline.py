@@ -0,0 +1,272 @@
+import math
+import time
+import pytest
+import threading
+from unittest.mock import Mock, patch
+from benchmarks.fake_youtube import make_fake_youtube
+from src.cache import DurationCache, PageCache
+from src.metrics import get_metrics
+from src.utils import PlaylistStats, load_playlist, load_playlist_durations
+from src.offline import (
+    Revalidator,
+    get_stale_after,
+    get_stale_stats,
+    get_stored_stats,
+    load_stored_playlist,
+)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """
+    Gives an empty duration cache and page store, closing them afterwards
+    """
+    cache = DurationCache(tmp_path / "cache.sqlite3", ttl=60, max_entries=1000)
+    page_cache = PageCache(tmp_path / "cache.sqlite3", ttl=math.inf, max_entries=1000)
+
+    yield cache, page_cache
+
+    cache.close()
+    page_cache.close()
+
+
+def store_playlist(youtube, cache, page_cache, fetched_at=1000):
+    """
+    Fetches "playlist-id" with the api as if it was fetched at fetched_at,
+    storing its pages and durations
+    """
+    with patch("src.cache.time.time", return_value=fetched_at):
+        playlist = load_playlist("playlist-id", youtube, page_cache)
+        load_playlist_durations(playlist, youtube, cache=cache)
+
+
+class TestGetStaleAfter:
+    """
+    Class to test the get_stale_after function
+    """
+
+    def test_default(self, monkeypatch):
+        """
+        Testing that stored data is refreshed after an hour by default
+        """
+        monkeypatch.delenv("STALE_AFTER", raising=False)
+
+        assert get_stale_after() == 3600
+
+    def test_value_read_from_env(self, monkeypatch):
+        """
+        Testing that STALE_AFTER sets the age
+        """
+        monkeypatch.setenv("STALE_AFTER", "60")
+
+        assert get_stale_after() == 60
+
+
+class TestLoadStoredPlaylist:
+    """
+    Class to test the load_stored_playlist function
+    """
+
+    def test_playlist_put_back_together(self, stores):
+        """
+        Testing that every stored page is followed, and the oldest fetch time
+        is returned
+        """
+        cache, page_cache = stores
+        fake, youtube = make_fake_youtube()
+
+        with fake:
+            store_playlist(youtube, cache, page_cache)
+
+        with patch("src.cache.time.time", return_value=2000):
+            page_cache.touch_page("playlist-id")
+
+        playlist, fetched_at = load_stored_playlist("playlist-id", page_cache)
+
+        assert list(playlist.iter_video_ids()) == [f"v{n}" for n in range(120)]
+        assert playlist.total_results == 120
+        assert fetched_at == 1000
+
+    def test_missing_page(self, stores):
+        """
+        Testing that None is returned when a later page isn't stored
+        """
+        _, page_cache = stores
+
+        page_cache.put_page(
+            "playlist-id", None, {"etag": "e1", "items": [], "nextPageToken": "50"}
+        )
+
+        assert load_stored_playlist("playlist-id", page_cache) is None
+        assert load_stored_playlist("other-id", page_cache) is None
+
+    def test_token_cycle(self, stores):
+        """
+        Testing that pages pointing back at each other don't loop forever
+        """
+        _, page_cache = stores
+
+        page_cache.put_page(
+            "playlist-id", None, {"etag": "e1", "items": [], "nextPageToken": "a"}
+        )
+        page_cache.put_page(
+            "playlist-id", "a", {"etag": "e2", "items": [], "nextPageToken": "a"}
+        )
+
+        assert load_stored_playlist("playlist-id", page_cache) is None
+
+
+class TestGetStoredStats:
+    """
+    Class to test the get_stored_stats function
+    """
+
+    def test_stats_from_stored_data(self, stores):
+        """
+        Testing that the stats match the api's, with expired durations still
+        used and the age of the data given
+        """
+        cache, page_cache = stores
+        fake, youtube = make_fake_youtube()
+
+        with fake:
+            store_playlist(youtube, cache, page_cache)
+
+        with patch("src.offline.time.time", return_value=1500):
+            stats = get_stored_stats("playlist-id", cache, page_cache, 20)
+
+        assert stats == PlaylistStats(
+            "playlist-id",
+            video_count=120,
+            videos_watched=20,
+            videos_left=100,
+            runtime=sum(range(20, 120)),
+        )
+        assert stats.durations.count == 100
+        assert stats.age == 500
+
+    def test_not_stored(self, stores):
+        """
+        Testing that None is returned for a playlist that isn't stored
+        """
+        cache, page_cache = stores
+
+        assert get_stored_stats("playlist-id", cache, page_cache) is None
+
+
+class TestRevalidator:
+    """
+    Class to test the Revalidator class
+    """
+
+    def test_refresh_updates_stored_data(self, stores):
+        """
+        Testing that a refresh revalidates the stored pages, so they're no
+        longer stale
+        """
+        cache, page_cache = stores
+        fake, youtube = make_fake_youtube()
+        revalidator = Revalidator(youtube, cache, page_cache)
+
+        with fake:
+            store_playlist(youtube, cache, page_cache)
+
+            assert revalidator.refresh("playlist-id").result(timeout=10)
+
+            revalidator.close()
+
+        _, fetched_at = load_stored_playlist("playlist-id", page_cache)
+
+        assert fetched_at > 1000
+        assert get_metrics().get_total("stale_refreshes_total") == 1
+
+    def test_refreshing_playlist_not_refreshed_again(self, stores):
+        """
+        Testing that refreshes asked for while one is running share it
+        """
+        cache, page_cache = stores
+        release = threading.Event()
+        revalidator = Revalidator(Mock(), cache, page_cache)
+
+        def load(*args):
+            release.wait(5)
+            raise Exception("Error getting playlist")
+
+        with patch("src.offline.load_playlist", side_effect=load) as mock_load:
+            first = revalidator.refresh("playlist-id")
+            second = revalidator.refresh("playlist-id")
+            release.set()
+
+            assert first is second
+            assert first.result(timeout=10) is False
+
+            revalidator.close()
+
+        mock_load.assert_called_once()
+        assert get_metrics().summary()["stale_refreshes_total"] == [
+            {"labels": {"result": "error"}, "value": 1}
+        ]
+
+
+class TestGetStaleStats:
+    """
+    Class to test the get_stale_stats function
+    """
+
+    def test_fresh_answer(self, stores, monkeypatch):
+        """
+        Testing that recent stored data is answered without the api
+        """
+        monkeypatch.setenv("STALE_AFTER", "3600")
+        cache, page_cache = stores
+        fake, youtube = make_fake_youtube()
+        revalidator = Mock()
+        analyse = Mock()
+
+        with fake:
+            store_playlist(youtube, cache, page_cache, fetched_at=time.time())
+
+        stats = get_stale_stats(
+            "playlist-id", cache, page_cache, 0, analyse, revalidator
+        )
+
+        assert stats.runtime == sum(range(120))
+        analyse.assert_not_called()
+        revalidator.refresh.assert_not_called()
+
+    def test_stale_answer_refreshed(self, stores, monkeypatch):
+        """
+        Testing that old stored data is answered straight away and refreshed
+        in the background
+        """
+        monkeypatch.setenv("STALE_AFTER", "60")
+        cache, page_cache = stores
+        fake, youtube = make_fake_youtube()
+        revalidator = Mock()
+        analyse = Mock()
+
+        with fake:
+            store_playlist(youtube, cache, page_cache)
+
+        stats = get_stale_stats(
+            "playlist-id", cache, page_cache, 0, analyse, revalidator
+        )
+
+        assert stats.runtime == sum(range(120))
+        assert stats.age > 60
+        analyse.assert_not_called()
+        revalidator.refresh.assert_called_once_with("playlist-id")
+
+    def test_miss_analysed(self, stores):
+        """
+        Testing that a playlist that isn't stored is analysed with the api
+        """
+        cache, page_cache = stores
+        analyse = Mock(return_value=PlaylistStats("playlist-id", error="Error"))
+
+        stats = get_stale_stats("playlist-id", cache, page_cache, 0, analyse, Mock())
+
+        assert stats.error == "Error"
+        assert get_metrics().summary()["stale_answers_total"] == [
+            {"labels": {"result": "miss"}, "value": 1}
+        ]
@@ -0,0 +1,199 @@
+import pytest
+from array import array
+from src.playlist import Playlist, DurationIndex, get_item_video_id
+
+
+def make_items(video_ids):
+    """
+    Builds playlist items, as the api returns them, for the given video ids
+    """
+    return [
+        {"snippet": {"position": position, "resourceId": {"videoId": video_id}}}
+        for position, video_id in enumerate(video_ids)
+    ]
+
+
+class TestGetItemVideoId:
+    """
+    Class to test the get_item_video_id function
+    """
+
+    def test_content_details_item(self):
+        """
+        Testing the id of an item requested with the contentDetails part
+        """
+        assert get_item_video_id({"contentDetails": {"videoId": "a"}}) == "a"
+
+    def test_snippet_item(self):
+        """
+        Testing the id of an item requested with the snippet part
+        """
+        assert get_item_video_id({"snippet": {"resourceId": {"videoId": "a"}}}) == "a"
+
+
+class TestPlaylist:
+    """
+    Class to test the Playlist class
+    """
+
+    def test_from_items(self):
+        """
+        Testing that the ids and positions of the items are stored in order
+        """
+        playlist = Playlist.from_items(make_items(["a", "bb", "ccc"]), "p")
+
+        assert len(playlist) == 3
+        assert list(playlist.iter_video_ids()) == ["a", "bb", "ccc"]
+        assert list(playlist.positions) == [0, 1, 2]
+        assert playlist.playlist_id == "p"
+        assert playlist.total_results == 3
+        assert playlist[-1] == "ccc"
+
+    def test_from_content_details_items(self):
+        """
+        Testing that items without a snippet are positioned in order
+        """
+        items = [{"contentDetails": {"videoId": video_id}} for video_id in "abc"]
+
+        playlist = Playlist.from_items(items)
+
+        assert list(playlist.iter_video_ids()) == ["a", "b", "c"]
+        assert list(playlist.positions) == [0, 1, 2]
+
+    def test_from_pages(self):
+        """
+        Testing that the items of every page are joined, and the total comes
+        from the first page
+        """
+        pages = [
+            {"pageInfo": {"totalResults": 5}, "items": make_items(["a", "b"])},
+            {"items": make_items(["c"])},
+        ]
+
+        playlist = Playlist.from_pages(iter(pages), "p")
+
+        assert list(playlist.iter_video_ids()) == ["a", "b", "c"]
+        assert playlist.total_results == 5
+
+    def test_from_no_pages(self):
+        """
+        Testing that a playlist with no pages is empty
+        """
+        playlist = Playlist.from_pages([])
+
+        assert len(playlist) == 0
+        assert playlist.runtime == 0
+
+    def test_slice_shares_columns(self):
+        """
+        Testing that a slice is a view, so durations set through it are set
+        in the original playlist too
+        """
+        playlist = Playlist.from_items(make_items(["a", "b", "c", "d"]))
+
+        remaining = playlist[1:3]
+        remaining.set_durations({"b": 10, "c": 20, "a": 99})
+
+        assert list(remaining.iter_video_ids()) == ["b", "c"]
+        assert remaining.runtime == 30
+        assert list(playlist.durations) == [0, 10, 20, 0]
+        assert remaining.durations.obj is playlist.durations.obj
+
+    def test_slice_past_end_is_empty(self):
+        """
+        Testing that slicing after more videos than the playlist has gives an
+        empty view
+        """
+        playlist = Playlist.from_items(make_items(["a", "b"]))
+
+        remaining = playlist[5:]
+
+        assert len(remaining) == 0
+        assert list(remaining.iter_video_ids()) == []
+
+    def test_slice_with_step_raises_exception(self):
+        """
+        Testing that a slice with a step raises the expected error
+        """
+        playlist = Playlist.from_items(make_items(["a", "b"]))
+
+        with pytest.raises(Exception) as excinfo:
+            playlist[::2]
+
+        assert "Playlist slices can't have a step" in str(excinfo.value)
+
+    def test_index_out_of_range(self):
+        """
+        Testing that an index past the end raises an IndexError
+        """
+        playlist = Playlist.from_items(make_items(["a"]))
+
+        with pytest.raises(IndexError):
+            playlist[1]
+
+    def test_compact_for_large_playlists(self):
+        """
+        Testing that a 10,000 video playlist takes a few hundred KB
+        """
+        video_ids = [f"{n:011d}" for n in range(10_000)]
+
+        playlist = Playlist.from_items(make_items(video_ids))
+
+        assert playlist.nbytes < 300_000
+        assert playlist[9_000:].nbytes < 30_000
+
+
+class TestDurationIndex:
+    """
+    Class to test the DurationIndex class
+    """
+
+    duration_index = DurationIndex(array("I", [10, 20, 30, 40]))
+
+    def test_time_left(self):
+        """
+        Testing the time left after each number of videos watched
+        """
+        result = [self.duration_index.time_left(n) for n in range(6)]
+
+        assert result == [100, 90, 70, 40, 0, 0]
+
+    def test_runtime_between(self):
+        """
+        Testing the runtime of ranges of videos, which behave like slices
+        """
+        assert self.duration_index.runtime_between(1, 3) == 50
+        assert self.duration_index.runtime_between(0, 10) == 100
+        assert self.duration_index.runtime_between(3, 1) == 0
+
+    def test_videos_fitting(self):
+        """
+        Testing how many whole videos fit in a length of time
+        """
+        assert self.duration_index.videos_fitting(0) == 0
+        assert self.duration_index.videos_fitting(30) == 2
+        assert self.duration_index.videos_fitting(59) == 2
+        assert self.duration_index.videos_fitting(50, start=1) == 2
+        assert self.duration_index.videos_fitting(1000, start=2) == 2
+        assert self.duration_index.videos_fitting(1000, start=9) == 0
+
+    def test_zero_length_videos_fit(self):
+        """
+        Testing that videos of no length, such as deleted ones, always fit
+        """
+        duration_index = DurationIndex([5, 0, 0, 5])
+
+        assert duration_index.videos_fitting(5) == 3
+        assert duration_index.videos_fitting(4, start=1) == 2
+
+    def test_from_playlist(self):
+        """
+        Testing that a playlist builds an index of its durations
+        """
+        playlist = Playlist.from_items(make_items(["a", "b"]))
+        playlist.set_durations({"a": 3, "b": 4})
+
+        duration_index = playlist.duration_index()
+
+        assert len(duration_index) == 2
+        assert duration_index.runtime == 7
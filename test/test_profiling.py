@@ -0,0 +1,103 @@
+import io
+import pstats
+import threading
+from src.metrics import get_metrics
+from src.profiling import (
+    SamplingProfiler,
+    format_phase_timings,
+    get_phase_timings,
+    profile_run,
+)
+
+
+def wait_in_worker(event):
+    event.wait(5)
+
+
+class TestSamplingProfiler:
+    """
+    Class to test the SamplingProfiler class
+    """
+
+    def test_other_threads_sampled(self):
+        """
+        Testing that the stacks of other threads are counted, starting from
+        the name of their thread
+        """
+        event = threading.Event()
+        worker = threading.Thread(target=wait_in_worker, args=(event,), name="worker")
+        worker.start()
+
+        profiler = SamplingProfiler()
+        profiler.sample()
+
+        event.set()
+        worker.join()
+
+        stacks = [stack.split(";") for stack in profiler.stacks]
+        worker_stack = next(stack for stack in stacks if stack[0] == "worker")
+
+        assert profiler.samples == 1
+        assert any(label.startswith("wait_in_worker (") for label in worker_stack)
+
+    def test_collapsed_stacks_written(self, tmp_path):
+        """
+        Testing that each stack is written with its count, the most seen first
+        """
+        profiler = SamplingProfiler()
+        profiler.stacks.update({"main;a": 1, "main;a;b": 3})
+
+        profiler.write_collapsed(tmp_path / "run.collapsed")
+
+        assert (tmp_path / "run.collapsed").read_text() == "main;a;b 3\nmain;a 1\n"
+
+
+class TestPhaseTimings:
+    """
+    Class to test get_phase_timings and format_phase_timings
+    """
+
+    def test_steps_summed_longest_first(self):
+        """
+        Testing that the time of each step is totalled, the longest first
+        """
+        metrics = get_metrics()
+        metrics.observe("step_seconds", 0.5, step="get_playlist")
+        metrics.observe("step_seconds", 0.25, step="get_playlist")
+        metrics.observe("step_seconds", 2, step="get_video_duration_map")
+
+        timings = get_phase_timings()
+
+        assert timings == [("get_video_duration_map", 1, 2), ("get_playlist", 2, 0.75)]
+
+        table = format_phase_timings(timings, 3).splitlines()
+
+        assert table[0] == "Phase timings (wall clock, 3.000s in total):"
+        assert table[2].split() == ["get_playlist", "2", "calls", "0.750s"]
+
+
+class TestProfileRun:
+    """
+    Class to test the profile_run context manager
+    """
+
+    def test_profiles_written(self, tmp_path):
+        """
+        Testing that the cProfile stats, collapsed stacks and phase timings
+        are written
+        """
+        stream = io.StringIO()
+        path = str(tmp_path / "run")
+
+        with profile_run(path, interval=0.001, stream=stream):
+            with get_metrics().time_step("convert_times"):
+                sum(range(100_000))
+
+            threading.Event().wait(0.02)
+
+        functions = {name for _, _, name in pstats.Stats(f"{path}.pstats").stats}
+
+        assert "wait" in functions
+        assert (tmp_path / "run.collapsed").read_text()
+        assert "convert_times" in stream.getvalue()
+        assert f"{path}.pstats" in stream.getvalue()
@@ -0,0 +1,386 @@
+import json
+import asyncio
+import pytest
+from unittest.mock import Mock, patch
+from googleapiclient.errors import HttpError
+from src.cache import QuotaUsage
+from src.utils import get_chunk_durations
+from src.scheduler import (
+    RequestScheduler,
+    get_error_reason,
+    get_scheduler,
+    is_key_error,
+    is_key_rejected,
+    is_retryable,
+    set_scheduler,
+)
+
+
+def make_http_error(status, reason=""):
+    """
+    Builds a HttpError like the ones the YouTube api replies with
+    """
+    content = json.dumps({"error": {"errors": [{"reason": reason}]}}).encode()
+
+    return HttpError(resp=Mock(status=status, reason=""), content=content)
+
+
+class ResponseError(Exception):
+    """
+    Stands in for the aiohttp.ClientResponseError the async client raises
+    """
+
+    def __init__(self, status, message=""):
+        self.status = status
+        self.message = message
+
+
+class TestGetErrorReason:
+    """
+    Class to test the get_error_reason function
+    """
+
+    def test_reason_extracted(self):
+        """
+        Testing that the reason of the first error is returned
+        """
+        content = b'{"error": {"errors": [{"reason": "quotaExceeded"}]}}'
+
+        assert get_error_reason(content) == "quotaExceeded"
+
+    def test_empty_string_for_other_bodies(self):
+        """
+        Testing that bodies without a reason give an empty string
+        """
+        assert get_error_reason(b"Not Found") == ""
+        assert get_error_reason(b'{"error": {}}') == ""
+
+
+class TestIsRetryable:
+    """
+    Class to test the is_retryable function
+    """
+
+    def test_rate_limits_and_server_errors_retried(self):
+        """
+        Testing that rate limits, server errors and dropped connections are
+        retried
+        """
+        assert is_retryable(make_http_error(429))
+        assert is_retryable(make_http_error(503))
+        assert is_retryable(make_http_error(403, "rateLimitExceeded"))
+        assert is_retryable(ResponseError(500))
+        assert is_retryable(ConnectionResetError())
+
+    def test_other_errors_not_retried(self):
+        """
+        Testing that client errors and an exhausted daily quota aren't retried
+        """
+        assert not is_retryable(make_http_error(404))
+        assert not is_retryable(make_http_error(403, "quotaExceeded"))
+        assert not is_retryable(ResponseError(400))
+        assert not is_retryable(ValueError())
+
+
+class TestIsKeyRejected:
+    """
+    Class to test the is_key_rejected and is_key_error functions
+    """
+
+    def test_rejected_keys(self):
+        """
+        Testing that invalid keys are recognised, including from the reason in
+        the details of the reply
+        """
+        content = json.dumps(
+            {
+                "error": {
+                    "errors": [{"reason": "badRequest"}],
+                    "details": [{"reason": "API_KEY_INVALID"}],
+                }
+            }
+        ).encode()
+
+        assert is_key_rejected(HttpError(resp=Mock(status=400), content=content))
+        assert is_key_rejected(make_http_error(400, "keyInvalid"))
+        assert is_key_rejected(ResponseError(403, "accessNotConfigured"))
+
+    def test_other_errors(self):
+        """
+        Testing that other errors aren't taken for a rejected key
+        """
+        assert not is_key_rejected(make_http_error(400, "badRequest"))
+        assert not is_key_rejected(make_http_error(403, "quotaExceeded"))
+        assert not is_key_rejected(make_http_error(500, "keyInvalid"))
+
+    def test_key_errors(self):
+        """
+        Testing that quota and key errors are told apart from other errors
+        """
+        assert is_key_error("Not enough quota left: 5 units needed")
+        assert is_key_error("The api key was rejected")
+        assert not is_key_error("Error getting playlist")
+
+
+class TestRequestScheduler:
+    """
+    Class to test the RequestScheduler class
+    """
+
+    def test_failed_requests_retried(self):
+        """
+        Testing that a retryable error is retried after a backoff and every
+        attempt counts towards the quota
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = [make_http_error(500), {"items": []}]
+
+        with patch("src.scheduler.time.sleep"):
+            result = scheduler.execute(request, "videos.list")
+
+        assert result == {"items": []}
+        assert request.execute.call_count == 2
+        assert scheduler.remaining_units == 98
+
+    def test_retries_give_up(self):
+        """
+        Testing that the error is raised once the retries run out
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100, max_retries=2)
+        request = Mock()
+        request.execute.side_effect = make_http_error(503)
+
+        with patch("src.scheduler.time.sleep"), pytest.raises(HttpError):
+            scheduler.execute(request, "videos.list")
+
+        assert request.execute.call_count == 3
+
+    def test_other_errors_not_retried(self):
+        """
+        Testing that errors that can't be fixed by retrying are raised at once
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = make_http_error(404)
+
+        with pytest.raises(HttpError):
+            scheduler.execute(request, "videos.list")
+
+        assert request.execute.call_count == 1
+
+    def test_exhausted_quota_explained(self):
+        """
+        Testing that an exhausted daily quota stops with a clear message
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = make_http_error(403, "quotaExceeded")
+
+        with pytest.raises(Exception) as excinfo:
+            scheduler.execute(request, "videos.list")
+
+        assert "daily quota has run out" in str(excinfo.value)
+
+    def test_exhausted_quota_uses_up_the_day(self):
+        """
+        Testing that once YouTube says the quota has run out, no more requests
+        are sent that day
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = make_http_error(403, "quotaExceeded")
+
+        with pytest.raises(Exception):
+            scheduler.execute(request, "videos.list")
+
+        assert scheduler.remaining_units == 0
+        assert not scheduler.available
+
+    def test_rejected_key_stops_requests(self):
+        """
+        Testing that once the api key is rejected, later requests fail without
+        being sent
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100)
+        request = Mock()
+        request.execute.side_effect = make_http_error(400, "keyInvalid")
+
+        with pytest.raises(Exception) as excinfo:
+            scheduler.execute(request, "videos.list")
+
+        assert "api key was rejected" in str(excinfo.value)
+
+        with pytest.raises(Exception):
+            scheduler.execute(request, "videos.list")
+
+        assert request.execute.call_count == 1
+        assert not scheduler.available
+
+    def test_backoff_grows_exponentially_with_jitter(self):
+        """
+        Testing that the backoff is a random delay up to a doubling limit
+        """
+        scheduler = RequestScheduler(
+            daily_quota=100, rate_limit=100, base_delay=1, max_delay=5
+        )
+
+        with patch("src.scheduler.random.uniform", side_effect=lambda a, b: b):
+            delays = [scheduler.get_backoff(attempt) for attempt in range(5)]
+
+        assert delays == [1, 2, 4, 5, 5]
+
+    def test_check_budget_stops_early(self):
+        """
+        Testing that work the remaining quota can't cover is refused
+        """
+        scheduler = RequestScheduler(daily_quota=10, rate_limit=100)
+
+        scheduler.check_budget(10)
+
+        with pytest.raises(Exception) as excinfo:
+            scheduler.check_budget(11)
+
+        assert "Not enough quota left: 11 units needed but only 10 of 10" in str(
+            excinfo.value
+        )
+
+    def test_requests_refused_once_quota_used(self):
+        """
+        Testing that no request is sent once the daily quota is used up
+        """
+        scheduler = RequestScheduler(daily_quota=1, rate_limit=100)
+        request = Mock()
+
+        scheduler.execute(request, "videos.list")
+
+        with pytest.raises(Exception) as excinfo:
+            scheduler.execute(request, "videos.list")
+
+        assert "Not enough quota left" in str(excinfo.value)
+        assert request.execute.call_count == 1
+
+    def test_token_bucket_limits_rate(self):
+        """
+        Testing that requests past the bucket size have to wait for tokens
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=2)
+
+        with patch("src.scheduler.time.monotonic", return_value=0):
+            scheduler._refilled_at = 0
+            waits = [scheduler._take_token() for _ in range(4)]
+
+        assert waits == [0, 0, 0.5, 1]
+
+    def test_quota_usage_shared_between_runs(self, tmp_path):
+        """
+        Testing that units used by one run count against the next
+        """
+        quota_usage = QuotaUsage(tmp_path / "cache.sqlite3", flush_every=1)
+        scheduler = RequestScheduler(
+            daily_quota=10, rate_limit=100, quota_usage=quota_usage
+        )
+
+        scheduler.execute(Mock(), "videos.list")
+        scheduler.execute(Mock(), "playlistItems.list")
+        quota_usage.close()
+
+        quota_usage = QuotaUsage(tmp_path / "cache.sqlite3")
+        scheduler = RequestScheduler(
+            daily_quota=10, rate_limit=100, quota_usage=quota_usage
+        )
+
+        assert scheduler.remaining_units == 8
+
+    def test_quota_usage_scopes_kept_apart(self, tmp_path):
+        """
+        Testing that stores with different scopes count their units apart
+        """
+        first = QuotaUsage(tmp_path / "cache.sqlite3", flush_every=1, scope="a")
+        second = QuotaUsage(tmp_path / "cache.sqlite3", flush_every=1, scope="b")
+
+        first.add_used("2024-01-01", 5)
+        second.add_used("2024-01-01", 2)
+
+        assert first.get_used("2024-01-01") == 5
+        assert second.get_used("2024-01-01") == 2
+
+        first.close()
+        second.close()
+
+    def test_async_requests_retried(self):
+        """
+        Testing that execute_async retries the async client's errors
+        """
+        scheduler = RequestScheduler(daily_quota=100, rate_limit=100, base_delay=0)
+        responses = [ResponseError(429), ConnectionError(), (200, {"items": []})]
+
+        async def send():
+            response = responses.pop(0)
+
+            if isinstance(response, Exception):
+                raise response
+
+            return response
+
+        result = asyncio.run(scheduler.execute_async(send, "videos.list"))
+
+        assert result == (200, {"items": []})
+        assert scheduler.remaining_units == 97
+
+
+class TestGetScheduler:
+    """
+    Class to test the get_scheduler and set_scheduler functions
+    """
+
+    def test_scheduler_replaced(self):
+        """
+        Testing that set_scheduler replaces the shared scheduler and None puts
+        a default one back
+        """
+        scheduler = RequestScheduler(daily_quota=5, rate_limit=1)
+
+        set_scheduler(scheduler)
+
+        assert get_scheduler() is scheduler
+
+        set_scheduler(None)
+
+        assert get_scheduler() is not scheduler
+
+    def test_client_scheduler(self):
+        """
+        Testing that a client given its own scheduler gets it, and other
+        clients get the shared one
+        """
+        scheduler = RequestScheduler(daily_quota=5, rate_limit=1)
+        youtube = Mock()
+
+        set_scheduler(scheduler, youtube)
+
+        assert get_scheduler(youtube) is scheduler
+        assert get_scheduler(Mock()) is get_scheduler()
+
+        set_scheduler(None, youtube)
+
+        assert get_scheduler(youtube) is get_scheduler()
+
+
+class TestGetChunkDurationsErrors:
+    """
+    Class to test how get_chunk_durations handles api errors
+    """
+
+    def test_HTTP_error_raised(self):
+        """
+        Testing that a HTTP error getting videos raises the correct error
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.videos.return_value.list.return_value
+        mock_request.execute.side_effect = make_http_error(400, "badRequest")
+
+        with pytest.raises(Exception) as excinfo:
+            get_chunk_durations(["a"], mock_youtube)
+
+        assert "Error getting videos" in str(excinfo.value)
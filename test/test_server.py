@@ -0,0 +1,302 @@
+import json
+import pytest
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from unittest.mock import Mock, patch
+from benchmarks.fake_youtube import make_fake_youtube
+from src.utils import PlaylistStats, get_playlist
+from src.metrics import get_metrics
+from src.stats import DurationStats
+from src.server import PlaylistService, make_server
+
+
+@pytest.fixture
+def serve():
+    """
+    Serves a service on a free port for the length of a test, and gives a
+    function to get a path from it as a status code and JSON body
+    """
+    servers = []
+
+    def start(service):
+        server = make_server(service, port=0)
+        thread = threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        thread.daemon = True
+        thread.start()
+        servers.append(server)
+
+        host, port = server.server_address
+
+        def get(path):
+            try:
+                with urlopen(f"http://{host}:{port}{path}") as response:
+                    return response.status, json.loads(response.read())
+
+            except HTTPError as error:
+                return error.code, json.loads(error.read())
+
+        get.address = (host, port)
+
+        return get
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class TestFieldMasks:
+    """
+    Class to test that the field masks are understood by the api
+    """
+
+    def test_only_video_ids_sent(self):
+        """
+        Testing that by default each item is only its video id, and the
+        snippet comes back with rich_metadata
+        """
+        fake, youtube = make_fake_youtube()
+
+        with fake:
+            masked = get_playlist("playlist-id", youtube)
+            masked_bytes = fake.bytes_sent
+
+            fake.bytes_sent = 0
+
+            rich = get_playlist("playlist-id", youtube, rich_metadata=True)
+
+        assert masked["items"][0] == {"contentDetails": {"videoId": "v0"}}
+        assert masked["pageInfo"] == {"totalResults": 120}
+        assert rich["items"][0]["snippet"]["title"] == "Video v0"
+        assert masked_bytes * 5 < fake.bytes_sent
+
+
+class TestPlaylistService:
+    """
+    Class to test the PlaylistService class
+    """
+
+    def test_stats_of_videos_left(self):
+        """
+        Testing that the stats count the videos after the ones watched
+        """
+        fake, youtube = make_fake_youtube()
+
+        with fake:
+            result = PlaylistService(youtube, playlist_ttl=60).get_stats(
+                "playlist-id", 100
+            )
+
+        assert result == PlaylistStats(
+            "playlist-id",
+            video_count=120,
+            videos_watched=100,
+            videos_left=20,
+            runtime=sum(range(100, 120)),
+        )
+
+    def test_playlist_reused_within_ttl(self):
+        """
+        Testing that asking about a playlist again with a different amount
+        watched doesn't use the api
+        """
+        fake, youtube = make_fake_youtube()
+        service = PlaylistService(youtube, playlist_ttl=60)
+
+        with fake:
+            service.get_stats("playlist-id", 0)
+
+            fake.requests.clear()
+
+            result = service.get_stats("playlist-id", 110)
+
+        assert fake.requests == []
+        assert result.runtime == sum(range(110, 120))
+
+    def test_distribution_worked_out_once(self):
+        """
+        Testing that the distribution of the durations left is worked out
+        when it's first asked for and reused afterwards
+        """
+        fake, youtube = make_fake_youtube()
+        service = PlaylistService(youtube, playlist_ttl=60)
+
+        with fake, patch(
+            "src.server.DurationStats.from_playlist",
+            side_effect=DurationStats.from_playlist,
+        ) as mock_from_playlist:
+            for videos_watched in (0, 100, 0, 100, 100):
+                result = service.get_stats("playlist-id", videos_watched)
+
+        assert mock_from_playlist.call_count == 2
+        assert result.durations.count == 20
+        assert result.durations.max == 119
+
+    def test_least_recently_used_distribution_evicted(self):
+        """
+        Testing that once a playlist has the most distributions kept, the one
+        asked about least recently is dropped, not the one worked out first
+        """
+        fake, youtube = make_fake_youtube()
+        service = PlaylistService(youtube, playlist_ttl=60)
+
+        with fake, patch("src.server.MAX_DISTRIBUTIONS_PER_PLAYLIST", 3):
+            for videos_watched in (0, 1, 2, 0, 3):
+                service.get_stats("playlist-id", videos_watched)
+
+        _, _, distributions = service._get_loaded("playlist-id")
+
+        assert list(distributions) == [2, 0, 3]
+
+    def test_concurrent_requests_load_once(self):
+        """
+        Testing that requests for a playlist that's loading wait for it
+        rather than loading it again
+        """
+        fake, youtube = make_fake_youtube()
+        service = PlaylistService(youtube, playlist_ttl=60)
+        barrier = threading.Barrier(4)
+
+        def get_stats():
+            barrier.wait()
+            service.get_stats("playlist-id", 0)
+
+        with fake:
+            threads = [
+                threading.Thread(target=get_stats, daemon=True) for _ in range(4)
+            ]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join(10)
+
+        assert [resource for resource, _ in fake.requests] == [
+            "playlistItems",
+            "playlistItems",
+            "playlistItems",
+            "videos",
+            "videos",
+            "videos",
+        ]
+
+    def test_playlist_reloaded_after_ttl(self):
+        """
+        Testing that a playlist is loaded again once it's expired
+        """
+        fake, youtube = make_fake_youtube()
+        service = PlaylistService(youtube, playlist_ttl=0)
+
+        with fake:
+            service.get_stats("playlist-id", 0)
+
+            fake.requests.clear()
+
+            service.get_stats("playlist-id", 0)
+
+        assert [resource for resource, _ in fake.requests] == [
+            "playlistItems",
+            "playlistItems",
+            "playlistItems",
+            "videos",
+            "videos",
+            "videos",
+        ]
+
+
+class TestStatsRequestHandler:
+    """
+    Class to test the HTTP api served by make_server
+    """
+
+    def test_stats_served_as_json(self, serve):
+        """
+        Testing that the stats are served in the same records as jsonl output
+        """
+        service = Mock()
+        service.get_stats.return_value = PlaylistStats(
+            "abc", video_count=3, videos_watched=1, videos_left=2, runtime=60
+        )
+
+        status, body = serve(service)("/playlists/abc/stats?watched=1")
+
+        service.get_stats.assert_called_once_with("abc", 1)
+
+        assert status == 200
+        assert body["playlist_id"] == "abc"
+        assert body["runtime_seconds"] == 60
+        assert body["average_runtime"] == "0:00:30"
+
+    def test_watched_defaults_to_zero(self, serve):
+        """
+        Testing that no videos are watched if watched isn't given
+        """
+        service = Mock()
+        service.get_stats.return_value = PlaylistStats("abc")
+
+        serve(service)("/playlists/abc/stats")
+
+        service.get_stats.assert_called_once_with("abc", 0)
+
+    def test_bad_watched_rejected(self, serve):
+        """
+        Testing that an amount watched that isn't a whole number is a 400
+        """
+        service = Mock()
+        get = serve(service)
+
+        assert get("/playlists/abc/stats?watched=x")[0] == 400
+        assert get("/playlists/abc/stats?watched=-1")[0] == 400
+
+        service.get_stats.assert_not_called()
+
+    def test_bad_playlist_id_rejected(self, serve):
+        """
+        Testing that a playlist id that isn't valid is a 400
+        """
+        status, body = serve(Mock())("/playlists/a%20b/stats")
+
+        assert status == 400
+        assert body == {"error": "Invalid URL"}
+
+    def test_api_error_is_bad_gateway(self, serve):
+        """
+        Testing that an error getting the playlist is a 502 with the error
+        """
+        service = Mock()
+        service.get_stats.side_effect = Exception("Error getting playlist")
+
+        status, body = serve(service)("/playlists/abc/stats")
+
+        assert status == 502
+        assert body == {"playlist_id": "abc", "error": "Error getting playlist"}
+
+    def test_unknown_path_not_found(self, serve):
+        """
+        Testing that a path that isn't served is a 404
+        """
+        assert serve(Mock())("/playlists/abc")[0] == 404
+
+    def test_metrics(self, serve):
+        """
+        Testing that the metrics are served in the Prometheus text format
+        """
+        get_metrics().add("api_retries_total", method="videos.list")
+
+        host, port = serve(Mock()).address
+
+        with urlopen(f"http://{host}:{port}/metrics") as response:
+            content = response.read().decode()
+
+        assert 'playlist_analyser_api_retries_total{method="videos.list"}' in content
+
+    def test_health(self, serve):
+        """
+        Testing the health check
+        """
+        assert serve(Mock())("/health") == (200, {"status": "ok"})
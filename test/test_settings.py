@@ -0,0 +1,46 @@
+import pytest
+from src.settings import get_setting
+
+
+class TestGetSetting:
+    """
+    Class to test the get_setting function
+    """
+
+    def test_default_returned_when_unset(self, monkeypatch):
+        """
+        Testing that get_setting falls back to the default
+        """
+        monkeypatch.delenv("CACHE_TTL", raising=False)
+
+        assert get_setting("CACHE_TTL", 10) == 10
+
+    def test_value_read_from_env(self, monkeypatch):
+        """
+        Testing that get_setting reads the setting from the environment
+        """
+        monkeypatch.setenv("CACHE_TTL", "0")
+
+        assert get_setting("CACHE_TTL", 10, minimum=0) == 0
+
+    def test_invalid_value_raises_exception(self, monkeypatch):
+        """
+        Testing that get_setting rejects values that aren't whole numbers
+        """
+        monkeypatch.setenv("CACHE_TTL", "soon")
+
+        with pytest.raises(Exception) as excinfo:
+            get_setting("CACHE_TTL", 10, minimum=0)
+
+        assert "CACHE_TTL must be a whole number" in str(excinfo.value)
+
+    def test_value_below_minimum_raises_exception(self, monkeypatch):
+        """
+        Testing that get_setting rejects values below the minimum
+        """
+        monkeypatch.setenv("RATE_LIMIT", "0")
+
+        with pytest.raises(Exception) as excinfo:
+            get_setting("RATE_LIMIT", 10)
+
+        assert "RATE_LIMIT must be a positive number" in str(excinfo.value)
@@ -0,0 +1,117 @@
+import time
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics import get_metrics
+from src.singleflight import SingleFlight
+
+
+def wait_for_collapsed(flight, collapsed):
+    deadline = time.monotonic() + 5
+
+    while flight.stats()["collapsed"] < collapsed:
+        if time.monotonic() > deadline:
+            raise Exception("Callers never joined the call in flight")
+
+        time.sleep(0.001)
+
+
+class TestSingleFlight:
+    """
+    Class to test the SingleFlight class
+    """
+
+    def test_concurrent_calls_share_one(self):
+        """
+        Testing that calls for a key already in flight wait for its result
+        rather than running the work again
+        """
+        flight = SingleFlight("test")
+        release = threading.Event()
+        runs = []
+
+        def work():
+            runs.append(1)
+            release.wait(5)
+
+            return {"items": []}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flight.do, "key", work)]
+
+            while not runs:
+                time.sleep(0.001)
+
+            futures += [executor.submit(flight.do, "key", work) for _ in range(3)]
+
+            wait_for_collapsed(flight, 3)
+            release.set()
+
+            results = [future.result() for future in futures]
+
+        assert len(runs) == 1
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {"calls": 1, "collapsed": 3}
+        assert flight.in_flight() == 0
+
+    def test_error_shared(self):
+        """
+        Testing that callers waiting on a call get its error
+        """
+        flight = SingleFlight("test")
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            started.set()
+            release.wait(5)
+
+            raise Exception("Error getting playlist")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flight.do, "key", work)
+            started.wait(5)
+            waiter = executor.submit(flight.do, "key", work)
+
+            wait_for_collapsed(flight, 1)
+            release.set()
+
+            for future in (leader, waiter):
+                with pytest.raises(Exception) as excinfo:
+                    future.result()
+
+                assert str(excinfo.value) == "Error getting playlist"
+
+    def test_later_calls_run_again(self):
+        """
+        Testing that a key is forgotten once its call is done, so results
+        aren't cached
+        """
+        flight = SingleFlight("test")
+        results = iter([1, 2])
+
+        assert flight.do("key", next, results) == 1
+        assert flight.do("key", next, results) == 2
+        assert flight.stats() == {"calls": 2, "collapsed": 0}
+
+    def test_different_keys_not_collapsed(self):
+        """
+        Testing that calls for different keys each run
+        """
+        flight = SingleFlight("test")
+
+        assert flight.do("first", str.upper, "a") == "A"
+        assert flight.do("second", str.upper, "b") == "B"
+        assert flight.stats()["collapsed"] == 0
+
+    def test_counted_in_metrics(self):
+        """
+        Testing that calls are counted by group and whether they ran
+        """
+        flight = SingleFlight("playlist_page")
+
+        flight.do("key", int)
+
+        assert get_metrics().summary()["singleflight_calls_total"] == [
+            {"labels": {"group": "playlist_page", "result": "ran"}, "value": 1}
+        ]
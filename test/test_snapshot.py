@@ -0,0 +1,128 @@
+import pytest
+from src.playlist import Playlist
+from src.snapshot import (
+    Snapshot,
+    analyse_snapshots,
+    get_snapshot_path,
+    iter_snapshot_paths,
+    write_snapshot,
+)
+
+
+def make_playlist(count=5, playlist_id="PLtest"):
+    """
+    Builds a playlist of count videos "v<n>" lasting n * 10 seconds
+    """
+    playlist = Playlist.from_items(
+        [{"contentDetails": {"videoId": f"v{n}"}} for n in range(count)],
+        playlist_id,
+        total_results=count + 1,
+    )
+    playlist.set_durations({f"v{n}": n * 10 for n in range(count)})
+
+    return playlist
+
+
+class TestSnapshot:
+    """
+    Class to test the write_snapshot function and Snapshot class
+    """
+
+    def test_round_trip(self, tmp_path):
+        """
+        Testing that a snapshot reads back the same playlist and metadata
+        """
+        path = get_snapshot_path(tmp_path, "PLtest")
+
+        write_snapshot(path, make_playlist(), {"etag": "abc"})
+
+        with Snapshot(path) as snapshot:
+            playlist = snapshot.playlist
+
+            assert list(playlist.iter_video_ids()) == [f"v{n}" for n in range(5)]
+            assert list(playlist.positions) == [0, 1, 2, 3, 4]
+            assert list(playlist.durations) == [0, 10, 20, 30, 40]
+            assert playlist.playlist_id == "PLtest"
+            assert playlist.total_results == 6
+            assert snapshot.metadata["etag"] == "abc"
+            assert snapshot.fetched_at > 0
+
+    def test_view_written(self, tmp_path):
+        """
+        Testing that a slice of a playlist is saved on its own
+        """
+        path = get_snapshot_path(tmp_path, "PLtest")
+
+        write_snapshot(path, make_playlist()[3:])
+
+        with Snapshot(path) as snapshot:
+            assert list(snapshot.playlist.iter_video_ids()) == ["v3", "v4"]
+            assert list(snapshot.playlist.durations) == [30, 40]
+
+    def test_columns_are_read_only(self, tmp_path):
+        """
+        Testing that the mapped columns can't be written to
+        """
+        path = get_snapshot_path(tmp_path, "PLtest")
+
+        write_snapshot(path, make_playlist())
+
+        with Snapshot(path) as snapshot:
+            with pytest.raises(TypeError):
+                snapshot.playlist.durations[0] = 1
+
+    def test_not_a_snapshot(self, tmp_path):
+        """
+        Testing that other files are refused
+        """
+        path = tmp_path / "other.ytsnap"
+        path.write_bytes(b"not a snapshot at all, but long enough for a header")
+
+        with pytest.raises(Exception) as excinfo:
+            Snapshot(path)
+
+        assert "not a playlist snapshot" in str(excinfo.value)
+
+    def test_truncated(self, tmp_path):
+        """
+        Testing that a cut off snapshot is refused
+        """
+        path = get_snapshot_path(tmp_path, "PLtest")
+
+        write_snapshot(path, make_playlist(100))
+
+        with open(path, "r+b") as snapshot_file:
+            snapshot_file.truncate(200)
+
+        with pytest.raises(Exception) as excinfo:
+            Snapshot(path)
+
+        assert "truncated" in str(excinfo.value)
+
+
+class TestAnalyseSnapshots:
+    """
+    Class to test the analyse_snapshots function
+    """
+
+    def test_stats_of_each_snapshot(self, tmp_path):
+        """
+        Testing that each saved playlist is analysed, counting the videos
+        saved as a live run does rather than totalResults, and unreadable
+        files are reported without stopping the others
+        """
+        write_snapshot(get_snapshot_path(tmp_path, "a"), make_playlist(5, "a"))
+        write_snapshot(get_snapshot_path(tmp_path, "b"), make_playlist(2, "b"))
+        (tmp_path / "c.ytsnap").write_bytes(b"")
+        (tmp_path / "notes.txt").write_text("skipped")
+
+        result = list(analyse_snapshots(iter_snapshot_paths(tmp_path), 1))
+
+        assert [stats.playlist_id for stats in result[:2]] == ["a", "b"]
+        assert result[0].video_count == 5
+        assert result[0].videos_left == 4
+        assert result[0].runtime == 100
+        assert result[0].durations.max == 40
+        assert result[1].runtime == 10
+        assert result[2].error is not None
+        assert len(result) == 3
@@ -0,0 +1,149 @@
+import random
+import pytest
+from src.playlist import Playlist
+from src.stats import DurationStats
+
+
+class TestDurationStats:
+    """
+    Class to test the DurationStats class
+    """
+
+    def test_exact_aggregates(self):
+        """
+        Testing that the count, total, mean, shortest and longest are exact
+        """
+        stats = DurationStats()
+        stats.update([30, 600, 7200, 45])
+
+        assert stats.count == 4
+        assert stats.total == 7875
+        assert stats.mean == 7875 / 4
+        assert stats.min == 30
+        assert stats.max == 7200
+
+    def test_empty(self):
+        """
+        Testing that stats with no durations have no mean or quantiles
+        """
+        stats = DurationStats()
+
+        assert stats.count == 0
+        assert stats.mean is None
+        assert stats.median is None
+        assert stats.min is None
+        assert stats.max is None
+
+    def test_quantiles_within_relative_accuracy(self):
+        """
+        Testing that the median and percentiles are within the relative
+        accuracy of the true ones
+        """
+        rng = random.Random(0)
+        durations = [rng.randint(1, 20_000) for _ in range(10_000)]
+
+        stats = DurationStats()
+        stats.update(durations)
+
+        ordered = sorted(durations)
+
+        for q in (0.5, 0.9, 0.99):
+            expected = ordered[int(q * (len(ordered) - 1))]
+
+            assert abs(stats.quantile(q) - expected) <= 0.01 * expected
+
+    def test_median_not_skewed_by_long_videos(self):
+        """
+        Testing that a few multi hour streams move the mean but not the median
+        """
+        stats = DurationStats()
+        stats.update([300] * 20 + [36_000] * 2)
+
+        assert stats.mean > 3000
+        assert stats.median == pytest.approx(300, rel=0.01)
+        assert stats.quantile(0.99) == pytest.approx(36_000, rel=0.01)
+
+    def test_zero_durations(self):
+        """
+        Testing that durations of 0 seconds are counted and estimated exactly
+        """
+        stats = DurationStats()
+        stats.update([0, 0, 0, 10])
+
+        assert stats.median == 0
+        assert stats.min == 0
+        assert stats.quantile(1) == 10
+
+    def test_memory_bounded(self):
+        """
+        Testing that the sketch never has more than max_buckets buckets, and
+        that merging away the shortest buckets keeps the long ones accurate
+        """
+        stats = DurationStats(max_buckets=50)
+        stats.update(range(1, 100_000))
+
+        assert stats.nbuckets <= 50
+        assert stats.quantile(0.99) == pytest.approx(99_000, rel=0.01)
+
+    def test_histogram(self):
+        """
+        Testing that the durations are counted in each bucket
+        """
+        stats = DurationStats()
+        stats.update([30, 60, 61, 4000, 20_000])
+
+        histogram = dict(stats.histogram())
+
+        assert histogram[60] == 2
+        assert histogram[300] == 1
+        assert histogram[7200] == 1
+        assert histogram[None] == 1
+        assert sum(histogram.values()) == 5
+
+    def test_merge(self):
+        """
+        Testing that merged stats are the same as stats of every duration
+        """
+        first = DurationStats()
+        first.update(range(1, 500))
+        second = DurationStats()
+        second.update(range(500, 1000))
+
+        expected = DurationStats()
+        expected.update(range(1, 1000))
+
+        first.merge(second)
+
+        assert first.to_dict() == expected.to_dict()
+
+    def test_negative_duration(self):
+        """
+        Testing that a negative duration raises an error
+        """
+        with pytest.raises(Exception) as excinfo:
+            DurationStats().add(-1)
+
+        assert "negative" in str(excinfo.value)
+
+    def test_invalid_quantile(self):
+        """
+        Testing that a quantile outside 0 to 1 raises an error
+        """
+        with pytest.raises(Exception):
+            DurationStats().quantile(1.5)
+
+    def test_from_playlist(self):
+        """
+        Testing that the stats of a playlist leave out videos without a
+        duration
+        """
+        playlist = Playlist.from_items(
+            [{"contentDetails": {"videoId": f"v{n}"}} for n in range(4)]
+        )
+        playlist.set_durations({"v0": 10, "v1": 20, "v3": 30})
+
+        result = DurationStats.from_playlist(playlist[1:])
+
+        assert result.count == 2
+        assert result.total == 50
+        assert result.mean == 25
@@ -0,0 +1,150 @@
+import gzip
+import json
+import zlib
+import socket
+import pytest
+from benchmarks.fake_youtube import make_fake_server, make_fake_youtube
+from src.metrics import get_metrics
+from src.utils import get_video_durations
+from src.transport import PooledHttp, decode_content, get_http_transport
+
+
+class TestGetHttpTransport:
+    """
+    Class to test the get_http_transport function
+    """
+
+    def test_urllib3_by_default(self, monkeypatch):
+        """
+        Testing that urllib3 is used when HTTP_TRANSPORT isn't set
+        """
+        monkeypatch.delenv("HTTP_TRANSPORT", raising=False)
+
+        assert get_http_transport() == "urllib3"
+
+    def test_value_read_from_env(self, monkeypatch):
+        """
+        Testing that HTTP_TRANSPORT can switch back to httplib2
+        """
+        monkeypatch.setenv("HTTP_TRANSPORT", "httplib2")
+
+        assert get_http_transport() == "httplib2"
+
+    def test_invalid_value_raises_exception(self, monkeypatch):
+        """
+        Testing that an unknown transport is rejected
+        """
+        monkeypatch.setenv("HTTP_TRANSPORT", "curl")
+
+        with pytest.raises(Exception) as excinfo:
+            get_http_transport()
+
+        assert "HTTP_TRANSPORT must be one of" in str(excinfo.value)
+
+
+class TestDecodeContent:
+    """
+    Class to test the decode_content function
+    """
+
+    def test_gzip(self):
+        """
+        Testing that gzipped bodies are decompressed
+        """
+        assert decode_content(gzip.compress(b"body"), "gzip") == b"body"
+
+    def test_deflate(self):
+        """
+        Testing that deflated bodies are decompressed, with or without a zlib
+        header
+        """
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw_body = raw.compress(b"body") + raw.flush()
+
+        assert decode_content(zlib.compress(b"body"), "deflate") == b"body"
+        assert decode_content(raw_body, "deflate") == b"body"
+
+    def test_uncompressed(self):
+        """
+        Testing that bodies without an encoding are returned as they are
+        """
+        assert decode_content(b"body", None) == b"body"
+
+
+class TestPooledHttp:
+    """
+    Class to test the PooledHttp class
+    """
+
+    def test_gzip_decoded_and_counted(self):
+        """
+        Testing that gzipped replies are decompressed, and the bytes received
+        are counted before decompression
+        """
+        fake = make_fake_server(100, gzip=True)
+        http = PooledHttp(pool_size=2)
+
+        with fake:
+            response, content = http.request(
+                f"{fake.url}/videos?part=contentDetails&id=v1"
+            )
+
+        totals = get_metrics().summary()["api_wire_bytes_total"]
+
+        assert response.status == 200
+        assert response["-content-encoding"] == "gzip"
+        assert b'"PT1S"' in content
+        assert totals == [
+            {"labels": {"method": "videos.list"}, "value": fake.bytes_sent}
+        ]
+        assert fake.bytes_sent < len(content)
+
+    def test_not_modified_returned(self):
+        """
+        Testing that a 304 reply is returned rather than followed or raised,
+        so stored pages can be reused
+        """
+        fake = make_fake_server(1)
+        http = PooledHttp()
+        url = f"{fake.url}/playlistItems?playlistId=playlist-id&part=contentDetails"
+
+        with fake:
+            _, content = http.request(url)
+            response, content = http.request(
+                url, headers={"If-None-Match": json.loads(content)["etag"]}
+            )
+
+        assert response.status == 304
+        assert content == b""
+
+    def test_connection_error(self):
+        """
+        Testing that a failed connection raises a ConnectionError, which the
+        scheduler retries
+        """
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+
+        with pytest.raises(ConnectionError):
+            PooledHttp(connect_timeout=1).request(f"http://127.0.0.1:{port}/videos")
+
+    def test_connections_shared_between_threads(self):
+        """
+        Testing that api calls from many threads reuse a few pooled
+        connections, with every reply gzipped
+        """
+        fake, youtube = make_fake_youtube(100, gzip=True)
+        video_ids = [f"v{n}" for n in range(100)]
+
+        with fake:
+            for _ in range(5):
+                result = get_video_durations(video_ids, youtube, max_concurrency=2)
+
+        metrics = get_metrics()
+
+        assert result == [f"PT{n}S" for n in range(100)]
+        assert len(fake.connections) <= 2 < len(fake.requests)
+        assert metrics.get_total("api_wire_bytes_total") < metrics.get_total(
+            "api_response_bytes_total"
+        )
@@ -2,13 +2,40 @@ import pytest
 import datetime
 from unittest.mock import Mock, patch
 from googleapiclient.errors import HttpError
+from benchmarks.fake_youtube import make_fake_youtube
+from src.playlist import Playlist
+from src.stats import DurationStats
+from src.scheduler import RequestScheduler, set_scheduler
 from src.utils import (
+    CHANNEL_PLAYLIST_FIELDS,
+    PLAYLIST_ITEM_FIELDS,
+    VIDEO_FIELDS,
     get_api_key,
+    get_api_keys,
+    get_max_concurrency,
+    get_http_batch_size,
+    get_youtube_client,
+    get_playlist_id,
+    get_playlist_stats,
+    PlaylistStats,
     extract_playlist_id,
     get_playlist,
+    get_playlist_pages,
     get_videos,
+    chunk_video_ids,
+    get_batch_durations,
+    get_video_durations,
+    parse_duration,
+    parse_durations,
     convert_times,
+    get_playlist_runtime,
+    get_playlist_page_params,
+    get_duration_index,
+    load_playlist,
     get_average_video_runtime,
+    get_duration_stats,
+    get_channel_id,
+    iter_channel_playlist_ids,
     no_videos_watched,
     has_watched_videos,
 )
@@ -51,6 +78,131 @@ class TestGetApiKey:
         assert "No api key found" in str(excinfo.value)
 
 
+class TestGetApiKeys:
+    """
+    Class to test the get_api_keys function
+    """
+
+    def test_keys_split_on_commas(self, monkeypatch):
+        """
+        Testing that API_KEYS is split into distinct keys
+        """
+        monkeypatch.setenv("API_KEYS", "key-a, key-b,,key-a")
+
+        assert get_api_keys() == ["key-a", "key-b"]
+
+    def test_falls_back_to_api_key(self, monkeypatch):
+        """
+        Testing that API_KEY is used when API_KEYS isn't set
+        """
+        monkeypatch.delenv("API_KEYS", raising=False)
+        monkeypatch.setenv("API_KEY", "test-value")
+
+        assert get_api_keys() == ["test-value"]
+
+    def test_first_key_used_as_api_key(self, monkeypatch):
+        """
+        Testing that get_api_key uses the first of API_KEYS without API_KEY
+        """
+        monkeypatch.delenv("API_KEY", raising=False)
+        monkeypatch.setenv("API_KEYS", "key-a,key-b")
+
+        assert get_api_key() == "key-a"
+
+
+class TestGetMaxConcurrency:
+    """
+    Class to test the get_max_concurrency function
+    """
+
+    def test_default_returned_when_unset(self, monkeypatch):
+        """
+        Testing that get_max_concurrency falls back to the default
+        """
+        monkeypatch.delenv("MAX_CONCURRENCY", raising=False)
+
+        assert get_max_concurrency() == 8
+
+    def test_value_read_from_env(self, monkeypatch):
+        """
+        Testing that get_max_concurrency reads MAX_CONCURRENCY
+        """
+        monkeypatch.setenv("MAX_CONCURRENCY", "3")
+
+        assert get_max_concurrency() == 3
+
+    def test_invalid_value_raises_exception(self, monkeypatch):
+        """
+        Testing that get_max_concurrency rejects values that aren't positive
+        """
+        monkeypatch.setenv("MAX_CONCURRENCY", "0")
+
+        with pytest.raises(Exception) as excinfo:
+            get_max_concurrency()
+
+        assert "MAX_CONCURRENCY must be a positive number" in str(excinfo.value)
+
+
+class TestGetHttpBatchSize:
+    """
+    Class to test the get_http_batch_size function
+    """
+
+    def test_off_when_unset(self, monkeypatch):
+        """
+        Testing that batching is off by default
+        """
+        monkeypatch.delenv("HTTP_BATCH_SIZE", raising=False)
+
+        assert get_http_batch_size() == 0
+
+    def test_value_read_from_env(self, monkeypatch):
+        """
+        Testing that get_http_batch_size reads HTTP_BATCH_SIZE, up to the
+        most requests a batch can carry
+        """
+        monkeypatch.setenv("HTTP_BATCH_SIZE", "20")
+
+        assert get_http_batch_size() == 20
+
+        monkeypatch.setenv("HTTP_BATCH_SIZE", "5000")
+
+        assert get_http_batch_size() == 1000
+
+
+class TestGetYoutubeClient:
+    """
+    Class to test the get_youtube_client function
+    """
+
+    def test_client_reused_per_key(self):
+        """
+        Testing that the same client is returned every time for a key
+        """
+        client1 = get_youtube_client("key-1")
+        client2 = get_youtube_client("key-1")
+        client3 = get_youtube_client("key-2")
+
+        assert client1 is client2
+        assert client1 is not client3
+
+    def test_bundled_discovery_document_used(self):
+        """
+        Testing that the client is built from the bundled discovery document
+        rather than one downloaded at startup
+        """
+        with patch("googleapiclient.discovery.build") as mock_build:
+            get_youtube_client("key-3")
+
+        mock_build.assert_called_once_with(
+            "youtube",
+            "v3",
+            developerKey="key-3",
+            static_discovery=True,
+            cache_discovery=False,
+        )
+
+
 class TestExtractPlaylistID:
     """
     Class to test the extract_playlist_id function
@@ -135,6 +287,56 @@ class TestExtractPlaylistID:
         assert result2 == "playlist-id"
 
 
+class TestGetPlaylistId:
+    """
+    Class to test the get_playlist_id function
+    """
+
+    def test_bare_id_returned(self):
+        """
+        Testing that a bare playlist id is returned as it is
+        """
+        assert get_playlist_id("PLabc-123_x") == "PLabc-123_x"
+
+    def test_id_extracted_from_url(self):
+        """
+        Testing that the id is extracted from a playlist url
+        """
+        assert get_playlist_id("https://youtube.com/list=PLabc&index=2") == "PLabc"
+
+
+class TestGetPlaylistPageParams:
+    """
+    Class to test the get_playlist_page_params function
+    """
+
+    def test_masked_by_default(self):
+        """
+        Testing that only the video ids are requested by default
+        """
+        result = get_playlist_page_params("playlist-id", "a")
+
+        assert result == {
+            "part": "contentDetails",
+            "fields": PLAYLIST_ITEM_FIELDS,
+            "playlistId": "playlist-id",
+            "maxResults": 50,
+            "pageToken": "a",
+        }
+
+    def test_rich_metadata(self):
+        """
+        Testing that every field is requested with rich_metadata
+        """
+        result = get_playlist_page_params("playlist-id", rich_metadata=True)
+
+        assert result == {
+            "part": "snippet,contentDetails",
+            "playlistId": "playlist-id",
+            "maxResults": 50,
+        }
+
+
 class TestGetPlaylist:
     """
     Class to test the get_playlist function
@@ -176,6 +378,192 @@ class TestGetPlaylist:
 
         assert result == expected
 
+    def test_all_pages_followed(self):
+        """
+        Testing that get_playlist follows nextPageToken and returns the items
+        from every page
+        """
+        url = "https://youtube.com/list=playlist-id"
+
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems().list.return_value
+
+        mock_request.execute.side_effect = [
+            {"pageInfo": {"totalResults": 3}, "nextPageToken": "a", "items": [1, 2]},
+            {"pageInfo": {"totalResults": 3}, "items": [3]},
+        ]
+
+        result = get_playlist(url, mock_youtube)
+
+        assert result == {"pageInfo": {"totalResults": 3}, "items": [1, 2, 3]}
+
+        mock_youtube.playlistItems().list.assert_called_with(
+            part="contentDetails",
+            fields=PLAYLIST_ITEM_FIELDS,
+            playlistId="playlist-id",
+            maxResults=50,
+            pageToken="a",
+        )
+
+
+class TestGetChannelId:
+    """
+    Class to test the get_channel_id function
+    """
+
+    channel_id = "UC" + "a" * 22
+
+    def test_ids_and_urls(self):
+        """
+        Testing that channel ids are taken from bare ids and channel urls
+        without the api
+        """
+        mock_youtube = Mock()
+
+        assert get_channel_id(self.channel_id, mock_youtube) == self.channel_id
+        assert (
+            get_channel_id(
+                f"https://www.youtube.com/channel/{self.channel_id}/playlists",
+                mock_youtube,
+            )
+            == self.channel_id
+        )
+
+        mock_youtube.channels.assert_not_called()
+
+    def test_handle_looked_up(self):
+        """
+        Testing that a handle, bare or in a url, is looked up with the api
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.channels.return_value.list.return_value
+        mock_request.execute.return_value = {"items": [{"id": self.channel_id}]}
+
+        assert get_channel_id("@name", mock_youtube) == self.channel_id
+        assert get_channel_id("youtube.com/@name", mock_youtube) == self.channel_id
+
+        mock_youtube.channels.return_value.list.assert_called_with(
+            part="id", forHandle="@name", fields="items(id)"
+        )
+
+    def test_unknown_handle(self):
+        """
+        Testing that a handle without a channel raises an error
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.channels.return_value.list.return_value
+        mock_request.execute.return_value = {}
+
+        with pytest.raises(Exception) as excinfo:
+            get_channel_id("@nobody", mock_youtube)
+
+        assert "Channel not found" in str(excinfo.value)
+
+    def test_invalid_channels(self):
+        """
+        Testing that other urls and strings raise an error
+        """
+        with pytest.raises(Exception) as excinfo:
+            get_channel_id("https://youtube.com/watch?v=abc", Mock())
+
+        assert "URL not a channel" in str(excinfo.value)
+
+        with pytest.raises(Exception) as excinfo:
+            get_channel_id("name", Mock())
+
+        assert "Invalid channel" in str(excinfo.value)
+
+
+class TestIterChannelPlaylistIds:
+    """
+    Class to test the iter_channel_playlist_ids function
+    """
+
+    def test_every_page_followed(self):
+        """
+        Testing that the playlists of every page are listed
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlists.return_value.list.return_value
+        mock_request.execute.side_effect = [
+            {"items": [{"id": "PL1"}, {"id": "PL2"}], "nextPageToken": "next"},
+            {"items": [{"id": "PL3"}]},
+        ]
+
+        result = list(iter_channel_playlist_ids("UCx", mock_youtube))
+
+        assert result == ["PL1", "PL2", "PL3"]
+
+        mock_youtube.playlists.return_value.list.assert_called_with(
+            part="id",
+            channelId="UCx",
+            maxResults=50,
+            fields=CHANNEL_PLAYLIST_FIELDS,
+            pageToken="next",
+        )
+
+    def test_HTTP_error_raised(self):
+        """
+        Testing that a HTTP error listing the playlists raises the correct
+        error
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlists.return_value.list.return_value
+        mock_request.execute.side_effect = HttpError(
+            resp=Mock(status=404), content=b"Test"
+        )
+
+        with pytest.raises(Exception) as excinfo:
+            list(iter_channel_playlist_ids("UCx", mock_youtube))
+
+        assert "Error getting channel playlists" in str(excinfo.value)
+
+
+class TestGetPlaylistPages:
+    """
+    Class to test the get_playlist_pages function
+    """
+
+    def test_pages_yielded_in_order(self):
+        """
+        Testing that get_playlist_pages yields every page in order
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems().list.return_value
+
+        pages = [
+            {"nextPageToken": "a", "items": [1]},
+            {"nextPageToken": "b", "items": [2]},
+            {"items": [3]},
+        ]
+
+        mock_request.execute.side_effect = pages
+
+        result = list(get_playlist_pages("playlist-id", mock_youtube))
+
+        assert result == pages
+
+    def test_HTTP_error_on_later_page_raised(self):
+        """
+        Testing that a HTTP error on a prefetched page raises the correct error
+        """
+        mock_youtube = Mock()
+        mock_request = mock_youtube.playlistItems().list.return_value
+
+        mock_request.execute.side_effect = [
+            {"nextPageToken": "a", "items": [1]},
+            HttpError(resp=Mock(status=404), content=b"Test"),
+        ]
+
+        pages = get_playlist_pages("playlist-id", mock_youtube)
+
+        assert next(pages) == {"nextPageToken": "a", "items": [1]}
+
+        with pytest.raises(Exception) as excinfo:
+            next(pages)
+
+        assert "Error getting playlist" in str(excinfo.value)
+
 
 class TestGetVideos:
     """
@@ -194,10 +582,226 @@ class TestGetVideos:
 
         result = get_videos(video_ids, mock_youtube)
 
-        mock_videos.list.assert_called_once_with(part="contentDetails", id=video_ids)
+        mock_videos.list.assert_called_once_with(
+            part="contentDetails", id=video_ids, fields=VIDEO_FIELDS
+        )
 
         assert result == mock_list
 
+    def test_rich_metadata_requested(self):
+        """
+        Testing that with rich_metadata the snippet is requested without a
+        field mask
+        """
+        mock_youtube = Mock()
+        video_ids = ["id1", "id2"]
+
+        get_videos(video_ids, mock_youtube, rich_metadata=True)
+
+        mock_youtube.videos().list.assert_called_with(
+            part="snippet,contentDetails", id=video_ids
+        )
+
+
+class TestChunkVideoIds:
+    """
+    Class to test the chunk_video_ids function
+    """
+
+    def test_ids_split_into_chunks(self):
+        """
+        Testing that chunk_video_ids splits ids into chunks of the given size
+        """
+        result = list(chunk_video_ids(iter(range(7)), 3))
+
+        assert result == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_default_chunk_size_is_50(self):
+        """
+        Testing that chunk_video_ids uses the videos().list id limit by default
+        """
+        result = list(chunk_video_ids(range(120)))
+
+        assert [len(chunk) for chunk in result] == [50, 50, 20]
+
+
+def make_mock_videos_api():
+    """
+    Builds a mock YouTube api whose videos().list echoes back a duration of
+    PT<n>S for every requested id "v<n>"
+    """
+    mock_youtube = Mock()
+
+    def mock_list(part, id, fields=None):
+        request = Mock()
+        request.execute.return_value = {
+            "items": [
+                {"id": video_id, "contentDetails": {"duration": f"PT{video_id[1:]}S"}}
+                for video_id in id
+            ]
+        }
+        return request
+
+    mock_youtube.videos.return_value.list.side_effect = mock_list
+
+    return mock_youtube
+
+
+class TestGetVideoDurations:
+    """
+    Class to test the get_video_durations function
+    """
+
+    def test_ids_requested_in_chunks_of_50(self):
+        """
+        Testing that no request is sent with more than 50 ids
+        """
+        mock_youtube = make_mock_videos_api()
+
+        video_ids = [f"v{n}" for n in range(120)]
+
+        get_video_durations(video_ids, mock_youtube, max_concurrency=4)
+
+        calls = mock_youtube.videos.return_value.list.call_args_list
+
+        assert sorted(len(call.kwargs["id"]) for call in calls) == [20, 50, 50]
+
+    def test_durations_keep_playlist_order(self):
+        """
+        Testing that durations come back in the order of the ids given, and
+        that videos missing from the response are left out
+        """
+        mock_youtube = make_mock_videos_api()
+        video_ids = [f"v{n}" for n in range(120, 0, -1)]
+
+        result = get_video_durations(video_ids, mock_youtube, max_concurrency=3)
+
+        assert result == [f"PT{n}S" for n in range(120, 0, -1)]
+
+
+def make_retrying_youtube(video_count=120, error_rate=0):
+    """
+    Builds a fake YouTube api and a client that talks to it, whose failed
+    requests are retried with almost no delay
+    """
+    fake, youtube = make_fake_youtube(video_count, error_rate=error_rate)
+
+    set_scheduler(RequestScheduler(base_delay=0.001), youtube)
+
+    return fake, youtube
+
+
+class TestGetBatchDurations:
+    """
+    Class to test the get_batch_durations function
+    """
+
+    def test_chunks_sent_in_batches(self, monkeypatch):
+        """
+        Testing that with HTTP_BATCH_SIZE set the chunks are sent together in
+        batch requests
+        """
+        monkeypatch.setenv("HTTP_BATCH_SIZE", "2")
+        fake, youtube = make_retrying_youtube(video_count=160)
+        video_ids = [f"v{n}" for n in range(160)]
+
+        with fake:
+            result = get_video_durations(video_ids, youtube, max_concurrency=1)
+
+        assert result == [f"PT{n}S" for n in range(160)]
+        assert [resource for resource, _ in fake.requests] == [
+            "batch",
+            "videos",
+            "videos",
+            "batch",
+            "videos",
+            "videos",
+        ]
+
+    def test_failed_requests_retried_alone(self):
+        """
+        Testing that the chunks whose requests failed in a batch are requested
+        again by themselves, and the others aren't
+        """
+        fake, youtube = make_retrying_youtube(video_count=250, error_rate=0.4)
+        chunks = list(chunk_video_ids([f"v{n}" for n in range(250)]))
+
+        with fake:
+            result = get_batch_durations(chunks, youtube)
+
+        assert result == {f"v{n}": f"PT{n}S" for n in range(250)}
+
+        batched, alone = fake.requests[1:6], fake.requests[6:]
+        failed_ids = [params["id"] for _, params in alone]
+
+        assert fake.requests[0] == ("batch", {"requests": 5})
+        assert failed_ids
+        assert set(failed_ids) <= {params["id"] for _, params in batched}
+
+    def test_error_raised_for_failed_request(self):
+        """
+        Testing that a request in a batch that fails again by itself raises an
+        error, while the rest of the batch succeeds
+        """
+        fake, youtube = make_retrying_youtube()
+        too_many_ids = [f"v{n}" for n in range(51)]
+
+        with fake:
+            with pytest.raises(Exception) as excinfo:
+                get_batch_durations([["v1", "v2"], too_many_ids], youtube)
+
+        assert str(excinfo.value) == "Error getting videos"
+        assert [params["id"] for _, params in fake.requests[1:]] == [
+            "v1,v2",
+            ",".join(too_many_ids),
+            ",".join(too_many_ids),
+        ]
+
+
+class TestParseDuration:
+    """
+    Class to test the parse_duration function
+    """
+
+    def test_days_and_weeks_converted(self):
+        """
+        Testing that durations with day and week components are converted
+        """
+        assert parse_duration("P1DT2H") == 93600
+        assert parse_duration("P1W2DT3M4S") == 777784
+
+    def test_live_durations_are_zero(self):
+        """
+        Testing that the P0D duration of live and upcoming videos is 0
+        """
+        assert parse_duration("P0D") == 0
+
+    def test_invalid_duration_raises_exception(self):
+        """
+        Testing that a string that isn't a duration raises the expected error
+        """
+        with pytest.raises(Exception) as excinfo:
+            parse_duration("1H2M")
+
+        assert "Invalid duration: 1H2M" in str(excinfo.value)
+
+
+class TestParseDurations:
+    """
+    Class to test the parse_durations function
+    """
+
+    def test_durations_converted_in_order(self):
+        """
+        Testing that parse_durations converts every duration, including
+        repeated ones, in order
+        """
+        times = ["PT1S", "P1D", "PT1S", "P0D", "PT1H1M1S"]
+
+        result = parse_durations(times)
+
+        assert list(result) == [1, 86400, 1, 0, 3661]
+
 
 class TestConvertTimes:
     """
@@ -247,7 +851,194 @@ class TestGetPlaylistRuntime:
         """
         Testing that the get_playlist_runtime function returns an int
         """
-        pass
+        mock_youtube = make_mock_videos_api()
+        playlist = {"items": [{"snippet": {"resourceId": {"videoId": "v5"}}}]}
+
+        result = get_playlist_runtime(playlist, mock_youtube)
+
+        assert isinstance(result, int)
+
+    def test_get_playlist_runtime_sums_all_chunks(self):
+        """
+        Testing that the runtime of playlists over 50 videos is summed across
+        every chunk
+        """
+        mock_youtube = make_mock_videos_api()
+        playlist = {
+            "items": [
+                {"snippet": {"resourceId": {"videoId": f"v{n}"}}} for n in range(120)
+            ]
+        }
+
+        result = get_playlist_runtime(playlist, mock_youtube, max_concurrency=2)
+
+        assert result == sum(range(120))
+
+
+class TestLoadPlaylist:
+    """
+    Class to test the load_playlist function
+    """
+
+    def test_pages_loaded_into_playlist(self):
+        """
+        Testing that the items of every page are loaded into a Playlist
+        """
+        mock_youtube = Mock()
+        mock_youtube.playlistItems().list().execute.side_effect = [
+            {
+                "pageInfo": {"totalResults": 3},
+                "items": [{"snippet": {"resourceId": {"videoId": "v1"}}}] * 2,
+                "nextPageToken": "page2",
+            },
+            {"items": [{"snippet": {"resourceId": {"videoId": "v2"}}}]},
+        ]
+
+        result = load_playlist("https://youtube.com/list=test_id", mock_youtube)
+
+        assert list(result.iter_video_ids()) == ["v1", "v1", "v2"]
+        assert result.playlist_id == "test_id"
+        assert result.total_results == 3
+
+
+class TestGetDurationStats:
+    """
+    Class to test the get_duration_stats function
+    """
+
+    def test_durations_streamed_page_by_page(self):
+        """
+        Testing that each page's durations are looked up as it arrives, and
+        that the videos watched are skipped
+        """
+        mock_youtube = make_mock_videos_api()
+        mock_youtube.playlistItems().list().execute.side_effect = [
+            {
+                "pageInfo": {"totalResults": 4},
+                "items": [{"contentDetails": {"videoId": "v1"}}] * 2,
+                "nextPageToken": "page2",
+            },
+            {
+                "items": [
+                    {"contentDetails": {"videoId": "v30"}},
+                    {"contentDetails": {"videoId": "v0"}},
+                ]
+            },
+        ]
+
+        result = get_duration_stats("test_id", mock_youtube, videos_watched=1)
+
+        assert result.count == 2
+        assert result.total == 31
+        assert result.max == 30
+        assert mock_youtube.videos().list.call_count == 2
+
+    def test_playlists_added_to_stats(self):
+        """
+        Testing that the durations of another playlist are added to the
+        stats given
+        """
+        mock_youtube = make_mock_videos_api()
+        mock_youtube.playlistItems().list().execute.return_value = {
+            "items": [{"contentDetails": {"videoId": "v5"}}]
+        }
+
+        stats = DurationStats()
+        stats.add(10)
+
+        result = get_duration_stats("test_id", mock_youtube, stats=stats)
+
+        assert result is stats
+        assert result.total == 15
+
+
+class TestGetDurationIndex:
+    """
+    Class to test the get_duration_index function
+    """
+
+    def test_index_of_every_video(self):
+        """
+        Testing that the durations of every video are looked up and indexed
+        """
+        mock_youtube = make_mock_videos_api()
+        playlist = Playlist.from_items(
+            [{"snippet": {"resourceId": {"videoId": f"v{n}"}}} for n in range(120)]
+        )
+
+        result = get_duration_index(playlist, mock_youtube, max_concurrency=2)
+
+        assert len(result) == 120
+        assert result.runtime == sum(range(120))
+        assert result.time_left(100) == sum(range(100, 120))
+
+
+class TestGetPlaylistStats:
+    """
+    Class to test the get_playlist_stats function
+    """
+
+    def test_stats_of_videos_left(self):
+        """
+        Testing that the stats only count the videos after the ones watched
+        """
+        mock_youtube = make_mock_videos_api()
+        playlist = {
+            "items": [
+                {"snippet": {"resourceId": {"videoId": f"v{n}"}}} for n in range(1, 5)
+            ]
+        }
+
+        result = get_playlist_stats(playlist, mock_youtube, 1, playlist_id="a")
+
+        assert result == PlaylistStats(
+            "a", video_count=4, videos_watched=1, videos_left=3, runtime=9
+        )
+        assert result.average_runtime == 3
+
+    def test_stats_of_playlist_from_duration_index(self):
+        """
+        Testing that a Playlist is analysed from the running total of its
+        durations, which can be reused without any more requests
+        """
+        mock_youtube = make_mock_videos_api()
+        playlist = Playlist.from_items(
+            [{"snippet": {"resourceId": {"videoId": f"v{n}"}}} for n in range(1, 5)],
+            "a",
+        )
+
+        result = get_playlist_stats(playlist, mock_youtube, 2)
+
+        assert result == PlaylistStats(
+            "a", video_count=4, videos_watched=2, videos_left=2, runtime=7
+        )
+        assert list(playlist.durations) == [1, 2, 3, 4]
+        assert result.durations.count == 2
+        assert result.durations.max == 4
+
+        duration_index = playlist.duration_index()
+        mock_youtube.reset_mock()
+
+        result = get_playlist_stats(
+            playlist, mock_youtube, 1, duration_index=duration_index
+        )
+
+        mock_youtube.videos.assert_not_called()
+
+        assert result.runtime == 9
+        assert result.videos_left == 3
+
+    def test_known_runtime_not_requested(self):
+        """
+        Testing that no request is made when the runtime is already known
+        """
+        mock_youtube = Mock()
+
+        result = get_playlist_stats({"items": [1, 2]}, mock_youtube, 0, None, 50)
+
+        mock_youtube.videos.assert_not_called()
+
+        assert result.runtime == 50
 
 
 class TestGetAverageVideoRuntime:
@@ -304,7 +1095,8 @@ class TestNoVideosWatched:
         with patch(
             "src.utils.get_playlist_runtime", return_value=mock_playlist_runtime
         ), patch(
-            "src.utils.get_average_video_runtime", return_value=mock_average_runtime
+            "src.formatters.get_average_video_runtime",
+            return_value=mock_average_runtime,
         ):
 
             no_videos_watched(mock_playlist, playlist_length, mock_youtube)
@@ -339,7 +1131,8 @@ class TestHasWatchedVideos:
         with patch(
             "src.utils.get_playlist_runtime", return_value=mock_playlist_runtime
         ), patch(
-            "src.utils.get_average_video_runtime", return_value=mock_average_runtime
+            "src.formatters.get_average_video_runtime",
+            return_value=mock_average_runtime,
         ):
 
             has_watched_videos(